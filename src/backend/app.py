@@ -1,12 +1,18 @@
+from os import cpu_count, getenv, pathsep
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import field, fields
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Dict, Literal, Optional
-import uuid, asyncio
+from time import time
+from typing import Iterator, List, Literal, Optional, Tuple
+import uuid, asyncio, json, hashlib, zlib
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Request, status
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from starlette.requests import ClientDisconnect
 from streaming_form_data import StreamingFormDataParser
-from streaming_form_data.targets import FileTarget, ValueTarget
+from streaming_form_data.targets import ValueTarget
 from streaming_form_data.validators import (
     MaxSizeValidator,
     ValidationError as sfd_ValidationError,
@@ -14,33 +20,150 @@ from streaming_form_data.validators import (
 from pydantic.dataclasses import dataclass as py_dataclass
 
 # pylint: disable=import-error
-from whisper_interface import WhisperInterface
+from worker_pool import TranscriptionPool
+from chunking import SAMPLE_RATE, chunk_bounds, probe_duration, stitch_transcriptions
+from pcm_cache import PCMCache
+from transcription_cache import HashingFileTarget, TranscriptionCache
+from scheduler import TaskScheduler
+from task_store import TaskStore
+from upload_sessions import UploadError, UploadSessions
 
 # initially based on this article: https://medium.com/@fatikir15/decoding-speech-privately-a-journey-with-whisper-streamlit-and-fastapi-4ecba1650efb
 
 # https://stackoverflow.com/a/73443824
 MAX_FILE_SIZE = 1024 * 1024 * 1024 * 5  # = 5GB
 MAX_REQUEST_BODY_SIZE = MAX_FILE_SIZE + 1024
+# largest chunk a resumable upload may send at once, they are held in memory
+MAX_CHUNK_SIZE = 1024 * 1024 * 64  # = 64MB
+CACHE_DIR = Path(
+    getenv("TRANSCRIPTION_CACHE_DIR", Path.home() / ".cache" / "audio_wrangler")
+)
+# uploads are kept here until they are transcribed, so they survive a restart
+UPLOAD_DIR = CACHE_DIR / "uploads"
+# directories (separated by os.pathsep) the clients share with this server, files
+# in them can be queued by path through /transcribe-path instead of uploaded
+SHARED_ROOTS = [
+    Path(root).resolve()
+    for root in getenv("WHISPER_SHARED_ROOTS", "").split(pathsep)
+    if root
+]
+# finished tasks (and their results) are forgotten after this long
+TASK_RETENTION = float(getenv("TASK_RETENTION_DAYS", 7)) * 60 * 60 * 24
+PURGE_INTERVAL = 60 * 60
+EVENTS_KEEPALIVE = 15
+# results are compressed and sent in pieces of this many bytes
+RESULT_CHUNK_SIZE = 1024 * 64
+CACHE_MAX_SIZE = int(getenv("TRANSCRIPTION_CACHE_MAX_SIZE", 1024 * 1024 * 1024))  # = 1GB
+PCM_CACHE_MAX_SIZE = int(
+    getenv("PCM_CACHE_MAX_SIZE", 1024 * 1024 * 1024 * 4)
+)  # = 4GB
+DECODE_WORKERS = int(getenv("DECODE_WORKERS", 2))
+DEFAULT_MODEL = getenv("WHISPER_MODEL", "medium.en")
+# the models clients may ask for (comma separated), whisper.available_models() by
+# default. Anything else is refused, whisper would load a path as a checkpoint
+MODELS = {
+    *(
+        name.strip()
+        for name in getenv(
+            "WHISPER_MODELS",
+            "tiny.en,tiny,base.en,base,small.en,small,medium.en,medium,"
+            "large-v1,large-v2,large-v3,large",
+        ).split(",")
+        if name.strip()
+    ),
+    DEFAULT_MODEL,
+}
+# one of whisper_interface.ENGINES: torch, torch-int8 or faster-whisper
+ENGINE = getenv("WHISPER_ENGINE", "torch")
+# memory each worker process may use for loaded models
+MODEL_MEMORY_BUDGET = int(
+    getenv("WHISPER_MEMORY_BUDGET", 1024 * 1024 * 1024 * 4)
+)  # = 4GB
+DECODE_OPTIONS = {}
+WORKERS = int(getenv("WHISPER_WORKERS", 1))
+THREADS_PER_WORKER = int(
+    getenv("WHISPER_THREADS_PER_WORKER", max(1, (cpu_count() or 1) // WORKERS))
+)
+# long recordings are split at silences into pieces of about this length and
+# transcribed in parallel by the pool, 0 (the default) turns chunking off
+CHUNK_SECONDS = float(getenv("WHISPER_CHUNK_MINUTES", 0)) * 60
+# short uploads (a single whisper window) are transcribed together in batches of
+# up to this many, waiting at most BATCH_MAX_WAIT seconds to fill up a batch
+BATCH_MAX_SIZE = int(getenv("WHISPER_BATCH_SIZE", 8))
+BATCH_MAX_WAIT = float(getenv("WHISPER_BATCH_WAIT", 0.5))
+BATCH_MAX_SECONDS = 30
+# only transcribe what sounds like speech, skipping silences (and hallucinations)
+VAD = getenv("WHISPER_VAD", "").lower() in ("1", "true", "yes")
+# everything besides the audio and model that changes a result
+RESULT_OPTIONS = {"engine": ENGINE, **({"vad": True} if VAD else {}), **DECODE_OPTIONS}
+# a queued task waiting this many times longer than another one that is shorter
+# goes first, and every step of its Priority header moves it this many seconds
+SCHEDULER_AGING_RATE = float(getenv("SCHEDULER_AGING_RATE", 10))
+SCHEDULER_PRIORITY_STEP = float(getenv("SCHEDULER_PRIORITY_STEP", 300))
+MAX_PRIORITY = 10
+# used for files ffprobe can't read, about what a 128 kbit/s file takes
+BYTES_PER_SECOND_ESTIMATE = 16000
+# how many times a task is retried when its worker process crashes
+MAX_ATTEMPTS = 2
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    asyncio.create_task(whisper_worker())
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    await recover_tasks()
+    transcription_pool.start()
+    for _ in range(transcription_pool.workers):
+        asyncio.create_task(whisper_worker())
+    asyncio.create_task(purge_tasks())
 
     # start the app
     yield
 
-    for task in tasks.values():
-        if task.path.exists():
-            task.path.unlink()
+    # queued uploads are left in UPLOAD_DIR, and picked up again on the next start
+    transcription_pool.shutdown()
+    pcm_cache.shutdown()
+
+
+# segments decoded so far, for the tasks that are being transcribed right now
+live_segments: dict[str, List[dict]] = {}
+# set (and replaced) whenever a segment arrives or a task stops streaming
+segments_changed = asyncio.Event()
+
+
+def wake_segment_streams() -> None:
+    global segments_changed  # pylint: disable=global-statement
+    segments_changed.set()
+    segments_changed = asyncio.Event()
+
+
+def add_live_segment(task_id: str, segment: dict) -> None:
+    # late arrivals for a task that already finished are dropped
+    if task_id in live_segments:
+        live_segments[task_id].append(segment)
+        wake_segment_streams()
 
 
 app = FastAPI(lifespan=lifespan)
-wsp = WhisperInterface()
-## ChatGPT helped with the locking logic
-# Task queue and lock
-task_queue = asyncio.Queue()
-processing_lock = asyncio.Lock()
+transcription_pool = TranscriptionPool(
+    workers=WORKERS,
+    threads_per_worker=THREADS_PER_WORKER,
+    memory_budget=MODEL_MEMORY_BUDGET,
+    decode_options=DECODE_OPTIONS,
+    engine=ENGINE,
+    on_segment=add_live_segment,
+    vad=VAD,
+)
+transcription_cache = TranscriptionCache(CACHE_DIR, CACHE_MAX_SIZE)
+pcm_cache = PCMCache(CACHE_DIR / "pcm", PCM_CACHE_MAX_SIZE, DECODE_WORKERS)
+task_store = TaskStore(CACHE_DIR / "tasks.db")
+# kept apart from UPLOAD_DIR, which only holds uploads that are queued
+upload_sessions = UploadSessions(CACHE_DIR / "partial_uploads")
+# Task queue, shared by all of the workers
+task_queue = TaskScheduler(
+    aging_rate=SCHEDULER_AGING_RATE, priority_step=SCHEDULER_PRIORITY_STEP
+)
+# moving average of how long a second of audio takes to transcribe, for the ETAs
+seconds_per_audio_second = 1.0
 
 
 @py_dataclass
@@ -50,14 +173,208 @@ class Task:
         | Literal["processing"]
         | Literal["completed"]
         | Literal["failed"]
+        | Literal["cancelled"]
     )
     filename: str
     path: Path
+    model_name: str = DEFAULT_MODEL
+    # only set while a response is being built, results are kept in task_store
     transcription: dict[str, str | list] | None = None
-    error: Optional[str] = None
+    error: Optional[dict[str, str]] = None
+    cache_key: Optional[str] = None
+    content_hash: Optional[str] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time)
+    queued_at: float = field(default_factory=time)
+    updated_at: float = field(default_factory=time)
+    progress: float = 0.0
+    # read in place from SHARED_ROOTS, so it must never be deleted
+    shared: bool = False
+    # how much of the audio the VAD found no speech in
+    skipped_fraction: Optional[float] = None
+    # seconds of audio, probed when the task is queued
+    duration: Optional[float] = None
+    priority: int = 0
+    client_id: str = ""
+    # bumped on every change, so clients can ask for what changed since
+    version: int = 0
+
+    @property
+    def pcm_key(self) -> str:
+        """Decoded samples are shared by every task with the same content."""
+        return self.content_hash or self.path.name
+
+
+# kept in version order, so the latest changes are always at the end
+tasks: OrderedDict[str, Task] = OrderedDict()
+tasks_version = 0
+# set (and replaced) on every change, to wake up the /events streams
+tasks_changed = asyncio.Event()
+
+
+def touch_task(task_id: str) -> None:
+    global tasks_version, tasks_changed  # pylint: disable=global-statement
+    tasks_version += 1
+    current_task = tasks.get(task_id)
+    current_task.version = tasks_version
+    current_task.updated_at = time()
+    tasks.move_to_end(task_id)
+    tasks_changed.set()
+    tasks_changed = asyncio.Event()
 
 
-tasks: Dict[str, Task] = {}
+def changed_since(since: int) -> List[dict]:
+    """Summaries of the tasks changed after version ``since``, oldest change first."""
+    changed = []
+    # walk back from the latest change, so only changed tasks are looked at
+    for task_id in reversed(tasks):
+        current_task = tasks[task_id]
+        if current_task.version <= since:
+            break
+        changed.append(
+            {
+                "id": task_id,
+                "filename": current_task.filename,
+                "state": current_task.state,
+                "progress": current_task.progress,
+                "created_at": current_task.created_at,
+                "updated_at": current_task.updated_at,
+                "version": current_task.version,
+            }
+        )
+    changed.reverse()
+    return changed
+
+
+async def task_events(request: Request, since: int):
+    if since > tasks_version:
+        # the client saw a task store that has since been reset
+        since = 0
+    while not await request.is_disconnected():
+        changed_event = tasks_changed
+        for summary in changed_since(since):
+            yield f"id: {summary['version']}\nevent: task\ndata: {json.dumps(summary)}\n\n"
+            since = summary["version"]
+        try:
+            await asyncio.wait_for(changed_event.wait(), timeout=EVENTS_KEEPALIVE)
+        except TimeoutError:
+            # keeps proxies from closing an idle connection
+            yield ": keep-alive\n\n"
+
+
+def segment_summary(segment: dict) -> dict:
+    return {key: segment[key] for key in ("id", "start", "end", "text")}
+
+
+async def segment_stream(request: Request, task_id: str):
+    """Yield the segments of a task as NDJSON lines, as soon as they are decoded.
+
+    Once the task completes, whatever wasn't streamed live (chunked and batched
+    tasks only have their segments at the end) is sent from the stored result.
+    """
+    sent = 0
+    while not await request.is_disconnected():
+        changed_event = segments_changed
+        current_task = tasks.get(task_id)
+        if current_task is None:
+            # purged while streaming
+            return
+        live = live_segments.get(task_id)
+        if live is not None:
+            for segment in live[sent:]:
+                yield json.dumps(segment) + "\n"
+            sent = max(sent, len(live))
+        elif current_task.state == "completed":
+            transcription = await asyncio.to_thread(
+                task_store.load_transcription, task_id
+            )
+            for segment in (transcription or {}).get("segments", [])[sent:]:
+                yield json.dumps(segment_summary(segment)) + "\n"
+            return
+        elif current_task.state in ("failed", "cancelled"):
+            return
+        try:
+            await asyncio.wait_for(changed_event.wait(), timeout=EVENTS_KEEPALIVE)
+        except TimeoutError:
+            # look for a disconnected client every now and then
+            pass
+
+
+async def save_task(task_id: str, transcription: Optional[dict] = None) -> None:
+    """Bump the task's version and write it to disk, off the event loop."""
+    touch_task(task_id)
+    await asyncio.to_thread(store_task, task_id, transcription)
+
+
+def store_task(task_id: str, transcription: Optional[dict] = None) -> None:
+    """Write the task to disk, without bumping its version (safe to run in a thread)."""
+    current_task = tasks.get(task_id)
+    task_store.save(
+        task_id,
+        {
+            task_field.name: getattr(current_task, task_field.name)
+            for task_field in fields(current_task)
+            if task_field.name != "transcription"
+        },
+        transcription,
+    )
+
+
+async def recover_tasks() -> None:
+    """Load the stored tasks and queue up again whatever didn't finish."""
+    global tasks_version  # pylint: disable=global-statement
+    stored = [(task_id, Task(**data)) for task_id, data in task_store.load_all().items()]
+    for task_id, current_task in sorted(stored, key=lambda item: item[1].version):
+        tasks[task_id] = current_task
+        tasks_version = max(tasks_version, current_task.version)
+
+    unfinished = sorted(
+        (
+            task_id
+            for task_id, current_task in tasks.items()
+            if current_task.state in ("queued", "processing")
+        ),
+        key=lambda task_id: tasks[task_id].queued_at,
+    )
+    recovered = 0
+    for task_id in unfinished:
+        current_task = tasks.get(task_id)
+        if not current_task.path.exists():
+            current_task.error = {"error": "The file was lost before a restart"}
+            current_task.state = "failed"
+            await save_task(task_id)
+            continue
+        current_task.state = "queued"
+        await save_task(task_id)
+        pcm_cache.prefetch(current_task.pcm_key, current_task.path)
+        queue_task(task_id)
+        recovered += 1
+    if recovered:
+        print(f"Recovered {recovered} unfinished tasks")
+
+    # uploads that no task is waiting on anymore
+    waiting = {
+        current_task.path
+        for current_task in tasks.values()
+        if current_task.state == "queued"
+    }
+    for upload_path in UPLOAD_DIR.iterdir():
+        if upload_path not in waiting:
+            upload_path.unlink(missing_ok=True)
+
+
+async def purge_tasks():
+    while True:
+        purged = await asyncio.to_thread(
+            task_store.purge,
+            time() - TASK_RETENTION,
+            ["completed", "failed", "cancelled"],
+        )
+        for task_id in purged:
+            tasks.pop(task_id, None)
+        # resumable uploads nobody came back for
+        await asyncio.to_thread(upload_sessions.purge, time() - TASK_RETENTION)
+        await asyncio.sleep(PURGE_INTERVAL)
 
 
 class MaxBodySizeException(Exception):
@@ -76,44 +393,240 @@ class MaxBodySizeValidator:
             raise MaxBodySizeException(body_len=self.body_len)
 
 
+def chunk_file(npy_path: Path) -> List[Tuple[int, int]]:
+    return chunk_bounds(PCMCache.load(npy_path), CHUNK_SECONDS)
+
+
+async def transcribe(task_id: str) -> dict:
+    current_task = tasks.get(task_id)
+    # normally already decoded by the decode pool while the task was queued
+    npy_path = await pcm_cache.get(current_task.pcm_key, current_task.path)
+    bounds = None
+    if CHUNK_SECONDS:
+        # a full pass over the samples, kept off of the event loop
+        bounds = await asyncio.to_thread(chunk_file, npy_path)
+    if not bounds or len(bounds) == 1:
+        result = await transcription_pool.transcribe(
+            current_task.model_name, npy_path, stream_id=task_id
+        )
+        record_vad(current_task, [result])
+        return result
+
+    print(f"Transcribing {current_task.filename} in {len(bounds)} chunks")
+    finished = 0
+
+    async def transcribe_chunk(start: int, end: int) -> dict:
+        nonlocal finished
+        result = await transcription_pool.transcribe(
+            current_task.model_name, npy_path, start, end
+        )
+        finished += 1
+        current_task.progress = finished / len(bounds)
+        touch_task(task_id)
+        return result
+
+    results = await asyncio.gather(
+        *(transcribe_chunk(start, end) for start, end in bounds)
+    )
+    record_vad(current_task, results)
+    return stitch_transcriptions(
+        [(start / SAMPLE_RATE, result) for (start, _), result in zip(bounds, results)]
+    )
+
+
+def record_vad(current_task: Task, results: List[dict]) -> None:
+    """Move the VAD reports the workers added to the results onto the task."""
+    reports = [result.pop("vad") for result in results if "vad" in result]
+    duration = sum(report["duration"] for report in reports)
+    if duration:
+        speech = sum(report["speech"] for report in reports)
+        current_task.skipped_fraction = 1 - speech / duration
+        print(
+            f"Skipped {current_task.skipped_fraction:.0%} of {current_task.filename}"
+            " as non-speech"
+        )
+
+
+async def start_task(task_id: str) -> None:
+    current_task = tasks.get(task_id)
+    current_task.state = "processing"
+    current_task.progress = 0.0
+    current_task.attempts += 1
+    # a retry starts over from the first segment
+    live_segments[task_id] = []
+    await save_task(task_id)
+
+
+async def complete_task(task_id: str, transcription: dict) -> None:
+    current_task = tasks.get(task_id)
+    current_task.state = "completed"
+    current_task.progress = 1.0
+    # the result goes to disk instead of staying in memory
+    await save_task(task_id, transcription)
+    # streams pick up the rest from the store from here on
+    live_segments.pop(task_id, None)
+    wake_segment_streams()
+    if current_task.cache_key:
+        await asyncio.to_thread(
+            transcription_cache.put, current_task.cache_key, transcription
+        )
+    pcm_cache.release(current_task.pcm_key)
+    remove_upload(current_task)
+
+
+async def fail_task(task_id: str, exc: Exception) -> None:
+    current_task = tasks.get(task_id)
+    # the worker died (possibly because of another task), so try it again
+    if isinstance(exc, BrokenProcessPool) and current_task.attempts < MAX_ATTEMPTS:
+        current_task.state = "queued"
+        await save_task(task_id)
+        # keeps its place, it already waited its turn
+        queue_task(task_id)
+        # retried tasks keep their decoded samples pinned
+        return
+    current_task.error = {"error": f"Error type: {type(exc)}\nError output: {exc}"}
+    current_task.state = "failed"
+    await save_task(task_id)
+    live_segments.pop(task_id, None)
+    wake_segment_streams()
+    pcm_cache.release(current_task.pcm_key)
+    remove_upload(current_task)
+
+
+def remove_upload(current_task: Task) -> None:
+    if not current_task.shared:
+        current_task.path.unlink(missing_ok=True)
+
+
 async def whisper_manager(task_id: str):
-    async with processing_lock:
+    current_task = tasks.get(task_id)
+    await start_task(task_id)
+    started = time()
+    try:
+        transcription = await transcribe(task_id)
+    except Exception as exc:
+        await fail_task(task_id, exc)
+        return
+    if current_task.duration:
+        record_speed((time() - started) / current_task.duration)
+    await complete_task(task_id, transcription)
+
+
+def record_speed(seconds_per_second: float) -> None:
+    global seconds_per_audio_second  # pylint: disable=global-statement
+    seconds_per_audio_second = 0.8 * seconds_per_audio_second + 0.2 * seconds_per_second
+
+
+async def batch_manager(task_ids: List[str]):
+    """Transcribe short tasks together. Tasks that turn out to be longer than a
+    whisper window go back to the queue, with the duration they really have."""
+    batch, npy_paths = [], []
+    for task_id in task_ids:
         current_task = tasks.get(task_id)
-        current_task.state = "processing"
         try:
-            transcription = await asyncio.to_thread(wsp.transcribe, current_task.path)
-            current_task.transcription = transcription
-            current_task.state = "completed"
+            # normally already decoded by the decode pool while the task was queued
+            npy_path = await pcm_cache.get(current_task.pcm_key, current_task.path)
         except Exception as exc:
-            current_task.error = {
-                "error": f"Error type: {type(exc)}\nError output: {exc}"
-            }
-            current_task.state = "failed"
+            await fail_task(task_id, exc)
+            continue
+        samples = len(PCMCache.load(npy_path))
+        if samples > BATCH_MAX_SECONDS * SAMPLE_RATE:
+            # the duration was estimated from the file size
+            current_task.duration = samples / SAMPLE_RATE
+            await save_task(task_id)
+            queue_task(task_id)
+            continue
+        batch.append(task_id)
+        npy_paths.append(npy_path)
+    if len(batch) == 1:
+        await whisper_manager(batch[0])
+    if len(batch) <= 1:
+        return
+
+    for task_id in batch:
+        await start_task(task_id)
+    try:
+        transcriptions = await transcription_pool.transcribe_batch(
+            tasks.get(batch[0]).model_name, npy_paths
+        )
+    except Exception as exc:
+        for task_id in batch:
+            await fail_task(task_id, exc)
+        return
+    for task_id, transcription in zip(batch, transcriptions):
+        await complete_task(task_id, transcription)
+
+
+def is_short(task_id: str) -> bool:
+    """Whether the task fits in a single whisper window, and can be batched.
+
+    Goes by the duration probed when it was queued, so tasks never have to be
+    taken out of the queue (or decoded) to find out.
+    """
+    duration = tasks.get(task_id).duration
+    return duration is not None and duration <= BATCH_MAX_SECONDS
+
+
+async def collect_batch(first_id: str) -> List[str]:
+    """Take more short tasks for the same model out of the queue, waiting at most
+    BATCH_MAX_WAIT seconds for them. Any other task keeps its place in the queue,
+    for the other workers."""
+    model_name = tasks.get(first_id).model_name
+
+    def fits(task_id: str) -> bool:
+        return tasks.get(task_id).model_name == model_name and is_short(task_id)
+
+    batch = [first_id]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_MAX_WAIT
+    while len(batch) < BATCH_MAX_SIZE:
+        task_id = task_queue.take_nowait(fits)
+        if task_id is not None:
+            batch.append(task_id)
+            continue
+        try:
+            await asyncio.wait_for(
+                task_queue.wait_for_put(), timeout=max(deadline - loop.time(), 0)
+            )
+        except TimeoutError:
+            break
+    return batch
 
 
 async def whisper_worker():
     while True:
         # Waits here until an item is available
         job_id: str = await task_queue.get()
-        await whisper_manager(job_id)
-        # Signal that the task is complete
-        task_queue.task_done()
+        job_ids = [job_id]
+        if BATCH_MAX_SIZE > 1 and is_short(job_id):
+            job_ids = await collect_batch(job_id)
 
+        if len(job_ids) > 1:
+            await batch_manager(job_ids)
+        else:
+            await whisper_manager(job_id)
 
-@app.post("/transcribe")
-async def upload(background_tasks: BackgroundTasks, request: Request):
-    print("processing")
-    body_validator = MaxBodySizeValidator(MAX_REQUEST_BODY_SIZE)
-    filename = request.headers.get("Filename")
+        # Signal that the tasks are complete
+        for _ in job_ids:
+            task_queue.task_done()
 
-    if not filename:
+
+def check_model(model_name: str) -> None:
+    if model_name not in MODELS:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Filename header is missing",
+            detail=f"Unknown model {model_name}, expected one of: "
+            f"{', '.join(sorted(MODELS))}",
         )
+
+
+async def receive_upload(request: Request, filepath: str) -> HashingFileTarget:
+    """Stream the file of a multipart upload to ``filepath``, hashing it on the way."""
+    body_validator = MaxBodySizeValidator(MAX_REQUEST_BODY_SIZE)
     try:
-        filepath = NamedTemporaryFile(delete=False).name
-        filez = FileTarget(filepath, validator=MaxSizeValidator(MAX_FILE_SIZE))
+        filez = HashingFileTarget(
+            filepath, validator=MaxSizeValidator(MAX_FILE_SIZE)
+        )
         data = ValueTarget()
         parser = StreamingFormDataParser(headers=request.headers)
         parser.register("file", filez)
@@ -123,7 +636,7 @@ async def upload(background_tasks: BackgroundTasks, request: Request):
             body_validator(chunk)
             parser.data_received(chunk)
     except ClientDisconnect:
-        print("Client Disconnected")
+        raise
     except MaxBodySizeException as exc:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
@@ -144,17 +657,494 @@ async def upload(background_tasks: BackgroundTasks, request: Request):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="File is missing"
         )
+    return filez
+
+
+@app.post("/transcribe")
+async def upload(background_tasks: BackgroundTasks, request: Request):
+    print("processing")
+    filename = request.headers.get("Filename")
+    model_name = request.headers.get("Model", DEFAULT_MODEL)
+    queue_options = submitter(request)
+
+    if not filename:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Filename header is missing",
+        )
+    check_model(model_name)
+    filepath = NamedTemporaryFile(delete=False, dir=UPLOAD_DIR).name
+    try:
+        filez = await receive_upload(request, filepath)
+    except ClientDisconnect:
+        print("Client Disconnected")
+        # only part of the file arrived, there is nothing to transcribe
+        Path(filepath).unlink(missing_ok=True)
+        return None
+    except BaseException:
+        # never queued, so nothing else would ever remove it
+        Path(filepath).unlink(missing_ok=True)
+        raise
 
     print(f"Uploaded file: {filez.multipart_filename}")
     print(f"Uploaded to: {filepath}")
+    return await enqueue_task(
+        filename,
+        Path(filepath),
+        model_name,
+        filez.hexdigest,
+        shared=False,
+        **queue_options,
+    )
+
+
+@py_dataclass
+class UploadRequest:
+    filename: str
+    size: int
+    model_name: str = DEFAULT_MODEL
+
+
+@app.post("/uploads")
+async def create_upload(upload_request: UploadRequest):
+    """Start a resumable upload, its chunks are sent with PUT /uploads/{upload_id}."""
+    check_model(upload_request.model_name)
+    if upload_request.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum file size limit ({MAX_FILE_SIZE} bytes) exceeded",
+        )
+    upload_id = await asyncio.to_thread(
+        upload_sessions.create,
+        upload_request.filename,
+        upload_request.size,
+        upload_request.model_name,
+    )
+    return {"upload_id": upload_id, "offset": 0, "max_chunk_size": MAX_CHUNK_SIZE}
+
+
+def upload_not_found(upload_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail=f"Upload {upload_id} not found"
+    )
+
+
+def get_upload_info(upload_id: str) -> dict:
+    info = upload_sessions.info(upload_id)
+    if info is None:
+        raise upload_not_found(upload_id)
+    return info
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Where to resume the upload from."""
+    info = await asyncio.to_thread(get_upload_info, upload_id)
+    return {"upload_id": upload_id, "offset": info["offset"], "size": info["size"]}
+
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(request: Request, upload_id: str, offset: int):
+    """Append the request body at ``offset``, if it matches its Chunk-SHA256 header."""
+    checksum = request.headers.get("Chunk-SHA256")
+    if not checksum:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Chunk-SHA256 header is missing",
+        )
+    body_validator = MaxBodySizeValidator(MAX_CHUNK_SIZE)
+    chunk = bytearray()
+    try:
+        async for data in request.stream():
+            body_validator(data)
+            chunk += data
+    except ClientDisconnect:
+        # nothing was written, the client resumes from the same offset
+        print(f"Client Disconnected during upload {upload_id}")
+        return
+    except MaxBodySizeException as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum chunk size ({MAX_CHUNK_SIZE} bytes) exceeded",
+        ) from exc
+    try:
+        offset = await asyncio.to_thread(
+            upload_sessions.write, upload_id, offset, bytes(chunk), checksum
+        )
+    except KeyError as exc:
+        raise upload_not_found(upload_id) from exc
+    except UploadError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"error": str(exc), "offset": exc.offset},
+        ) from exc
+    return {"upload_id": upload_id, "offset": offset}
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(request: Request, upload_id: str):
+    """Queue the finished upload for transcription, like POST /transcribe does."""
+    info = await asyncio.to_thread(get_upload_info, upload_id)
+    filepath = UPLOAD_DIR / upload_id
+    try:
+        # same filesystem, so the chunks are moved into place, not copied
+        content_hash = await asyncio.to_thread(
+            upload_sessions.finish, upload_id, filepath
+        )
+    except KeyError as exc:
+        raise upload_not_found(upload_id) from exc
+    except UploadError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"error": str(exc), "offset": exc.offset},
+        ) from exc
+    print(f"Uploaded file: {info['filename']}")
+    return await enqueue_task(
+        info["filename"],
+        filepath,
+        info["model_name"],
+        content_hash,
+        shared=False,
+        **submitter(request),
+    )
+
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    await asyncio.to_thread(get_upload_info, upload_id)
+    await asyncio.to_thread(upload_sessions.delete, upload_id)
+    return {"message": f"Upload {upload_id} deleted"}
+
+
+def shared_file_identity(file_path: Path) -> str:
+    """Stands in for the content hash of a shared file, so it isn't read twice."""
+    stat = file_path.stat()
+    return hashlib.sha256(
+        f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()
+
+
+@py_dataclass
+class PathSubmission:
+    path: str
+    model_name: str = DEFAULT_MODEL
+
+
+@app.post("/transcribe-path")
+async def transcribe_path(request: Request, submission: PathSubmission):
+    """Queue a file the server can already read, from one of SHARED_ROOTS."""
+    check_model(submission.model_name)
+    try:
+        file_path = Path(submission.path).resolve(strict=True)
+    except OSError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"File {submission.path} not found",
+        ) from exc
+    # resolved first, so neither .. nor symlinks can escape a shared root
+    if not any(file_path.is_relative_to(root) for root in SHARED_ROOTS):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"{submission.path} is not in a shared directory",
+        )
+    if not file_path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{submission.path} is not a file",
+        )
+    print(f"Queueing shared file: {file_path}")
+    content_hash = await asyncio.to_thread(shared_file_identity, file_path)
+    return await enqueue_task(
+        file_path.name,
+        file_path,
+        submission.model_name,
+        content_hash,
+        shared=True,
+        **submitter(request),
+    )
+
+
+def queue_task(task_id: str) -> None:
+    current_task = tasks.get(task_id)
+    task_queue.put_nowait(
+        task_id,
+        # tasks stored before durations were probed count as short
+        duration=current_task.duration or 0.0,
+        priority=current_task.priority,
+        client=current_task.client_id,
+        queued_at=current_task.queued_at,
+    )
+
+
+def estimate_duration(path: Path) -> float:
+    duration = probe_duration(path)
+    if duration is None:
+        return path.stat().st_size / BYTES_PER_SECOND_ESTIMATE
+    return duration
+
+
+def submitter(request: Request) -> dict:
+    """The Priority and Client-Id headers, the client id defaults to its address."""
+    try:
+        priority = int(request.headers.get("Priority", 0))
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Priority header has to be an integer",
+        ) from exc
+    return {
+        "priority": max(-MAX_PRIORITY, min(priority, MAX_PRIORITY)),
+        "client_id": request.headers.get("Client-Id")
+        or (request.client.host if request.client else ""),
+    }
+
+
+async def enqueue_task(
+    filename: str,
+    path: Path,
+    model_name: str,
+    content_hash: str,
+    shared: bool,
+    priority: int = 0,
+    client_id: str = "",
+) -> dict:
+    """Answer from the cache if the file was transcribed before, otherwise queue it."""
     task_id = str(uuid.uuid4())
-    tasks[task_id] = Task(state="queued", filename=filename, path=Path(filepath))
+    cache_key = TranscriptionCache.make_key(
+        content_hash, model_name, RESULT_OPTIONS
+    )
+    cached = await asyncio.to_thread(transcription_cache.get, cache_key)
+    if cached is not None:
+        tasks[task_id] = Task(
+            state="completed",
+            filename=filename,
+            path=path,
+            model_name=model_name,
+            cache_key=cache_key,
+            progress=1.0,
+            shared=shared,
+        )
+        # same bytes were already transcribed, skip the queue entirely
+        remove_upload(tasks[task_id])
+        await save_task(task_id, cached)
+        return {
+            "message": f"Found cached transcription for {filename}",
+            "task_id": task_id,
+            "transcription": cached,
+        }
+
+    tasks[task_id] = Task(
+        state="queued",
+        filename=filename,
+        path=path,
+        model_name=model_name,
+        cache_key=cache_key,
+        content_hash=content_hash,
+        shared=shared,
+        # only read from the header, so it is cheap enough for every upload
+        duration=await asyncio.to_thread(estimate_duration, path),
+        priority=priority,
+        client_id=client_id,
+    )
+    await save_task(task_id)
+    # start decoding right away, so it overlaps with whatever is transcribing now
+    pcm_cache.prefetch(tasks[task_id].pcm_key, tasks[task_id].path)
     # Add the job to the queue
-    await task_queue.put(task_id)
+    queue_task(task_id)
+
+    return {
+        "message": f"Successfuly queued {filename}",
+        "task_id": task_id,
+        "duration": tasks[task_id].duration,
+    }
+
 
-    return {"message": f"Successfuly uploaded {filename}"}
+@app.get("/info")
+async def get_info():
+    """What clients need to know to pick how to submit their files."""
+    return {
+        "shared_roots": [str(root) for root in SHARED_ROOTS],
+        "max_file_size": MAX_FILE_SIZE,
+        "max_chunk_size": MAX_CHUNK_SIZE,
+    }
 
 
 @app.get("/tasks")
-async def get_tasks():
-    return tasks
+async def get_tasks(
+    since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=5000)
+):
+    """Summaries of the tasks that changed after version ``since``, oldest change
+    first. Pass ``next`` back as ``since`` to get the next page, once it is None
+    keep ``version`` around for the next poll."""
+    changed = changed_since(since)
+    page = changed[:limit]
+    return {
+        "version": tasks_version,
+        "tasks": page,
+        "next": page[-1]["version"] if page and len(changed) > limit else None,
+    }
+
+
+@app.get("/events")
+async def get_task_events(request: Request, since: int = 0):
+    """Server-Sent Events stream of task summaries, one event per change.
+
+    Reconnecting clients resume with ``since`` (or the Last-Event-ID header).
+    """
+    try:
+        since = int(request.headers.get("Last-Event-ID", since))
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Last-Event-ID header has to be an integer",
+        ) from exc
+    return StreamingResponse(
+        task_events(request, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    current_task = tasks.get(task_id)
+    if not current_task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found"
+        )
+    transcription = await asyncio.to_thread(task_store.load_transcription, task_id)
+    queue_position = eta = None
+    if task_id in task_queue:
+        queue_position, eta = queue_estimates()[task_id]
+    return {
+        **vars(current_task),
+        "transcription": transcription,
+        "queue_position": queue_position,
+        "eta": eta,
+    }
+
+
+def gzip_chunks(text: str) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    data = text.encode()
+    for start in range(0, len(data), RESULT_CHUNK_SIZE):
+        if chunk := compressor.compress(data[start : start + RESULT_CHUNK_SIZE]):
+            yield chunk
+    yield compressor.flush()
+
+
+@app.get("/tasks/{task_id}/result")
+async def get_task_result(request: Request, task_id: str):
+    """Just the transcription of a completed task, gzipped if the client takes it.
+
+    Transcripts compress about tenfold, this is what clients download them with.
+    """
+    current_task = tasks.get(task_id)
+    if not current_task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found"
+        )
+    transcription_json = await asyncio.to_thread(
+        task_store.load_transcription_json, task_id
+    )
+    if current_task.state != "completed" or transcription_json is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Task {task_id} is {current_task.state}",
+        )
+    if "gzip" not in request.headers.get("Accept-Encoding", ""):
+        return Response(transcription_json, media_type="application/json")
+    return StreamingResponse(
+        gzip_chunks(transcription_json),
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+    )
+
+
+def queue_estimates() -> dict:
+    return task_queue.estimates(transcription_pool.workers, seconds_per_audio_second)
+
+
+@app.get("/queue")
+async def get_queue(limit: int = 500, offset: int = 0):
+    """The queued tasks in the order they will run, with an estimate of how many
+    seconds it takes until each of them starts. ``offset`` skips that many of the
+    first ones, so the end of a long queue can be asked for."""
+    estimates = queue_estimates()
+    return {
+        "depth": task_queue.qsize(),
+        "seconds_per_audio_second": seconds_per_audio_second,
+        "tasks": [
+            {
+                "id": task_id,
+                "position": position,
+                "eta": eta,
+                "duration": tasks[task_id].duration,
+            }
+            for task_id, (position, eta) in list(estimates.items())[
+                offset : offset + limit
+            ]
+        ],
+    }
+
+
+@app.get("/load")
+async def get_load():
+    """How busy this backend is, for clients spreading files over several."""
+    queued_seconds = task_queue.queued_duration()
+    return {
+        "queue_depth": task_queue.qsize(),
+        "queued_seconds": queued_seconds,
+        "processing": sum(
+            current_task.state == "processing" for current_task in tasks.values()
+        ),
+        "workers": transcription_pool.workers,
+        "seconds_per_audio_second": seconds_per_audio_second,
+        # how long until a task queued now would start
+        "backlog_seconds": queued_seconds
+        * seconds_per_audio_second
+        / transcription_pool.workers,
+    }
+
+
+@app.delete("/tasks/{task_id}")
+async def cancel_task(task_id: str):
+    """Cancel a task that hasn't started yet."""
+    current_task = tasks.get(task_id)
+    if not current_task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found"
+        )
+    if not task_queue.remove(task_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Task {task_id} has already left the queue",
+        )
+    current_task.state = "cancelled"
+    await save_task(task_id)
+    pcm_cache.release(current_task.pcm_key)
+    remove_upload(current_task)
+    return {"message": f"Task {task_id} cancelled"}
+
+
+@app.get("/tasks/{task_id}/segments")
+async def get_task_segments(request: Request, task_id: str):
+    """Stream the segments of a task as NDJSON, while it is being transcribed.
+
+    The stream ends once the task has completed (and every segment was sent) or
+    failed, so it can also be opened before the task starts or after it ended.
+    """
+    if task_id not in tasks:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found"
+        )
+    return StreamingResponse(
+        segment_stream(request, task_id),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/cache")
+async def get_cache_stats():
+    return transcription_cache.stats()
@@ -0,0 +1,262 @@
+from bisect import bisect_right
+from pathlib import Path
+from subprocess import CalledProcessError, TimeoutExpired, run
+from typing import List, Optional, Tuple
+import numpy as np
+
+# whisper works on 16kHz mono audio
+SAMPLE_RATE = 16000
+# frames whose energy is computed at once, about 6 minutes of 0.1s frames
+ENERGY_BLOCK_FRAMES = 4096
+
+
+def load_audio(audio_path: Path, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode an audio file to float32 mono PCM, same as whisper.audio.load_audio."""
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads",
+        "0",
+        "-i",
+        str(audio_path),
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(sr),
+        "-",
+    ]
+    try:
+        out = run(cmd, capture_output=True, check=True).stdout
+    except CalledProcessError as exc:
+        raise RuntimeError(f"Failed to load audio: {exc.stderr.decode()}") from exc
+
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def probe_duration(audio_path: Path) -> Optional[float]:
+    """The duration of a media file in seconds, read from its header by ffprobe."""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        str(audio_path),
+    ]
+    try:
+        out = run(cmd, capture_output=True, check=True, timeout=30).stdout
+        return float(out.strip())
+    except (OSError, CalledProcessError, TimeoutExpired, ValueError):
+        return None
+
+
+def frame_energy(audio: np.ndarray, frame_len: int) -> np.ndarray:
+    """Return the RMS energy of each (complete) frame of ``frame_len`` samples.
+
+    Frames are squared a block at a time, so hours of audio don't need a squared
+    copy of the whole recording.
+    """
+    n_frames = len(audio) // frame_len
+    frames = audio[: n_frames * frame_len].reshape(n_frames, frame_len)
+    energy = np.empty(n_frames, dtype=np.float32)
+    for start in range(0, n_frames, ENERGY_BLOCK_FRAMES):
+        block = frames[start : start + ENERGY_BLOCK_FRAMES]
+        energy[start : start + len(block)] = np.sqrt(
+            np.mean(np.square(block, dtype=np.float32), axis=1)
+        )
+    return energy
+
+
+def find_split_points(
+    audio: np.ndarray,
+    chunk_seconds: float,
+    search_seconds: float = 30.0,
+    frame_seconds: float = 0.1,
+    sr: int = SAMPLE_RATE,
+) -> List[int]:
+    """Find sample offsets roughly every ``chunk_seconds`` that sit in the quietest
+    frame within ``search_seconds`` of the target, so no words get cut in half."""
+    frame_len = int(frame_seconds * sr)
+    energy = frame_energy(audio, frame_len)
+    chunk_frames = int(chunk_seconds / frame_seconds)
+    search_frames = int(search_seconds / frame_seconds)
+
+    split_points = []
+    target = chunk_frames
+    # the last piece has to be at least half of a chunk long
+    while target + chunk_frames // 2 < len(energy):
+        # never search back past the previous split point
+        previous = split_points[-1] // frame_len + 1 if split_points else 1
+        lower = max(target - search_frames, previous)
+        upper = min(target + search_frames, len(energy) - 1)
+        quietest = lower + int(np.argmin(energy[lower:upper]))
+        split_points.append(quietest * frame_len + frame_len // 2)
+        target = quietest + chunk_frames
+    return split_points
+
+
+def chunk_bounds(
+    audio: np.ndarray,
+    chunk_seconds: float,
+    sr: int = SAMPLE_RATE,
+) -> List[Tuple[int, int]]:
+    """Return (start, end) sample offsets of the pieces split at silence boundaries."""
+    bounds = [0, *find_split_points(audio, chunk_seconds, sr=sr), len(audio)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def split_audio(
+    audio: np.ndarray,
+    chunk_seconds: float,
+    sr: int = SAMPLE_RATE,
+) -> List[Tuple[float, np.ndarray]]:
+    """Split audio at silence boundaries, returning (offset in seconds, samples) pairs.
+
+    The pieces are views into ``audio``, nothing is copied.
+    """
+    return [
+        (start / sr, audio[start:end])
+        for start, end in chunk_bounds(audio, chunk_seconds, sr=sr)
+    ]
+
+
+def stitch_transcriptions(results: List[Tuple[float, dict]]) -> dict:
+    """Merge per-chunk whisper results into one, shifting timestamps by each offset.
+
+    The result has the same shape as a single whisper.transcribe call.
+    """
+    segments = []
+    for offset, result in results:
+        # seek is counted in mel frames (10ms each)
+        seek_offset = int(round(offset * 100))
+        for segment in result.get("segments", []):
+            segment = dict(segment)
+            segment["id"] = len(segments)
+            segment["seek"] = segment.get("seek", 0) + seek_offset
+            segment["start"] = segment["start"] + offset
+            segment["end"] = segment["end"] + offset
+            if "words" in segment:
+                segment["words"] = [
+                    {**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                    for word in segment["words"]
+                ]
+            segments.append(segment)
+
+    return {
+        "text": "".join(result.get("text", "") for _, result in results),
+        "segments": segments,
+        "language": results[0][1].get("language") if results else None,
+    }
+
+
+def speech_regions(
+    audio: np.ndarray,
+    frame_seconds: float = 0.03,
+    threshold_ratio: float = 4.0,
+    min_silence_seconds: float = 1.0,
+    padding_seconds: float = 0.3,
+    sr: int = SAMPLE_RATE,
+) -> List[Tuple[int, int]]:
+    """Return (start, end) sample offsets of the parts of ``audio`` that stand out
+    from the background noise, ignoring pauses shorter than ``min_silence_seconds``.
+
+    The noise floor is the energy of the quietest 10% of the frames, so it adapts
+    to each recording.
+    """
+    frame_len = int(frame_seconds * sr)
+    energy = frame_energy(audio, frame_len)
+    if not len(energy):
+        return []
+    # never below -60dBFS, digital silence would make everything speech
+    threshold = max(np.percentile(energy, 10) * threshold_ratio, 1e-3)
+    voiced = np.flatnonzero(energy > threshold)
+    if not len(voiced):
+        return []
+    gaps = np.flatnonzero(np.diff(voiced) * frame_seconds > min_silence_seconds)
+    starts = voiced[np.r_[0, gaps + 1]] * frame_len
+    ends = (voiced[np.r_[gaps, len(voiced) - 1]] + 1) * frame_len
+    padding = int(padding_seconds * sr)
+
+    regions = []
+    for start, end in zip(starts - padding, ends + padding):
+        start, end = max(int(start), 0), min(int(end), len(audio))
+        if regions and start <= regions[-1][1]:
+            # the padding closed the gap
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def join_regions(
+    audio: np.ndarray,
+    regions: List[Tuple[int, int]],
+    gap_seconds: float = 0.5,
+    sr: int = SAMPLE_RATE,
+) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """Join the regions of ``audio`` into one array, with ``gap_seconds`` of silence
+    between them so whisper doesn't run them together.
+
+    Also returns (offset in the joined audio, offset in ``audio``) in seconds for
+    every region, to map timestamps back with ``restore_timestamps``.
+    """
+    gap = np.zeros(int(gap_seconds * sr), dtype=audio.dtype)
+    pieces = []
+    offsets = []
+    joined_len = 0
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+            joined_len += len(gap)
+        offsets.append((joined_len / sr, start / sr))
+        pieces.append(audio[start:end])
+        joined_len += end - start
+    joined = np.concatenate(pieces) if pieces else np.zeros(0, dtype=audio.dtype)
+    return joined, offsets
+
+
+def restore_time(timestamp: float, offsets: List[Tuple[float, float]]) -> float:
+    """Map a timestamp in the joined audio back to the original recording."""
+    index = max(bisect_right([joined for joined, _ in offsets], timestamp) - 1, 0)
+    joined, original = offsets[index]
+    return timestamp - joined + original
+
+
+def restore_segment(segment: dict, offsets: List[Tuple[float, float]]) -> dict:
+    """A copy of ``segment`` with its timestamps mapped back with ``restore_time``."""
+    segment = dict(segment)
+    if "seek" in segment:
+        # seek is counted in mel frames (10ms each)
+        seek = restore_time(segment["seek"] / 100, offsets)
+        segment["seek"] = int(round(seek * 100))
+    segment["start"] = restore_time(segment["start"], offsets)
+    segment["end"] = restore_time(segment["end"], offsets)
+    if "words" in segment:
+        segment["words"] = [
+            {
+                **word,
+                "start": restore_time(word["start"], offsets),
+                "end": restore_time(word["end"], offsets),
+            }
+            for word in segment["words"]
+        ]
+    return segment
+
+
+def restore_timestamps(result: dict, offsets: List[Tuple[float, float]]) -> dict:
+    """Shift the timestamps of a whisper result on joined regions back to where
+    they were in the original recording."""
+    if not offsets:
+        return result
+    return {
+        **result,
+        "segments": [
+            restore_segment(segment, offsets) for segment in result.get("segments", [])
+        ],
+    }
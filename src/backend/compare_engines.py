@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+# pylint: disable=import-error
+from chunking import SAMPLE_RATE, load_audio
+from whisper_interface import ENGINES, get_engine
+
+EXAMPLE_FILE = Path("tests/assets/240530_1653.wav")
+# what is said in EXAMPLE_FILE, same as the transcribed_file fixture of the tests
+EXAMPLE_TRANSCRIPT = (
+    "I think it's in part, there's just config drift and things in there that kind"
+    " of come along. And there's lots of little updates here that you don't really"
+    " have any control over. So I propose to build it better."
+)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word level Levenshtein distance, divided by the number of reference words."""
+    ref_words = normalize(reference)
+    hyp_words = normalize(hypothesis)
+    if not ref_words:
+        return float(bool(hyp_words))
+
+    previous = list(range(len(hyp_words) + 1))
+    for i, ref_word in enumerate(ref_words, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp_words, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,  # deletion
+                    current[j - 1] + 1,  # insertion
+                    previous[j - 1] + (ref_word != hyp_word),  # substitution
+                )
+            )
+        previous = current
+    return previous[-1] / len(ref_words)
+
+
+def normalize(text: str) -> List[str]:
+    return "".join(
+        char for char in text.lower() if char.isalnum() or char.isspace() or char == "'"
+    ).split()
+
+
+def compare_engines(
+    audio_path: Path, engines: List[str], model_name: str, reference: str
+) -> List[dict]:
+    """Transcribe ``audio_path`` with every engine, reporting the real-time factor
+    and the word error rate against the known transcript ``reference``."""
+    audio = load_audio(audio_path)
+    duration = len(audio) / SAMPLE_RATE
+    results = []
+    for engine in engines:
+        wsp = get_engine(engine)(model_name=model_name)
+        # load the model first, so only inference is timed
+        wsp._model  # pylint: disable=pointless-statement,protected-access
+        start = perf_counter()
+        text = wsp.transcribe(audio)["text"].strip()
+        elapsed = perf_counter() - start
+        results.append(
+            {
+                "engine": engine,
+                "seconds": elapsed,
+                "rtf": elapsed / duration,
+                "wer": word_error_rate(reference, text),
+            }
+        )
+
+    reference_wer = results[0]["wer"]
+    for result in results:
+        result["wer_delta"] = result["wer"] - reference_wer
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Compare the speed and accuracy of engines")
+    parser.add_argument(
+        "audio_file",
+        type=Path,
+        nargs="?",
+        default=EXAMPLE_FILE,
+    )
+    parser.add_argument("--model", default="medium.en")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=list(ENGINES),
+        choices=list(ENGINES),
+        help="the first engine is the baseline for the WER delta",
+    )
+    parser.add_argument(
+        "--reference",
+        help="expected transcript, required for anything but the example file",
+    )
+    args = parser.parse_args()
+    if args.reference is None:
+        if args.audio_file.resolve() != EXAMPLE_FILE.resolve():
+            parser.error("--reference is required for your own audio files")
+        args.reference = EXAMPLE_TRANSCRIPT
+
+    print(f"{'engine':<16}{'seconds':>10}{'rtf':>8}{'wer':>8}{'delta':>8}")
+    for result in compare_engines(
+        args.audio_file, args.engines, args.model, args.reference
+    ):
+        print(
+            f"{result['engine']:<16}{result['seconds']:>10.2f}{result['rtf']:>8.3f}"
+            f"{result['wer']:>8.3f}{result['wer_delta']:>+8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
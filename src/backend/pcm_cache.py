@@ -0,0 +1,117 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+import asyncio
+import os
+import threading
+import uuid
+import numpy as np
+
+# pylint: disable=import-error
+from chunking import load_audio
+
+
+class PCMCache:
+    """A bounded on-disk cache of decoded 16kHz mono float32 PCM, one .npy per key.
+
+    Decoding runs on its own pool (ffmpeg does the heavy lifting in a subprocess,
+    so threads are enough), which lets queued uploads be decoded while the
+    transcription workers are busy. Keys that are still needed by a task are
+    pinned and never evicted, so the size limit only applies to unpinned entries.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int, decoders: int):
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=decoders, thread_name_prefix="decoder"
+        )
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._pinned = Counter()
+        # least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        # left behind by decodes that a crash cut short
+        for tmp_path in self._cache_dir.glob("*.tmp"):
+            tmp_path.unlink(missing_ok=True)
+        for npy_path in sorted(
+            self._cache_dir.glob("*.npy"), key=lambda path: path.stat().st_mtime
+        ):
+            self._entries[npy_path.stem] = npy_path.stat().st_size
+
+    def _entry_path(self, key: str) -> Path:
+        return self._cache_dir / f"{key}.npy"
+
+    def _decode(self, key: str, audio_path: Path) -> Path:
+        npy_path = self._entry_path(key)
+        # never the name of another decode's file, or of one a worker has mapped
+        tmp_path = npy_path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        size = None
+        try:
+            with open(tmp_path, "wb") as npy_file:
+                np.save(npy_file, load_audio(audio_path))
+            size = tmp_path.stat().st_size
+            os.replace(tmp_path, npy_path)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            # no longer pending and cached at once, so it isn't decoded again
+            with self._lock:
+                self._pending.pop(key, None)
+                if size is not None:
+                    self._entries[key] = size
+                    self._evict()
+        return npy_path
+
+    def _evict(self) -> None:
+        total = sum(self._entries.values())
+        for key in list(self._entries):
+            if total <= self._max_size:
+                break
+            if self._pinned[key]:
+                continue
+            total -= self._entries.pop(key)
+            self._entry_path(key).unlink(missing_ok=True)
+
+    def prefetch(self, key: str, audio_path: Path) -> None:
+        """Pin ``key`` and start decoding ``audio_path`` in the background if needed."""
+        with self._lock:
+            self._pinned[key] += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif key not in self._pending:
+                self._pending[key] = self._executor.submit(
+                    self._decode, key, audio_path
+                )
+
+    async def get(self, key: str, audio_path: Path) -> Path:
+        """Return the .npy path of a pinned key, waiting for (or starting) its decode."""
+        with self._lock:
+            if key in self._entries and self._entry_path(key).exists():
+                self._entries.move_to_end(key)
+                return self._entry_path(key)
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._executor.submit(
+                    self._decode, key, audio_path
+                )
+        return await asyncio.wrap_future(future)
+
+    def release(self, key: str) -> None:
+        """Unpin ``key`` once its task no longer needs the samples."""
+        with self._lock:
+            self._pinned[key] -= 1
+            if self._pinned[key] <= 0:
+                del self._pinned[key]
+            self._evict()
+
+    @staticmethod
+    def load(npy_path: Path) -> np.ndarray:
+        """Memory map the samples, copy on write so torch can use them without a copy."""
+        return np.load(npy_path, mmap_mode="c")
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,226 @@
+from collections import deque
+from dataclasses import dataclass, field
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+
+
+@dataclass(order=True)
+class _Entry:
+    key: float
+    sequence: int
+    task_id: str = field(compare=False)
+    duration: float = field(compare=False)
+    client: str = field(compare=False)
+    removed: bool = field(default=False, compare=False)
+
+
+class TaskScheduler:
+    """A drop-in replacement for the asyncio.Queue of task ids, that hands out the
+    task most worth running next instead of the oldest one.
+
+    Every task gets a key, its queue time plus a penalty, and the lowest goes first:
+
+    * shortest job first: ``duration / aging_rate``, so a task that has waited
+      ``aging_rate`` times longer than another is shorter still goes first, and
+      long recordings can't starve
+    * ``priority``: every step moves a task ``priority_step`` seconds forward
+    * fairness: each client is charged for the audio it was handed, and the audio
+      a client got beyond the least served client counts like its duration does,
+      so one client queueing thousands of files doesn't block everyone else
+    """
+
+    def __init__(self, aging_rate: float = 10.0, priority_step: float = 300.0):
+        self._aging_rate = aging_rate
+        self._priority_step = priority_step
+        # a heap per client with queued tasks
+        self._queues: Dict[str, List[_Entry]] = {}
+        self._entries: Dict[str, _Entry] = {}
+        # seconds of audio handed out per client
+        self._served: Dict[str, float] = {}
+        self._sequence = 0
+        self._unfinished = 0
+        self._getters: deque = deque()
+        # woken up all at once by every put, see wait_for_put
+        self._put_waiters: List[asyncio.Future] = []
+
+    def qsize(self) -> int:
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        return not self._entries
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._entries
+
+    def queued_duration(self) -> float:
+        """Seconds of audio waiting in the queue."""
+        return sum((entry.duration for entry in self._entries.values()), 0.0)
+
+    def put_nowait(
+        self,
+        task_id: str,
+        duration: float = 0.0,
+        priority: int = 0,
+        client: str = "",
+        queued_at: Optional[float] = None,
+    ) -> None:
+        """Queue a task with ``duration`` seconds of audio."""
+        queued_at = time() if queued_at is None else queued_at
+        key = (
+            queued_at + duration / self._aging_rate - priority * self._priority_step
+        )
+        if client not in self._queues:
+            # starts level with the others, idle time doesn't earn credit
+            self._served[client] = max(
+                self._served.get(client, 0.0),
+                min(self._served[other] for other in self._queues)
+                if self._queues
+                else 0.0,
+            )
+            self._queues[client] = []
+        self._sequence += 1
+        entry = _Entry(key, self._sequence, task_id, duration, client)
+        heapq.heappush(self._queues[client], entry)
+        self._entries[task_id] = entry
+        self._unfinished += 1
+        self._wake_getter()
+        for waiter in self._put_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._put_waiters = []
+
+    async def put(self, task_id: str, **kwargs) -> None:
+        self.put_nowait(task_id, **kwargs)
+
+    def _pick(
+        self, queues: Dict[str, List[_Entry]], served: Dict[str, float]
+    ) -> Optional[str]:
+        """The client whose next task goes first."""
+        least_served = min((served[client] for client in queues), default=0.0)
+        return min(
+            queues,
+            key=lambda client: queues[client][0].key
+            + (served[client] - least_served) / self._aging_rate,
+            default=None,
+        )
+
+    def get_nowait(self) -> str:
+        client = self._pick(self._queues, self._served)
+        if client is None:
+            raise asyncio.QueueEmpty
+        entry = heapq.heappop(self._queues[client])
+        self._served[client] += entry.duration
+        del self._entries[entry.task_id]
+        self._drop_removed(client)
+        return entry.task_id
+
+    async def get(self) -> str:
+        while self.empty():
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter in self._getters:
+                    self._getters.remove(getter)
+                elif not self.empty():
+                    # woken up, but gone before it took the task, pass it on
+                    self._wake_getter()
+                raise
+        return self.get_nowait()
+
+    def take_nowait(self, predicate: Callable[[str], bool]) -> Optional[str]:
+        """Like ``get_nowait``, but only for the tasks ``predicate`` accepts, and
+        None if there are none. The other tasks keep their place."""
+        least_served = min(
+            (self._served[client] for client in self._queues), default=0.0
+        )
+        entry = min(
+            (entry for entry in self._entries.values() if predicate(entry.task_id)),
+            key=lambda entry: (
+                entry.key
+                + (self._served[entry.client] - least_served) / self._aging_rate,
+                entry.sequence,
+            ),
+            default=None,
+        )
+        if entry is None:
+            return None
+        self._served[entry.client] += entry.duration
+        del self._entries[entry.task_id]
+        # left in the heap, and dropped once it comes up
+        entry.removed = True
+        self._drop_removed(entry.client)
+        return entry.task_id
+
+    async def wait_for_put(self) -> None:
+        """Wait until the next task is queued, without taking it."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._put_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self._put_waiters:
+                self._put_waiters.remove(waiter)
+
+    def task_done(self) -> None:
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+
+    def remove(self, task_id: str) -> bool:
+        """Take a task back out of the queue, if it is still waiting."""
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        # left in the heap, and dropped once it comes up
+        entry.removed = True
+        self._unfinished -= 1
+        self._drop_removed(entry.client)
+        return True
+
+    def _drop_removed(self, client: str) -> None:
+        queue = self._queues[client]
+        while queue and queue[0].removed:
+            heapq.heappop(queue)
+        if not queue:
+            del self._queues[client]
+
+    def _wake_getter(self) -> None:
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def ordered(self) -> List[Tuple[str, float]]:
+        """(task id, duration) of every queued task, in the order they would run if
+        nothing else was queued."""
+        queues = {
+            client: deque(sorted(entry for entry in queue if not entry.removed))
+            for client, queue in self._queues.items()
+        }
+        served = dict(self._served)
+        order = []
+        while queues:
+            client = self._pick(queues, served)
+            entry = queues[client].popleft()
+            served[client] += entry.duration
+            order.append((entry.task_id, entry.duration))
+            if not queues[client]:
+                del queues[client]
+        return order
+
+    def estimates(
+        self, workers: int, seconds_per_second: float
+    ) -> Dict[str, Tuple[int, float]]:
+        """(position, seconds until it starts) of every queued task, given how long
+        a second of audio takes to transcribe on one of ``workers``."""
+        estimates = {}
+        ahead = 0.0
+        for position, (task_id, duration) in enumerate(self.ordered()):
+            estimates[task_id] = (position, ahead / workers)
+            ahead += duration * seconds_per_second
+        return estimates
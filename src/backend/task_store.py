@@ -0,0 +1,92 @@
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+
+
+class TaskStore:
+    """Durable record of tasks and their results, in a sqlite database (WAL mode).
+
+    Tasks are stored as json, next to their state and last update time so the
+    queue can be recovered and old results purged. Transcriptions live in their
+    own column, so they can be kept out of memory until someone asks for them.
+    """
+
+    def __init__(self, db_path: Path):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "data TEXT NOT NULL, transcription TEXT)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_state_updated ON tasks (state, updated_at)"
+        )
+        self._conn.commit()
+
+    def save(
+        self, task_id: str, task: dict, transcription: Optional[dict] = None
+    ) -> None:
+        """Insert or update a task, the stored transcription is kept if none is given."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (id, state, updated_at, data, transcription) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                "state = excluded.state, updated_at = excluded.updated_at, "
+                "data = excluded.data, "
+                "transcription = COALESCE(excluded.transcription, tasks.transcription)",
+                (
+                    task_id,
+                    task["state"],
+                    time(),
+                    json.dumps(task, default=str),
+                    json.dumps(transcription) if transcription is not None else None,
+                ),
+            )
+            self._conn.commit()
+
+    def load_transcription(self, task_id: str) -> Optional[dict]:
+        transcription_json = self.load_transcription_json(task_id)
+        if transcription_json is None:
+            return None
+        return json.loads(transcription_json)
+
+    def load_transcription_json(self, task_id: str) -> Optional[str]:
+        """The transcription as it is stored, to send it on without parsing it."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT transcription FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_all(self) -> Dict[str, dict]:
+        """Return every task (without its transcription), oldest update first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM tasks ORDER BY updated_at"
+            ).fetchall()
+        return {task_id: json.loads(data) for task_id, data in rows}
+
+    def purge(self, older_than: float, states: List[str]) -> List[str]:
+        """Delete tasks in one of ``states`` last updated before ``older_than``."""
+        placeholders = ", ".join("?" for _ in states)
+        with self._lock:
+            task_ids = [
+                task_id
+                for (task_id,) in self._conn.execute(
+                    f"SELECT id FROM tasks WHERE state IN ({placeholders}) "
+                    "AND updated_at < ?",
+                    (*states, older_than),
+                ).fetchall()
+            ]
+            self._conn.executemany(
+                "DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in task_ids]
+            )
+            self._conn.commit()
+        return task_ids
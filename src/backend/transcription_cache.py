@@ -0,0 +1,126 @@
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from streaming_form_data.targets import FileTarget
+
+
+class HashingFileTarget(FileTarget):
+    """A FileTarget that hashes the uploaded file while it is written to disk."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def on_data_received(self, chunk: bytes):
+        super().on_data_received(chunk)
+        self._hasher.update(chunk)
+
+    @property
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+class TranscriptionCache:
+    """A persistent, size-bounded (LRU) cache of finished transcriptions.
+
+    Entries are stored as json files under ``cache_dir`` and tracked in a small
+    sqlite index so the cache survives restarts.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(
+            self._cache_dir / "index.db", check_same_thread=False
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, options: Dict[str, Any]) -> str:
+        """Build the cache key from the content hash, model name and decode options."""
+        key_data = json.dumps(
+            {"hash": content_hash, "model": model_name, "options": options},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self._cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached transcription for ``key``, or None on a miss."""
+        with self._lock:
+            entry_path = self._entry_path(key)
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or not entry_path.exists():
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(entry_path.read_text())
+
+    def put(self, key: str, transcription: dict) -> None:
+        """Store a transcription and evict the least recently used entries if needed."""
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        data = json.dumps(transcription).encode("utf-8")
+        # write then rename, so a crash never leaves a partial entry behind
+        tmp_path = entry_path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, entry_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+                (key, len(data), time()),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total <= self._max_size:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self._max_size:
+                break
+            self._entry_path(key).unlink(missing_ok=True)
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": size,
+            "max_size": self._max_size,
+        }
@@ -0,0 +1,141 @@
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A chunk that doesn't fit the upload, ``offset`` is where it has to resume."""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadSessions:
+    """Resumable uploads, received in order a chunk at a time.
+
+    Every upload is one ``.part`` file that chunks are appended to once their
+    checksum matches, next to a json file describing it. The current offset is
+    just the size of the ``.part`` file, so uploads can be resumed after a
+    disconnect or a restart, and the finished file is moved (not copied) to
+    wherever it is transcribed from.
+    """
+
+    def __init__(self, upload_dir: Path):
+        self._upload_dir = Path(upload_dir)
+        self._upload_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        # running hash of every upload, with the offset it got to
+        self._hashers: Dict[str, tuple] = {}
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self._upload_dir / f"{upload_id}.part"
+
+    def _info_path(self, upload_id: str) -> Path:
+        return self._upload_dir / f"{upload_id}.json"
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename: str, size: int, model_name: str) -> str:
+        upload_id = uuid.uuid4().hex
+        self._part_path(upload_id).touch()
+        tmp_path = self._info_path(upload_id).with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "filename": filename,
+                    "size": size,
+                    "model_name": model_name,
+                    "created_at": time(),
+                }
+            )
+        )
+        os.replace(tmp_path, self._info_path(upload_id))
+        return upload_id
+
+    def info(self, upload_id: str) -> Optional[dict]:
+        """The upload's description and current ``offset``, None if it doesn't exist."""
+        try:
+            info = json.loads(self._info_path(upload_id).read_text())
+            info["offset"] = self._part_path(upload_id).stat().st_size
+        except (OSError, ValueError):
+            return None
+        return info
+
+    def write(self, upload_id: str, offset: int, chunk: bytes, sha256: str) -> int:
+        """Append ``chunk`` at ``offset`` and return the new offset."""
+        if hashlib.sha256(chunk).hexdigest() != sha256.lower():
+            raise UploadError("Chunk checksum mismatch", offset)
+        with self._upload_lock(upload_id):
+            info = self.info(upload_id)
+            if info is None:
+                raise KeyError(upload_id)
+            if offset != info["offset"]:
+                raise UploadError(
+                    f"Expected a chunk at offset {info['offset']}", info["offset"]
+                )
+            if offset + len(chunk) > info["size"]:
+                raise UploadError("Chunk goes past the end of the upload", offset)
+            hasher = self._hasher(upload_id, offset)
+            with open(self._part_path(upload_id), "ab") as part_file:
+                part_file.write(chunk)
+            hasher.update(chunk)
+            self._hashers[upload_id] = (hasher, offset + len(chunk))
+            return offset + len(chunk)
+
+    def _hasher(self, upload_id: str, offset: int):
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hashed != offset:
+            # after a restart, hash what was received before it
+            hasher = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as part_file:
+                while chunk := part_file.read(HASH_READ_SIZE):
+                    hasher.update(chunk)
+        return hasher
+
+    def finish(self, upload_id: str, destination: Path) -> str:
+        """Move the complete upload to ``destination`` and return its sha256."""
+        with self._upload_lock(upload_id):
+            info = self.info(upload_id)
+            if info is None:
+                raise KeyError(upload_id)
+            if info["offset"] != info["size"]:
+                raise UploadError(
+                    f"Only {info['offset']} of {info['size']} bytes were received",
+                    info["offset"],
+                )
+            hexdigest = self._hasher(upload_id, info["offset"]).hexdigest()
+            os.replace(self._part_path(upload_id), destination)
+            self._forget(upload_id)
+        return hexdigest
+
+    def delete(self, upload_id: str) -> None:
+        with self._upload_lock(upload_id):
+            self._part_path(upload_id).unlink(missing_ok=True)
+            self._forget(upload_id)
+
+    def _forget(self, upload_id: str) -> None:
+        self._info_path(upload_id).unlink(missing_ok=True)
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+
+    def purge(self, older_than: float) -> List[str]:
+        """Delete the uploads that were started before ``older_than``."""
+        purged = []
+        for info_path in self._upload_dir.glob("*.json"):
+            info = self.info(info_path.stem)
+            if info is None or info["created_at"] < older_than:
+                self.delete(info_path.stem)
+                purged.append(info_path.stem)
+        return purged
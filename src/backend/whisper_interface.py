@@ -1,23 +1,353 @@
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from dataclasses import fields
+from io import TextIOBase
 from pathlib import Path
+from typing import Callable, List, Optional
+import re
+import numpy as np
 import whisper
 import torch
 
+try:
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+# approximate parameter counts, used to make room before a model is loaded
+MODEL_PARAMETERS = {
+    "tiny": 39_000_000,
+    "base": 74_000_000,
+    "small": 244_000_000,
+    "medium": 769_000_000,
+    "large": 1_550_000_000,
+    "turbo": 809_000_000,
+}
+
+# how whisper.transcribe prints every segment with verbose=True
+SEGMENT_LINE = re.compile(r"^\[(?P<start>[\d:.]+) --> (?P<end>[\d:.]+)\] (?P<text>.*)$")
+
+
+def _parse_timestamp(timestamp: str) -> float:
+    seconds = 0.0
+    for part in timestamp.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class SegmentWriter(TextIOBase):
+    """Stands in for stdout, handing every segment whisper prints to ``on_segment``."""
+
+    def __init__(self, on_segment: Callable[[dict], None]):
+        self._on_segment = on_segment
+        self._buffer = ""
+        self._count = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            match = SEGMENT_LINE.match(line)
+            if match:
+                self._on_segment(
+                    {
+                        "id": self._count,
+                        "start": _parse_timestamp(match["start"]),
+                        "end": _parse_timestamp(match["end"]),
+                        "text": match["text"],
+                    }
+                )
+                self._count += 1
+        return len(text)
+
 
 class WhisperInterface:
-    """A class to interact with the whisper library."""
+    """A class to interact with the whisper library.
 
-    def __init__(self):
+    This is the reference (fp32 pytorch) engine, the other engines subclass it and
+    return the same ``{"text", "segments", "language"}`` dict from ``transcribe``.
+    """
+
+    # used to estimate how much memory a model needs before it is loaded
+    bytes_per_parameter = 4
+
+    def __init__(self, model_name: str = "medium.en", decode_options: dict = None):
         self._device = "cuda" if torch.cuda.is_available() else "cpu"
-        self._model = whisper.load_model(
-            name="medium.en",
+        self.model_name = model_name
+        # options passed through to whisper.transcribe, also part of the cache key
+        self.decode_options = decode_options or {}
+        self._loaded_model = None
+        # print(self._device)
+
+    @property
+    def _model(self):
+        """The whisper model, loaded on first use."""
+        if self._loaded_model is None:
+            self._loaded_model = self._load_model()
+        return self._loaded_model
+
+    def _load_model(self):
+        return whisper.load_model(
+            name=self.model_name,
             device=self._device,
         )
-        # print(self._device)
 
-    def transcribe(self, audio_path: Path):
-        """Transcribe an audio file."""
-        return whisper.transcribe(
-            model=self._model,
-            audio=str(audio_path),
-            # verbose=True,
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_model is not None
+
+    def _estimated_memory_size(self) -> int:
+        base_name = self.model_name.split(".")[0].split("-")[0]
+        parameters = MODEL_PARAMETERS.get(base_name, MODEL_PARAMETERS["large"])
+        return parameters * self.bytes_per_parameter
+
+    @property
+    def memory_size(self) -> int:
+        """Bytes used by the model parameters, estimated if it isn't loaded yet."""
+        if self._loaded_model is None:
+            return self._estimated_memory_size()
+        return sum(
+            param.numel() * param.element_size()
+            for param in self._loaded_model.parameters()
+        )
+
+    def transcribe(
+        self,
+        audio: Path | np.ndarray,
+        on_segment: Optional[Callable[[dict], None]] = None,
+    ):
+        """Transcribe an audio file, or already decoded 16kHz mono samples.
+
+        ``on_segment`` is called with every segment as soon as it is decoded.
+        """
+        if on_segment is None:
+            return whisper.transcribe(
+                model=self._model,
+                audio=audio if isinstance(audio, np.ndarray) else str(audio),
+                # verbose=True,
+                **self.decode_options,
+            )
+        # whisper has no callback, but prints every segment when verbose
+        with redirect_stdout(SegmentWriter(on_segment)):
+            return whisper.transcribe(
+                model=self._model,
+                audio=audio if isinstance(audio, np.ndarray) else str(audio),
+                **{**self.decode_options, "verbose": True},
+            )
+
+    def transcribe_batch(self, audios: List[np.ndarray]) -> List[dict]:
+        """Transcribe clips of at most 30 seconds each, in a single batched decode.
+
+        Every clip becomes one segment, in the same dict shape as ``transcribe``.
+        """
+        model = self._model
+        mels = torch.stack(
+            [
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(torch.from_numpy(np.asarray(audio))),
+                    n_mels=model.dims.n_mels,
+                )
+                for audio in audios
+            ]
+        ).to(model.device)
+        option_names = {field.name for field in fields(whisper.DecodingOptions)}
+        option_values = {
+            "fp16": self._device == "cuda",
+            "without_timestamps": True,
+            **{
+                name: value
+                for name, value in self.decode_options.items()
+                if name in option_names
+            },
+        }
+        # same as whisper.transcribe, English-only models can't detect a language
+        if option_values.get("language") is None and not model.is_multilingual:
+            option_values["language"] = "en"
+        options = whisper.DecodingOptions(**option_values)
+        transcriptions = []
+        for audio, result in zip(audios, whisper.decode(model, mels, options)):
+            # same silence check whisper.transcribe does with its default thresholds
+            is_silent = result.no_speech_prob > 0.6 and result.avg_logprob < -1.0
+            segments = (
+                []
+                if is_silent
+                else [
+                    {
+                        "id": 0,
+                        "seek": 0,
+                        "start": 0.0,
+                        "end": len(audio) / whisper.audio.SAMPLE_RATE,
+                        "text": result.text,
+                        "tokens": result.tokens,
+                        "temperature": result.temperature,
+                        "avg_logprob": result.avg_logprob,
+                        "compression_ratio": result.compression_ratio,
+                        "no_speech_prob": result.no_speech_prob,
+                    }
+                ]
+            )
+            transcriptions.append(
+                {
+                    "text": "".join(segment["text"] for segment in segments),
+                    "segments": segments,
+                    "language": result.language,
+                }
+            )
+        return transcriptions
+
+
+class QuantizedWhisperInterface(WhisperInterface):
+    """Whisper with its linear layers dynamically quantized to int8, for CPUs."""
+
+    bytes_per_parameter = 1
+
+    def __init__(self, model_name: str = "medium.en", decode_options: dict = None):
+        super().__init__(model_name=model_name, decode_options=decode_options)
+        # quantized kernels only exist for the cpu
+        self._device = "cpu"
+
+    def _load_model(self):
+        model = super()._load_model()
+        for module in model.modules():
+            # whisper's Linear only adds a dtype cast, which is a no-op in fp32
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+    @property
+    def memory_size(self) -> int:
+        # the packed int8 weights don't show up in .parameters()
+        return self._estimated_memory_size()
+
+
+class FasterWhisperInterface(WhisperInterface):
+    """The CTranslate2 based faster-whisper engine, running int8 on the CPU."""
+
+    bytes_per_parameter = 1
+
+    def _load_model(self):
+        if WhisperModel is None:
+            raise RuntimeError(
+                "The faster-whisper engine requires the faster-whisper package"
+            )
+        return WhisperModel(
+            self.model_name,
+            device=self._device,
+            compute_type="int8" if self._device == "cpu" else "int8_float16",
+        )
+
+    @property
+    def memory_size(self) -> int:
+        return self._estimated_memory_size()
+
+    def transcribe(
+        self,
+        audio: Path | np.ndarray,
+        on_segment: Optional[Callable[[dict], None]] = None,
+    ):
+        """Transcribe an audio file, or already decoded 16kHz mono samples.
+
+        ``on_segment`` is called with every segment as soon as it is decoded.
+        """
+        segments, info = self._model.transcribe(
+            audio if isinstance(audio, np.ndarray) else str(audio),
+            **self.decode_options,
         )
+        collected = []
+        for index, segment in enumerate(segments):
+            # same shape as whisper.transcribe
+            collected.append(
+                {
+                    "id": index,
+                    "seek": segment.seek,
+                    "start": segment.start,
+                    "end": segment.end,
+                    "text": segment.text,
+                    "tokens": segment.tokens,
+                    "temperature": segment.temperature,
+                    "avg_logprob": segment.avg_logprob,
+                    "compression_ratio": segment.compression_ratio,
+                    "no_speech_prob": segment.no_speech_prob,
+                }
+            )
+            if on_segment is not None:
+                on_segment(
+                    {
+                        "id": index,
+                        "start": segment.start,
+                        "end": segment.end,
+                        "text": segment.text,
+                    }
+                )
+        segments = collected
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": info.language,
+        }
+
+    def transcribe_batch(self, audios: List[np.ndarray]) -> List[dict]:
+        # CTranslate2 already keeps per call overhead low, so decode one by one
+        return [self.transcribe(audio) for audio in audios]
+
+
+ENGINES = {
+    "torch": WhisperInterface,
+    "torch-int8": QuantizedWhisperInterface,
+    "faster-whisper": FasterWhisperInterface,
+}
+
+
+def get_engine(engine: str) -> type[WhisperInterface]:
+    try:
+        return ENGINES[engine]
+    except KeyError as exc:
+        raise ValueError(
+            f"Unknown engine {engine}, expected one of: {', '.join(ENGINES)}"
+        ) from exc
+
+
+class ModelRegistry:
+    """Keeps recently used WhisperInterfaces around, within a memory budget.
+
+    Models are only loaded when a task first needs them, and the least recently
+    used ones are dropped to make room for a new one.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int,
+        decode_options: dict = None,
+        engine: str = "torch",
+    ):
+        self._memory_budget = memory_budget
+        self._decode_options = decode_options or {}
+        self._engine = get_engine(engine)
+        # least recently used first
+        self._models: OrderedDict[str, WhisperInterface] = OrderedDict()
+
+    @property
+    def memory_used(self) -> int:
+        return sum(wsp.memory_size for wsp in self._models.values())
+
+    @property
+    def loaded_models(self) -> List[str]:
+        return [name for name, wsp in self._models.items() if wsp.is_loaded]
+
+    def get(self, model_name: str) -> WhisperInterface:
+        if model_name in self._models:
+            self._models.move_to_end(model_name)
+            return self._models[model_name]
+
+        wsp = self._engine(model_name=model_name, decode_options=self._decode_options)
+        # always keep at least the requested model, even if it is over budget
+        while self._models and self.memory_used + wsp.memory_size > self._memory_budget:
+            evicted_name, _ = self._models.popitem(last=False)
+            print(f"Unloading model {evicted_name} to stay within the memory budget")
+        self._models[model_name] = wsp
+        return wsp
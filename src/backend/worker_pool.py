@@ -0,0 +1,210 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, List, Optional
+import asyncio
+import multiprocessing
+import threading
+import numpy as np
+
+# pylint: disable=import-error
+from chunking import (
+    SAMPLE_RATE,
+    join_regions,
+    restore_segment,
+    restore_timestamps,
+    speech_regions,
+)
+
+# set inside of every worker process by _init_worker
+_models = None
+_segments = None
+_vad = False
+
+
+def _init_worker(
+    engine: str,
+    memory_budget: int,
+    decode_options: dict,
+    threads: int,
+    segments=None,
+    vad: bool = False,
+) -> None:
+    """Set up a model registry with its own torch thread budget in this process."""
+    global _models, _segments, _vad  # pylint: disable=global-statement
+    # imported here so the API process never has to load torch
+    import torch  # pylint: disable=import-outside-toplevel
+    from whisper_interface import (  # pylint: disable=import-error,import-outside-toplevel
+        ModelRegistry,
+    )
+
+    torch.set_num_threads(threads)
+    _segments = segments
+    _vad = vad
+    # models are loaded on first use, so starting a worker is cheap
+    _models = ModelRegistry(
+        memory_budget=memory_budget, decode_options=decode_options, engine=engine
+    )
+
+
+def _transcribe(
+    model_name: str,
+    npy_path: Path,
+    start: int = 0,
+    end: Optional[int] = None,
+    stream_id: Optional[str] = None,
+) -> dict:
+    # memory mapped, so only the requested samples are paged in and never pickled
+    audio = np.load(npy_path, mmap_mode="c")[start:end]
+    offsets = None
+    if _vad:
+        regions = speech_regions(audio)
+        speech, offsets = join_regions(audio, regions)
+        report = {
+            "duration": len(audio) / SAMPLE_RATE,
+            "speech": sum(end - start for start, end in regions) / SAMPLE_RATE,
+        }
+        if not regions:
+            return {"text": "", "segments": [], "language": None, "vad": report}
+        audio = speech
+
+    def send_segment(segment: dict) -> None:
+        if offsets:
+            segment = restore_segment(segment, offsets)
+        _segments.put((stream_id, segment))
+
+    streaming = stream_id is not None and _segments is not None
+    result = _models.get(model_name).transcribe(
+        audio, on_segment=send_segment if streaming else None
+    )
+    if offsets is None:
+        return result
+    # the caller pops this before the result is stored
+    return {**restore_timestamps(result, offsets), "vad": report}
+
+
+def _transcribe_batch(model_name: str, npy_paths: List[Path]) -> List[dict]:
+    return _models.get(model_name).transcribe_batch(
+        [np.load(npy_path, mmap_mode="c") for npy_path in npy_paths]
+    )
+
+
+class TranscriptionPool:
+    """A pool of worker processes, each owning its own registry of WhisperInterfaces.
+
+    If a worker process dies the whole executor is broken, so it is replaced
+    with a fresh one and the caller gets a BrokenProcessPool to retry on.
+
+    With ``on_segment``, transcriptions started with a ``stream_id`` report every
+    segment as soon as it is decoded, as ``on_segment(stream_id, segment)`` on the
+    event loop the pool was started from.
+
+    With ``vad``, only the parts of the audio that sound like speech are given to
+    the model, and the results carry a ``vad`` dict of the total and speech
+    durations in seconds.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        threads_per_worker: int,
+        memory_budget: int,
+        decode_options: dict,
+        engine: str = "torch",
+        on_segment: Optional[Callable[[str, dict], None]] = None,
+        vad: bool = False,
+    ):
+        self.workers = workers
+        self._engine = engine
+        self._threads_per_worker = threads_per_worker
+        self._memory_budget = memory_budget
+        self._decode_options = decode_options
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+        # torch does not play well with fork
+        self._context = multiprocessing.get_context("spawn")
+        self._on_segment = on_segment
+        self._vad = vad
+        self._segments = None
+        self._segment_reader: Optional[threading.Thread] = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(
+                self._engine,
+                self._memory_budget,
+                self._decode_options,
+                self._threads_per_worker,
+                self._segments,
+                self._vad,
+            ),
+        )
+
+    def start(self) -> None:
+        if self._on_segment is not None and self._segments is None:
+            # handed to the workers when they are created, outlives pool restarts
+            self._segments = self._context.Queue()
+            self._segment_reader = threading.Thread(
+                target=self._read_segments,
+                args=(asyncio.get_running_loop(),),
+                name="segment-reader",
+                daemon=True,
+            )
+            self._segment_reader.start()
+        if self._executor is None:
+            self._executor = self._new_executor()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._segments is not None:
+            self._segments.put(None)
+            self._segment_reader.join()
+            self._segments = None
+
+    def _read_segments(self, loop: asyncio.AbstractEventLoop) -> None:
+        while (message := self._segments.get()) is not None:
+            try:
+                loop.call_soon_threadsafe(self._on_segment, *message)
+            except RuntimeError:
+                # the loop is already closed
+                return
+
+    async def run(self, func, *args):
+        """Run ``func(*args)`` in a worker process, restarting the pool if it broke."""
+        self.start()
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, func, *args
+            )
+        except BrokenProcessPool:
+            # only the first caller to notice replaces the executor
+            if self._executor is executor:
+                print("Transcription worker crashed, restarting the pool")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                self.restarts += 1
+            raise
+
+    async def transcribe(
+        self,
+        model_name: str,
+        npy_path: Path,
+        start: int = 0,
+        end: Optional[int] = None,
+        stream_id: Optional[str] = None,
+    ) -> dict:
+        """Transcribe the decoded samples (or a slice of them) stored in ``npy_path``.
+
+        Segments are streamed to ``on_segment`` under ``stream_id``, if one is given.
+        """
+        return await self.run(_transcribe, model_name, npy_path, start, end, stream_id)
+
+    async def transcribe_batch(self, model_name: str, npy_paths: List[Path]) -> List[dict]:
+        """Transcribe several short clips with one batched forward pass."""
+        return await self.run(_transcribe_batch, model_name, npy_paths)
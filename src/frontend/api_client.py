@@ -0,0 +1,351 @@
+from pathlib import Path
+from time import monotonic
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import socket
+import uuid
+
+from httpx import (
+    AsyncClient,
+    HTTPError,
+    HTTPStatusError,
+    Limits,
+    Timeout,
+    TransportError,
+)
+
+from frontend.transcoder import Transcoder
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# files at least this big are sent with the resumable upload protocol
+RESUMABLE_MIN_SIZE = 1024 * 1024 * 64
+RESUMABLE_CHUNK_SIZE = 1024 * 1024 * 8
+# what the TUI reads of every task event
+TASK_EVENT_FIELDS = ("id", "version", "state", "filename", "progress")
+# consecutive failed chunks before a resumable upload gives up
+RESUMABLE_RETRIES = 5
+RESUMABLE_RETRY_DELAY = 2.0
+
+
+class UploadInterrupted(TransportError):
+    """A resumable upload that gave up part way, the backend kept what it got."""
+
+    def __init__(self, message: str, upload_id: str, offset: int):
+        super().__init__(message)
+        self.upload_id = upload_id
+        self.offset = offset
+
+
+class TokenBucket:
+    """Limits throughput to ``rate`` bytes per second, allowing bursts of ``burst``."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self._rate = rate
+        self._burst = burst or rate
+        self._tokens = self._burst
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount: int) -> None:
+        # chunks bigger than the bucket would never fit, they just wait longer
+        async with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                await asyncio.sleep(-self._tokens / self._rate)
+
+
+class ApiClient:
+    """One pooled HTTP client for everything the TUI asks of the backend.
+
+    At most ``max_uploads`` files are uploaded at once, optionally limited to
+    ``upload_rate`` bytes per second overall. Files are streamed from disk, and
+    only opened once their upload actually starts. Large files are sent in
+    checksummed chunks that are resumed after a dropped connection, instead of
+    starting over. Files in a directory the backend shares with us aren't
+    uploaded at all, only their path is sent. With a ``transcoder``, everything
+    else is shrunk to 16kHz mono audio before it is uploaded. Clients of several
+    backends can share one ``uploads`` semaphore and rate limiting ``bucket``, so
+    the limits hold across all of them.
+    """
+
+    def __init__(
+        self,
+        api_host: str,
+        max_uploads: int = 4,
+        upload_rate: Optional[float] = None,
+        transcoder: Optional[Transcoder] = None,
+        priority: int = 0,
+        uploads: Optional[asyncio.Semaphore] = None,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.api_host = api_host
+        self._transcoder = transcoder
+        # uploads, plus room for the long lived event and segment streams
+        self.client = AsyncClient(
+            base_url=api_host,
+            limits=Limits(
+                max_connections=max_uploads + 4,
+                max_keepalive_connections=max_uploads + 4,
+            ),
+            timeout=Timeout(30.0, connect=10.0),
+            # the backend shares its queue fairly between clients
+            headers={"Client-Id": socket.gethostname(), "Priority": str(priority)},
+        )
+        self._uploads = uploads or asyncio.Semaphore(max_uploads)
+        self._bucket = bucket or (TokenBucket(upload_rate) if upload_rate else None)
+        # fetched from the backend on the first submit
+        self._shared_roots: Optional[List[Path]] = None
+        self._info_lock = asyncio.Lock()
+        # unfinished resumable uploads by the file submitted, so submitting it
+        # again resumes them
+        self._resumable: Dict[Path, str] = {}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def shared_roots(self) -> List[Path]:
+        async with self._info_lock:
+            if self._shared_roots is None:
+                try:
+                    # this is get_info in: src/backend/app.py
+                    response = await self.client.get("/info")
+                    response.raise_for_status()
+                    self._shared_roots = [
+                        Path(root) for root in response.json()["shared_roots"]
+                    ]
+                except HTTPError as exc:
+                    logging.debug("No shared directories, upload everything: %s", exc)
+                    self._shared_roots = []
+        return self._shared_roots
+
+    async def submit(
+        self,
+        file_path: Path,
+        on_progress: Optional[Callable[[int, int, float], None]] = None,
+    ) -> dict:
+        """Send a file for transcription, by path if the backend can read it."""
+        resolved = file_path.resolve()
+        if any(resolved.is_relative_to(root) for root in await self.shared_roots()):
+            try:
+                return await self.submit_path(resolved)
+            except HTTPStatusError as exc:
+                # mounted somewhere else on the backend, fall back to uploading
+                logging.debug("Path submission of %s refused: %s", file_path, exc)
+        if self._transcoder is None:
+            return await self.upload(file_path, on_progress=on_progress)
+        async with self._transcoder.prepared(file_path) as upload_path:
+            # tasks keep the name of the original file
+            return await self.upload(
+                upload_path,
+                on_progress=on_progress,
+                filename=file_path.name,
+                resume_key=file_path,
+            )
+
+    async def submit_path(self, file_path: Path) -> dict:
+        # this is transcribe_path in: src/backend/app.py
+        response = await self.client.post(
+            "/transcribe-path", json={"path": str(file_path)}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_result(self, task_id: str) -> dict:
+        """The transcription of a completed task, downloaded gzipped."""
+        # this is get_task_result in: src/backend/app.py
+        response = await self.client.get(
+            f"/tasks/{task_id}/result", headers={"Accept-Encoding": "gzip"}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def task_events(self, since: int = 0) -> AsyncIterator[dict]:
+        """Task summaries from the /events stream, from version ``since`` on.
+
+        Events that can't be read are skipped, one bad line doesn't end the stream.
+        """
+        # this is get_task_events in: src/backend/app.py
+        async with self.client.stream(
+            "GET", "/events", params={"since": since}, timeout=None
+        ) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                try:
+                    task = json.loads(line[6:])
+                except ValueError as exc:
+                    logging.debug("Skipping a task event of %s: %s", self.api_host, exc)
+                    continue
+                if not isinstance(task, dict) or any(
+                    field not in task for field in TASK_EVENT_FIELDS
+                ):
+                    logging.debug("Skipping an incomplete task event: %s", task)
+                    continue
+                yield task
+
+    async def upload(
+        self,
+        file_path: Path,
+        on_progress: Optional[Callable[[int, int, float], None]] = None,
+        filename: Optional[str] = None,
+        resume_key: Optional[Path] = None,
+    ) -> dict:
+        """Upload a file to /transcribe and return the response.
+
+        ``on_progress(sent, total, elapsed)`` is called after every chunk.
+        ``resume_key`` is the file a resumable upload is resumed for, when
+        ``file_path`` is a transcoded copy of it.
+        """
+        filename = filename or file_path.name
+        async with self._uploads:
+            if file_path.stat().st_size >= RESUMABLE_MIN_SIZE:
+                try:
+                    return await self.upload_resumable(
+                        file_path, on_progress, filename=filename, resume_key=resume_key
+                    )
+                except HTTPStatusError as exc:
+                    if exc.response.status_code != 404:
+                        raise
+                    logging.debug("No resumable uploads, sending %s whole", file_path)
+            boundary = uuid.uuid4().hex
+            head = (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="file"; '
+                f'filename="{filename}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+            tail = f"\r\n--{boundary}--\r\n".encode()
+            with open(file_path, "rb") as file_handle:
+                size = file_path.stat().st_size
+                # this is upload in: src/backend/app.py
+                response = await self.client.post(
+                    "/transcribe",
+                    headers={
+                        "Filename": filename,
+                        "Content-Type": f"multipart/form-data; boundary={boundary}",
+                        "Content-Length": str(len(head) + size + len(tail)),
+                    },
+                    content=self._multipart_body(
+                        head, file_handle, size, tail, on_progress
+                    ),
+                    # a throttled upload can take a while between reads
+                    timeout=Timeout(30.0, connect=10.0, write=None),
+                )
+            response.raise_for_status()
+            return response.json()
+
+    async def _multipart_body(
+        self,
+        head: bytes,
+        file_handle: BinaryIO,
+        size: int,
+        tail: bytes,
+        on_progress: Optional[Callable[[int, int, float], None]],
+    ) -> AsyncIterator[bytes]:
+        started = monotonic()
+        sent = 0
+        yield head
+        while chunk := await asyncio.to_thread(file_handle.read, UPLOAD_CHUNK_SIZE):
+            if self._bucket is not None:
+                await self._bucket.consume(len(chunk))
+            yield chunk
+            sent += len(chunk)
+            if on_progress is not None:
+                on_progress(sent, size, monotonic() - started)
+        yield tail
+
+    async def upload_resumable(
+        self,
+        file_path: Path,
+        on_progress: Optional[Callable[[int, int, float], None]] = None,
+        filename: Optional[str] = None,
+        resume_key: Optional[Path] = None,
+    ) -> dict:
+        """Upload a file chunk by chunk, resuming where the backend left off.
+
+        Raises UploadInterrupted when the connection keeps failing, submitting the
+        file again resumes the upload.
+        """
+        size = file_path.stat().st_size
+        resume_key = resume_key or file_path
+        upload_id = self._resumable.get(resume_key)
+        offset = 0
+        if upload_id is not None:
+            # this is get_upload in: src/backend/app.py
+            response = await self.client.get(f"/uploads/{upload_id}")
+            if response.status_code == 404:
+                upload_id = None
+            else:
+                response.raise_for_status()
+                info = response.json()
+                if info["size"] == size:
+                    offset = info["offset"]
+                else:
+                    # the file changed since, start over
+                    upload_id = None
+        if upload_id is None:
+            # this is create_upload in: src/backend/app.py
+            response = await self.client.post(
+                "/uploads",
+                json={"filename": filename or file_path.name, "size": size},
+            )
+            response.raise_for_status()
+            upload_id = response.json()["upload_id"]
+            self._resumable[resume_key] = upload_id
+
+        started = monotonic()
+        failures = 0
+        with open(file_path, "rb") as file_handle:
+            while offset < size:
+                chunk, checksum = await asyncio.to_thread(
+                    self._read_chunk, file_handle, offset
+                )
+                if self._bucket is not None:
+                    await self._bucket.consume(len(chunk))
+                try:
+                    # this is put_upload_chunk in: src/backend/app.py
+                    response = await self.client.put(
+                        f"/uploads/{upload_id}",
+                        params={"offset": offset},
+                        headers={"Chunk-SHA256": checksum},
+                        content=chunk,
+                        timeout=Timeout(30.0, connect=10.0, write=None),
+                    )
+                    if response.status_code == 409:
+                        # the backend says where it wants to continue from
+                        offset = response.json()["detail"]["offset"]
+                        failures += 1
+                    else:
+                        response.raise_for_status()
+                        offset = response.json()["offset"]
+                        failures = 0
+                except TransportError as exc:
+                    failures += 1
+                    logging.debug("Chunk of %s failed: %s", file_path, exc)
+                    await asyncio.sleep(RESUMABLE_RETRY_DELAY * failures)
+                if failures > RESUMABLE_RETRIES:
+                    raise UploadInterrupted(
+                        f"Giving up on uploading {file_path}", upload_id, offset
+                    )
+                if on_progress is not None:
+                    on_progress(offset, size, monotonic() - started)
+
+        # this is complete_upload in: src/backend/app.py
+        response = await self.client.post(f"/uploads/{upload_id}/complete")
+        response.raise_for_status()
+        del self._resumable[resume_key]
+        return response.json()
+
+    @staticmethod
+    def _read_chunk(file_handle: BinaryIO, offset: int) -> Tuple[bytes, str]:
+        file_handle.seek(offset)
+        chunk = file_handle.read(RESUMABLE_CHUNK_SIZE)
+        return chunk, hashlib.sha256(chunk).hexdigest()
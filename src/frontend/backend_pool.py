@@ -0,0 +1,246 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+
+from httpx import HTTPError, Timeout, TransportError
+
+from frontend.api_client import ApiClient, TokenBucket, UploadInterrupted
+from frontend.transcoder import Transcoder
+
+# a backend that doesn't answer this quickly is taken out of the rotation
+LOAD_TIMEOUT = Timeout(5.0, connect=3.0)
+# seconds one node has to be behind another before queued tasks are moved
+REBALANCE_THRESHOLD = 300.0
+# how many of the last queued tasks of the slowest node are looked at when
+# rebalancing
+REBALANCE_QUEUE_LIMIT = 200
+# what the backend assumes for files it can't probe, about 128 kbit/s
+BYTES_PER_SECOND_ESTIMATE = 16000
+
+
+@dataclass(eq=False)
+class Node:
+    """A backend, and how far behind it was when it was last asked."""
+
+    api: ApiClient
+    healthy: bool = True
+    # seconds until a task queued there now would start
+    backlog: float = 0.0
+    seconds_per_audio_second: float = 1.0
+    workers: int = 1
+    queue_depth: int = 0
+    # seconds of audio being uploaded to it, not in its backlog yet
+    uploading: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.api.api_host
+
+    @property
+    def load(self) -> float:
+        return (
+            self.backlog + self.uploading * self.seconds_per_audio_second / self.workers
+        )
+
+
+class BackendPool:
+    """Spreads files over several transcription backends.
+
+    Every file goes to the healthy backend that would get to it first, going by
+    the queue each backend reports on /load. Backends that can't be reached are
+    skipped until they answer again. When one backend falls behind the others,
+    tasks we queued there that haven't started are cancelled, so they can be sent
+    to a faster one.
+    """
+
+    def __init__(
+        self,
+        api_hosts: Iterable[str],
+        max_uploads: int = 4,
+        upload_rate: Optional[float] = None,
+        transcoder: Optional[Transcoder] = None,
+        priority: int = 0,
+        rebalance_threshold: float = REBALANCE_THRESHOLD,
+    ):
+        # the upload limits are for all backends together
+        uploads = asyncio.Semaphore(max_uploads)
+        bucket = TokenBucket(upload_rate) if upload_rate else None
+        self.nodes = [
+            Node(
+                ApiClient(
+                    api_host,
+                    max_uploads=max_uploads,
+                    transcoder=transcoder,
+                    priority=priority,
+                    uploads=uploads,
+                    bucket=bucket,
+                )
+            )
+            for api_host in api_hosts
+        ]
+        self._rebalance_threshold = rebalance_threshold
+        self._refreshed = False
+        # (node, file) of every task we queued that hasn't started yet
+        self.submitted: Dict[str, Tuple[Node, Path]] = {}
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(node.api.aclose() for node in self.nodes))
+
+    async def refresh(self) -> None:
+        """Ask every backend how busy it is."""
+        await asyncio.gather(*(self._refresh_node(node) for node in self.nodes))
+        self._refreshed = True
+
+    async def _refresh_node(self, node: Node) -> None:
+        try:
+            # this is get_load in: src/backend/app.py
+            response = await node.api.client.get("/load", timeout=LOAD_TIMEOUT)
+            response.raise_for_status()
+            load = response.json()
+        except (HTTPError, ValueError) as exc:
+            if node.healthy:
+                logging.debug("Backend %s is down: %s", node.name, exc)
+            node.healthy = False
+            return
+        node.healthy = True
+        node.backlog = load["backlog_seconds"]
+        node.seconds_per_audio_second = load["seconds_per_audio_second"]
+        node.workers = max(1, load["workers"])
+        node.queue_depth = load["queue_depth"]
+
+    def pick(self, exclude: Iterable[Node] = ()) -> Optional[Node]:
+        """The healthy backend that would get to a new file first."""
+        exclude = list(exclude)
+        return min(
+            (node for node in self.nodes if node.healthy and node not in exclude),
+            key=lambda node: node.load,
+            default=None,
+        )
+
+    async def submit(
+        self,
+        file_path: Path,
+        on_progress: Optional[Callable[[int, int, float], None]] = None,
+    ) -> Tuple[Node, dict]:
+        """Send a file to the least loaded backend, and to the next one if that
+        turns out to be unreachable.
+
+        An upload that was interrupted part way is resumed on the same backend
+        for as long as it gets further, instead of starting over on another one.
+        """
+        if not self._refreshed:
+            await self.refresh()
+        tried: List[Node] = []
+        # counted against the node while it uploads, so files sent at the same
+        # time don't all pick the same one
+        estimate = file_path.stat().st_size / BYTES_PER_SECOND_ESTIMATE
+        while (node := self.pick(tried)) is not None:
+            tried.append(node)
+            node.uploading += estimate
+            try:
+                response = await self._submit_to(node, file_path, on_progress)
+            except TransportError as exc:
+                logging.debug(
+                    "Could not submit %s to %s: %s", file_path, node.name, exc
+                )
+                node.healthy = False
+                continue
+            finally:
+                node.uploading -= estimate
+            # until the next refresh has it
+            node.backlog += (
+                (response.get("duration") or estimate)
+                * node.seconds_per_audio_second
+                / node.workers
+            )
+            node.queue_depth += 1
+            self.submitted[response["task_id"]] = (node, file_path)
+            return node, response
+        raise TransportError(f"No backend could take {file_path}")
+
+    @staticmethod
+    async def _submit_to(
+        node: Node,
+        file_path: Path,
+        on_progress: Optional[Callable[[int, int, float], None]],
+    ) -> dict:
+        offset = 0
+        while True:
+            try:
+                return await node.api.submit(file_path, on_progress=on_progress)
+            except UploadInterrupted as exc:
+                if exc.offset <= offset:
+                    raise
+                offset = exc.offset
+                logging.debug(
+                    "Resuming %s on %s from byte %d", file_path, node.name, offset
+                )
+
+    def forget(self, task_id: str) -> None:
+        """Stop tracking a task once it started, it can't be moved anymore."""
+        self.submitted.pop(task_id, None)
+
+    async def rebalance(self) -> List[Tuple[str, Path]]:
+        """Cancel queued tasks on the backend that is furthest behind, until it is
+        level with the one least behind. Returns the (task id, file) of every
+        cancelled task, for them to be submitted again.
+
+        Tasks on a backend that is down are left where they are, it may still
+        process them once it is back.
+        """
+        healthy = [node for node in self.nodes if node.healthy]
+        if len(healthy) < 2:
+            return []
+        slow = max(healthy, key=lambda node: node.load)
+        fast = min(healthy, key=lambda node: node.load)
+        # moving half the difference evens them out
+        to_move = (slow.load - fast.load) / 2
+        if to_move * 2 < self._rebalance_threshold:
+            return []
+        try:
+            # this is get_queue in: src/backend/app.py
+            response = await slow.api.client.get(
+                "/queue",
+                params={
+                    "limit": REBALANCE_QUEUE_LIMIT,
+                    # only the end of the queue, moving those gains the most
+                    "offset": max(slow.queue_depth - REBALANCE_QUEUE_LIMIT, 0),
+                },
+            )
+            response.raise_for_status()
+            queued = response.json()["tasks"]
+        except (HTTPError, ValueError) as exc:
+            logging.debug("Could not get the queue of %s: %s", slow.name, exc)
+            return []
+
+        moved = []
+        # the tasks that would start last gain the most
+        for task in reversed(queued):
+            if to_move <= 0:
+                break
+            if self.submitted.get(task["id"], (None, None))[0] is not slow:
+                continue
+            try:
+                # this is cancel_task in: src/backend/app.py
+                response = await slow.api.client.delete(f"/tasks/{task['id']}")
+            except HTTPError as exc:
+                logging.debug("Could not cancel %s: %s", task["id"], exc)
+                break
+            if response.status_code != 200:
+                # started in the meantime
+                continue
+            _, file_path = self.submitted.pop(task["id"])
+            seconds = (
+                (task.get("duration") or 0.0)
+                * slow.seconds_per_audio_second
+                / slow.workers
+            )
+            slow.backlog -= seconds
+            slow.queue_depth -= 1
+            to_move -= seconds
+            moved.append((task["id"], file_path))
+        if moved:
+            logging.debug("Moving %d tasks off %s", len(moved), slow.name)
+        return moved
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Iterable, List
+
+from whisper.utils import get_writer
+
+from frontend.transcript_writer import BREAK_PATTERN, FORMATS, write_transcripts
+
+WORDS = "so I propose to build it better there is just config drift and".split()
+
+
+def whisper_writers(transcription: dict, media_file: Path, formats: List[str]) -> None:
+    """How transcripts used to be written: a whisper writer per format, then the
+    text transcript read back to apply the break rule."""
+    for output_format in formats:
+        writer = get_writer(output_format, str(media_file.parent))
+        writer(transcription, str(media_file))
+    if "txt" in formats:
+        txt_file = media_file.with_suffix(".txt")
+        minified_lines = " ".join(txt_file.read_text().split("\n"))
+        txt_file.write_text(BREAK_PATTERN.sub("\n", minified_lines))
+
+
+def make_transcription(segments: int, seed: int = 0) -> dict:
+    """A transcription about as long as ``segments`` segments of speech."""
+    random = Random(seed)
+    result = []
+    for index in range(segments):
+        words = random.choices(WORDS, k=random.randint(5, 25))
+        if random.random() < 0.05:
+            words.append("break.")
+        result.append(
+            {
+                "id": index,
+                "start": index * 4.0,
+                "end": index * 4.0 + 3.5,
+                "text": " " + " ".join(words),
+            }
+        )
+    return {"text": "".join(s["text"] for s in result), "segments": result}
+
+
+def time_writer(
+    write: Callable[[dict, Path, List[str]], object],
+    transcription: dict,
+    files: int,
+    formats: Iterable[str],
+) -> float:
+    """Seconds it takes ``write`` to write the transcripts of ``files`` files."""
+    with TemporaryDirectory() as tmp_dir:
+        media_files = [Path(tmp_dir) / f"{index}.wav" for index in range(files)]
+        start = perf_counter()
+        for media_file in media_files:
+            write(transcription, media_file, list(formats))
+        return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description="Compare the speed of the transcript writers")
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument(
+        "--segments", type=int, default=200, help="segments per transcript"
+    )
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    args = parser.parse_args()
+
+    transcription = make_transcription(args.segments)
+    print(f"{'writer':<16}{'seconds':>10}{'files/s':>10}")
+    for name, write in (
+        ("whisper", whisper_writers),
+        ("single pass", write_transcripts),
+    ):
+        elapsed = time_writer(write, transcription, args.files, args.formats)
+        print(f"{name:<16}{elapsed:>10.2f}{args.files / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
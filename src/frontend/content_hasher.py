@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic, sleep
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from sqlmodel import Session
+
+from frontend.indexing_interface import IndexingInterface
+
+HASH_CHUNK_SIZE = 1024 * 1024 * 8
+# hashes are stored this many at a time, an interrupted run resumes from there
+HASH_COMMIT_SIZE = 100
+
+
+class RateLimiter:
+    """Limits the threads sharing it to ``rate`` bytes per second together."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self._rate = rate
+        self._burst = burst or rate
+        self._tokens = self._burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        # the debt is already booked, the other threads wait behind it
+        if wait:
+            sleep(wait)
+
+
+def hash_file(
+    file_path: str,
+    chunk_size: int = HASH_CHUNK_SIZE,
+    limiter: Optional[RateLimiter] = None,
+) -> str:
+    """sha256 of the file, the same hash the backend keys its cache with.
+
+    The file is mapped instead of read, so the chunks are hashed straight from
+    the page cache without being copied.
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as file_handle:
+        size = os.fstat(file_handle.fileno()).st_size
+        if size == 0:
+            # empty files can't be mapped
+            return hasher.hexdigest()
+        with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_size):
+                    chunk = view[offset : offset + chunk_size]
+                    if limiter is not None:
+                        limiter.consume(len(chunk))
+                    hasher.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+    return hasher.hexdigest()
+
+
+class ContentHasher:
+    """Hashes the content of indexed files, so copies of a recording can be found.
+
+    ``workers`` files are hashed at once, reading at most ``rate`` bytes per
+    second between them so a NAS isn't saturated. Hashes are stored with the
+    size and mtime they were computed for, and files whose size and mtime haven't
+    changed since are skipped, which also makes an interrupted run resume where
+    it stopped.
+    """
+
+    def __init__(
+        self,
+        index_obj: IndexingInterface,
+        workers: int = 4,
+        rate: Optional[float] = None,
+        chunk_size: int = HASH_CHUNK_SIZE,
+    ):
+        self._index_obj = index_obj
+        self._workers = workers
+        self._limiter = RateLimiter(rate, burst=chunk_size) if rate else None
+        self._chunk_size = chunk_size
+
+    def _hash(self, file_path: str):
+        stat = os.stat(file_path)
+        content_hash = hash_file(file_path, self._chunk_size, self._limiter)
+        return file_path, content_hash, stat.st_size, stat.st_mtime_ns
+
+    def hash_files(self, file_paths: Iterable[str]) -> Dict[str, str]:
+        """The content hash of every one of the indexed ``file_paths`` that could be
+        read, hashing only those that are new or changed."""
+        return dict(self.iter_hashes(file_paths))
+
+    def iter_hashes(self, file_paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """(file path, content hash) of the indexed ``file_paths`` as soon as each
+        is known, the unchanged ones first. Files that can't be read are left out."""
+        with Session(self._index_obj.engine) as session:
+            indexed = self._index_obj.get_files(session, file_paths)
+            stale = []
+            for file_path, indexed_file in indexed.items():
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if indexed_file.content_hash and (
+                    indexed_file.size,
+                    indexed_file.mtime_ns,
+                ) == (stat.st_size, stat.st_mtime_ns):
+                    yield file_path, indexed_file.content_hash
+                else:
+                    stale.append(file_path)
+            if not stale:
+                return
+
+            hashed = []
+            with ThreadPoolExecutor(
+                max_workers=self._workers, thread_name_prefix="content-hasher"
+            ) as executor:
+                futures = [executor.submit(self._hash, path) for path in stale]
+                try:
+                    for future in as_completed(futures):
+                        try:
+                            file_path, content_hash, *stat = future.result()
+                        except (OSError, ValueError) as exc:
+                            logging.debug("Could not hash a file: %s", exc)
+                            continue
+                        hashed.append((file_path, content_hash, *stat))
+                        if len(hashed) >= HASH_COMMIT_SIZE:
+                            self._index_obj.set_hashes(session, hashed)
+                            hashed = []
+                        yield file_path, content_hash
+                finally:
+                    # when the caller stops early, the files not started are skipped
+                    for future in futures:
+                        future.cancel()
+                    self._index_obj.set_hashes(session, hashed)
+            logging.debug("Hashed %d of %d files", len(stale), len(indexed))
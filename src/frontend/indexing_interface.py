@@ -1,11 +1,64 @@
 from os import getenv
 from pathlib import Path
+from time import time
+import os
 import sqlite3
-from typing import Any, List
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import delete, event, insert, text, update
 from sqlmodel import SQLModel, Session, col, create_engine, select
 
 # pylint: disable=unused-import
-from models.db_models import FilesMetadata
+from models.db_models import (
+    FileState,
+    FilesMetadata,
+    ScannedDirectory,
+    TranscriptSegment,
+)
+
+# stay well below sqlite's limit on the number of variables in one statement
+QUERY_CHUNK_SIZE = 500
+# set on every new connection
+SQLITE_PRAGMAS = (
+    # readers (the TUI) don't block the scanner and watcher threads writing
+    "PRAGMA journal_mode=WAL",
+    # still durable on a crash of the app, only a power loss can lose a commit
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # = 64MB
+    "PRAGMA mmap_size=268435456",  # = 256MB
+)
+# bumped with every migration in IndexingInterface._migrate
+SCHEMA_VERSION = 2
+# (name, definition) of the filesmetadata columns added by migration 1
+FILES_METADATA_COLUMNS = (
+    ("size", "INTEGER"),
+    ("mtime_ns", "INTEGER"),
+    ("content_hash", "VARCHAR"),
+    ("duration", "FLOAT"),
+    ("state", "VARCHAR(11) NOT NULL DEFAULT 'new'"),
+    ("created_at", "FLOAT"),
+    ("updated_at", "FLOAT"),
+)
+# the filesmetadata columns added by migration 2
+FILES_METADATA_TASK_COLUMNS = (
+    ("task_id", "VARCHAR"),
+    ("node", "VARCHAR"),
+)
+# an FTS5 index over the text of transcriptsegment, which holds the text itself,
+# kept up to date by triggers
+TRANSCRIPT_SEARCH_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcript_search USING fts5("
+    "text, content='transcriptsegment', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS transcriptsegment_ai AFTER INSERT ON "
+    "transcriptsegment BEGIN "
+    "INSERT INTO transcript_search (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS transcriptsegment_ad AFTER DELETE ON "
+    "transcriptsegment BEGIN "
+    "INSERT INTO transcript_search (transcript_search, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+)
 
 
 class IndexingInterface:
@@ -14,7 +67,61 @@ class IndexingInterface:
         if getenv("PYTEST_VERSION"):
             debugging = True
         self.engine = create_engine(conn_str, echo=debugging)
+        event.listen(self.engine, "connect", self._set_pragmas)
         SQLModel.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            self._migrate(conn)
+            for statement in TRANSCRIPT_SEARCH_SCHEMA:
+                conn.execute(text(statement))
+
+    @staticmethod
+    def _set_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @staticmethod
+    def _migrate(conn) -> None:
+        """Bring a database created by an older version up to date, tracked in
+        sqlite's user_version."""
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        # create_all only creates missing tables, not missing columns
+        columns = {
+            row[1] for row in conn.execute(text("PRAGMA table_info(filesmetadata)"))
+        }
+        if version < 1:
+            IndexingInterface._add_columns(conn, columns, FILES_METADATA_COLUMNS)
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_filesmetadata_content_hash "
+                    "ON filesmetadata (content_hash)"
+                )
+            )
+            # what get_pending reads, it only grows with the files not done yet
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_filesmetadata_pending "
+                    "ON filesmetadata (filename) WHERE processed = 0"
+                )
+            )
+            conn.execute(
+                text(
+                    "UPDATE filesmetadata SET state = 'transcribed' "
+                    "WHERE processed = 1 AND state = 'new'"
+                )
+            )
+        if version < 2:
+            IndexingInterface._add_columns(conn, columns, FILES_METADATA_TASK_COLUMNS)
+        conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+
+    @staticmethod
+    def _add_columns(conn, columns: Set[str], new_columns: Iterable[tuple]) -> None:
+        for name, definition in new_columns:
+            if name not in columns:
+                conn.execute(
+                    text(f"ALTER TABLE filesmetadata ADD COLUMN {name} {definition}")
+                )
 
     @staticmethod
     def _convert_data(data_convert: Any) -> Any:
@@ -29,6 +136,236 @@ class IndexingInterface:
             select(FilesMetadata).where(FilesMetadata.filename == file_path)
         ).first()
 
+    @classmethod
+    def get_indexed(cls, session: Session, file_paths: Iterable[Path]) -> Set[str]:
+        """Return which of the paths are already in the index, a chunk at a time."""
+        file_paths = [cls._convert_data(file_path) for file_path in file_paths]
+        indexed = set()
+        for start in range(0, len(file_paths), QUERY_CHUNK_SIZE):
+            indexed.update(
+                session.exec(
+                    # pylint: disable=no-member
+                    select(FilesMetadata.filename).where(
+                        col(FilesMetadata.filename).in_(
+                            file_paths[start : start + QUERY_CHUNK_SIZE]
+                        )
+                    )
+                ).all()
+            )
+        return indexed
+
+    @classmethod
+    def add_to_index(cls, session: Session, file_paths: Iterable[Path]) -> None:
+        """Insert new, unprocessed files with a single executemany."""
+        now = time()
+        rows = []
+        for file_path in file_paths:
+            file_path = cls._convert_data(file_path)
+            try:
+                stat = os.stat(file_path)
+                size, mtime_ns = stat.st_size, stat.st_mtime_ns
+            except OSError:
+                size = mtime_ns = None
+            rows.append(
+                {
+                    "filename": file_path,
+                    "processed": False,
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "state": FileState.new,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+        if rows:
+            session.execute(insert(FilesMetadata).prefix_with("OR IGNORE"), rows)
+            session.commit()
+
+    @classmethod
+    def get_files(
+        cls, session: Session, file_paths: Iterable[Path]
+    ) -> Dict[str, FilesMetadata]:
+        """The indexed files among ``file_paths``, by filename, a chunk at a time."""
+        file_paths = [cls._convert_data(file_path) for file_path in file_paths]
+        files = {}
+        for start in range(0, len(file_paths), QUERY_CHUNK_SIZE):
+            for indexed in session.exec(
+                select(FilesMetadata).where(
+                    # pylint: disable=no-member
+                    col(FilesMetadata.filename).in_(
+                        file_paths[start : start + QUERY_CHUNK_SIZE]
+                    )
+                )
+            ).all():
+                files[indexed.filename] = indexed
+        return files
+
+    @staticmethod
+    def set_hashes(
+        session: Session, hashes: Iterable[Tuple[str, str, int, int]]
+    ) -> None:
+        """Store the (filename, content hash, size, mtime_ns) of hashed files."""
+        now = time()
+        rows = [
+            {
+                "filename": filename,
+                "content_hash": content_hash,
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "updated_at": now,
+            }
+            for filename, content_hash, size, mtime_ns in hashes
+        ]
+        if rows:
+            # an executemany by primary key
+            session.execute(update(FilesMetadata), rows)
+            session.commit()
+
+    @staticmethod
+    def get_transcribed_copies(
+        session: Session, content_hashes: Iterable[str]
+    ) -> Dict[str, str]:
+        """A transcribed file for every one of ``content_hashes`` that has one."""
+        content_hashes = list(content_hashes)
+        copies = {}
+        for start in range(0, len(content_hashes), QUERY_CHUNK_SIZE):
+            for content_hash, filename in session.exec(
+                # pylint: disable=no-member
+                select(FilesMetadata.content_hash, FilesMetadata.filename).where(
+                    col(FilesMetadata.content_hash).in_(
+                        content_hashes[start : start + QUERY_CHUNK_SIZE]
+                    ),
+                    FilesMetadata.state == FileState.transcribed,
+                )
+            ).all():
+                copies.setdefault(content_hash, filename)
+        return copies
+
+    @staticmethod
+    def get_pending(session: Session) -> List[FilesMetadata]:
+        """The files without a transcript yet, read through their partial index."""
+        return list(
+            session.exec(
+                # a literal 0, a bound parameter can't be matched to the index
+                select(FilesMetadata).where(text("processed = 0"))
+            ).all()
+        )
+
+    @staticmethod
+    def get_queued(session: Session) -> List[FilesMetadata]:
+        """The files queued on a backend, with the task they are queued as."""
+        return list(
+            session.exec(
+                select(FilesMetadata).where(
+                    text("processed = 0"),
+                    FilesMetadata.state == FileState.queued,
+                    col(FilesMetadata.task_id).is_not(None),
+                )
+            ).all()
+        )
+
+    @classmethod
+    def set_state(
+        cls,
+        session: Session,
+        file_path: Path,
+        state: FileState,
+        duration: Optional[float] = None,
+        task_id: Optional[str] = None,
+        node: Optional[str] = None,
+    ) -> None:
+        """Move a file on to ``state``, it is processed once it is transcribed.
+
+        Queued files keep the ``task_id`` they are queued as on ``node``.
+        """
+        values = {
+            "state": state,
+            "processed": state == FileState.transcribed,
+            "updated_at": time(),
+            "task_id": task_id,
+            "node": node,
+        }
+        if duration is not None:
+            values["duration"] = duration
+        session.exec(
+            update(FilesMetadata)
+            .where(FilesMetadata.filename == cls._convert_data(file_path))
+            .values(**values)
+        )
+        session.commit()
+
+    @staticmethod
+    def get_directory_mtimes(session: Session) -> Dict[str, int]:
+        return {
+            directory.path: directory.mtime_ns
+            for directory in session.exec(select(ScannedDirectory)).all()
+        }
+
+    @staticmethod
+    def set_directory_mtimes(session: Session, mtimes: Dict[str, int]) -> None:
+        if mtimes:
+            session.execute(
+                insert(ScannedDirectory).prefix_with("OR REPLACE"),
+                [{"path": path, "mtime_ns": mtime} for path, mtime in mtimes.items()],
+            )
+            session.commit()
+
+    @classmethod
+    def add_transcript(
+        cls, session: Session, file_path: Path, segments: Iterable[dict]
+    ) -> None:
+        """Make a file's transcript searchable, replacing the one it had."""
+        file_path = cls._convert_data(file_path)
+        session.execute(
+            delete(TranscriptSegment).where(TranscriptSegment.filename == file_path)
+        )
+        rows = [
+            {
+                "filename": file_path,
+                "start_ms": round(segment["start"] * 1000),
+                "end_ms": round(segment["end"] * 1000),
+                "text": segment["text"].strip(),
+            }
+            for segment in segments
+        ]
+        if rows:
+            session.execute(insert(TranscriptSegment), rows)
+        session.commit()
+
+    @staticmethod
+    def search(session: Session, query: str, limit: int = 100) -> List[dict]:
+        """The segments that best match ``query``, best first.
+
+        Every word has to appear (in any form, "proposing" finds "propose"), and a
+        word ending in ``*`` matches anything starting with it. Hits have the
+        ``filename``, ``start_ms``, ``end_ms`` and ``text`` of their segment.
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '""')
+            if word:
+                # quoted, so nothing the user types is taken as FTS5 syntax
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+        if not terms:
+            return []
+        return [
+            dict(hit)
+            for hit in session.execute(
+                text(
+                    # ranked inside the index, so only the best hits are joined
+                    "SELECT segment.filename, segment.start_ms, segment.end_ms, "
+                    "segment.text FROM ("
+                    "SELECT rowid, rank FROM transcript_search "
+                    "WHERE transcript_search MATCH :query ORDER BY rank LIMIT :limit"
+                    ") AS hit "
+                    "JOIN transcriptsegment AS segment ON segment.id = hit.rowid "
+                    "ORDER BY hit.rank"
+                ),
+                {"query": " ".join(terms), "limit": limit},
+            ).mappings()
+        ]
+
     def bulk_validate(self, session: Session, file_paths: List[Path]):
         """Check if all files are in the database. If partial match, raise an error."""
         file_paths: List[str] = [
@@ -50,18 +387,3 @@ class IndexingInterface:
         raise ValueError(
             f"Not all files are in the database:\n{'\n'.join(not_in_results)}"
         )
-
-    # def add_to_index(
-    #     self,
-    #     session: Session,
-    #     file_path: Path,
-    #     transcribed: bool,
-    # ) -> None:
-    #     file_path = self._convert_data(file_path)
-    #     session.add(
-    #         FilesMetadata(
-    #             filename=file_path,
-    #             processed=transcribed,
-    #         )
-    #     )
-    #     session.commit()
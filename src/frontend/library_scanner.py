@@ -0,0 +1,83 @@
+from pathlib import Path
+from typing import Iterable, Iterator, List
+import os
+from sqlmodel import Session
+
+from frontend.indexing_interface import IndexingInterface
+
+
+class LibraryScanner:
+    """Finds media files that aren't in the index yet and adds them.
+
+    The tree is walked with os.scandir, membership is checked against the index
+    in bulk, and new files are inserted a chunk at a time so results can be shown
+    while the scan is still running. Directories whose mtime hasn't changed since
+    the last scan have no new files, so only their subdirectories get visited.
+    """
+
+    def __init__(
+        self,
+        index_obj: IndexingInterface,
+        media_formats: Iterable[str],
+        chunk_size: int = 1000,
+    ):
+        self._index_obj = index_obj
+        self._media_formats = set(media_formats)
+        self._chunk_size = chunk_size
+
+    def is_media_file(self, file_path: str) -> bool:
+        return file_path.rpartition(".")[2] in self._media_formats
+
+    def walk(self, root: Path, known_mtimes: dict, seen_mtimes: dict) -> Iterator[str]:
+        """Yield the media files in directories whose mtime isn't in ``known_mtimes``,
+        recording the mtime of every visited directory in ``seen_mtimes``."""
+        directories = [str(root)]
+        while directories:
+            directory = directories.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                unchanged = known_mtimes.get(directory) == mtime
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif (
+                            not unchanged
+                            and self.is_media_file(entry.name)
+                            and entry.is_file()
+                        ):
+                            # same format as the paths DirectoryTree hands out
+                            yield str(Path(entry.path))
+            except OSError:
+                # unreadable or vanished while scanning, try again next time
+                continue
+            seen_mtimes[directory] = mtime
+
+    def scan(self, root: Path) -> Iterator[List[str]]:
+        """Index new media files under ``root``, yielding them a chunk at a time."""
+        with Session(self._index_obj.engine) as session:
+            known_mtimes = self._index_obj.get_directory_mtimes(session)
+            seen_mtimes = {}
+            chunk = []
+            for file_path in self.walk(root, known_mtimes, seen_mtimes):
+                chunk.append(file_path)
+                if len(chunk) >= self._chunk_size:
+                    yield self._index_chunk(session, chunk)
+                    chunk = []
+            if chunk:
+                yield self._index_chunk(session, chunk)
+            # only remembered once everything in them is indexed
+            self._index_obj.set_directory_mtimes(
+                session,
+                {
+                    directory: mtime
+                    for directory, mtime in seen_mtimes.items()
+                    if known_mtimes.get(directory) != mtime
+                },
+            )
+
+    def _index_chunk(self, session: Session, chunk: List[str]) -> List[str]:
+        indexed = self._index_obj.get_indexed(session, chunk)
+        new_files = [file_path for file_path in chunk if file_path not in indexed]
+        self._index_obj.add_to_index(session, new_files)
+        return new_files
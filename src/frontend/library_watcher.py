@@ -0,0 +1,196 @@
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+import os
+import threading
+from sqlmodel import Session
+
+from frontend.indexing_interface import IndexingInterface
+from frontend.library_scanner import LibraryScanner
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# how often the whole tree is walked again, when inotify isn't used
+POLL_INTERVAL = 60.0
+
+
+class _CandidateHandler(FileSystemEventHandler):
+    """Passes every created, modified or moved-in file on to the watcher."""
+
+    def __init__(self, add_candidate: Callable[[str], None]):
+        super().__init__()
+        self._add_candidate = add_candidate
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in (
+            "created",
+            "modified",
+            "moved",
+            "closed",
+        ):
+            return
+        self._add_candidate(getattr(event, "dest_path", None) or event.src_path)
+
+
+class LibraryWatcher:
+    """Indexes new media files under ``audio_dir`` as they show up.
+
+    Uses inotify (through watchdog) when it is installed, otherwise the tree is
+    walked every ``poll_interval`` seconds for directories whose mtime changed.
+    Pass ``force_polling`` for network mounts, inotify never sees the files other
+    clients write there. Polling also takes over when the watches can't be set up,
+    e.g. past the inotify watch limit.
+    A file is only indexed once its size hasn't changed for ``stable_seconds``,
+    so recordings that are still being written or copied aren't picked up half
+    way. Everything, setting up the watches included, happens on its own thread.
+    """
+
+    def __init__(
+        self,
+        index_obj: IndexingInterface,
+        audio_dir: Path,
+        media_formats: Iterable[str],
+        stable_seconds: float = 5.0,
+        poll_interval: float = POLL_INTERVAL,
+        force_polling: bool = False,
+        on_indexed: Optional[Callable[[List[str]], None]] = None,
+    ):
+        self._index_obj = index_obj
+        self._audio_dir = audio_dir
+        self._scanner = LibraryScanner(index_obj, media_formats)
+        self._stable_seconds = stable_seconds
+        self._poll_interval = poll_interval
+        self._force_polling = force_polling
+        self._on_indexed = on_indexed
+        self._lock = threading.Lock()
+        self._candidates: Set[str] = set()
+        # path -> (last seen size, monotonic time it was first seen at that size)
+        self._pending: Dict[str, Tuple[int, float]] = {}
+        self._stop = threading.Event()
+        self._watching = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self._known_mtimes: Dict[str, int] = {}
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._observer is not None
+
+    def add_candidate(self, file_path: str) -> None:
+        if self._scanner.is_media_file(file_path):
+            with self._lock:
+                # same format as the paths DirectoryTree hands out
+                self._candidates.add(str(Path(file_path)))
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="library-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def wait_until_watching(self, timeout: Optional[float] = None) -> bool:
+        """Wait until files that show up from now on are picked up."""
+        return self._watching.wait(timeout)
+
+    def stop(self) -> None:
+        """Ask the watcher to stop, without waiting for it.
+
+        Its thread may be waiting on ``on_indexed`` to run on the event loop this
+        is called from, so it is never joined here. It stops on its own.
+        """
+        self._stop.set()
+
+    def _watch(self) -> None:
+        if Observer is None:
+            logging.info("watchdog is not installed, polling %s", self._audio_dir)
+        elif not self._force_polling:
+            observer = Observer()
+            try:
+                # adds a watch for every directory, which takes a while on a big tree
+                observer.schedule(
+                    _CandidateHandler(self.add_candidate),
+                    str(self._audio_dir),
+                    recursive=True,
+                )
+                observer.start()
+            except OSError as exc:
+                logging.info("Can't watch %s, polling it: %s", self._audio_dir, exc)
+                observer.unschedule_all()
+            else:
+                self._observer = observer
+        if self._observer is None:
+            # only files that appear after this are picked up
+            for _ in self._scanner.walk(self._audio_dir, {}, self._known_mtimes):
+                if self._stop.is_set():
+                    return
+        self._watching.set()
+
+    def _poll(self) -> None:
+        seen_mtimes = {}
+        for file_path in self._scanner.walk(
+            self._audio_dir, self._known_mtimes, seen_mtimes
+        ):
+            self.add_candidate(file_path)
+        self._known_mtimes = seen_mtimes
+
+    def _run(self) -> None:
+        try:
+            self._watch()
+            polled = monotonic()
+            with Session(self._index_obj.engine) as session:
+                while not self._stop.wait(
+                    min(self._poll_interval, self._stable_seconds)
+                ):
+                    if (
+                        self._observer is None
+                        and monotonic() - polled >= self._poll_interval
+                    ):
+                        self._poll()
+                        polled = monotonic()
+                    ready = self._stable_files()
+                    if ready:
+                        self._index(session, ready)
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+    def _stable_files(self) -> List[str]:
+        with self._lock:
+            candidates, self._candidates = self._candidates, set()
+        now = monotonic()
+        for file_path in candidates:
+            if file_path not in self._pending:
+                self._pending[file_path] = (-1, now)
+
+        ready = []
+        for file_path, (size, since) in list(self._pending.items()):
+            try:
+                current_size = os.stat(file_path).st_size
+            except OSError:
+                # deleted or renamed before it settled
+                del self._pending[file_path]
+                continue
+            if current_size != size:
+                self._pending[file_path] = (current_size, now)
+            elif now - since >= self._stable_seconds:
+                del self._pending[file_path]
+                ready.append(file_path)
+        return ready
+
+    def _index(self, session: Session, file_paths: List[str]) -> None:
+        indexed = self._index_obj.get_indexed(session, file_paths)
+        new_files = [file_path for file_path in file_paths if file_path not in indexed]
+        if not new_files:
+            return
+        self._index_obj.add_to_index(session, new_files)
+        logging.debug("Watcher indexed %d new files", len(new_files))
+        # nobody is listening anymore once it was stopped
+        if self._on_indexed and not self._stop.is_set():
+            self._on_indexed(new_files)
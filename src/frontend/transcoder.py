@@ -0,0 +1,147 @@
+from contextlib import asynccontextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import AsyncIterator, Optional
+import asyncio
+import json
+import logging
+import os
+
+# whisper works on 16kHz mono audio
+SAMPLE_RATE = 16000
+# (ffmpeg arguments, file suffix) of every codec files can be transcoded to
+CODECS = {
+    "flac": (["-c:a", "flac", "-compression_level", "5"], ".flac"),
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip"], ".ogg"),
+}
+# audio-only sources at or below this many bits per second are sent as they are,
+# 16kHz mono 16 bit wav is 256 kbit/s and about halves as flac
+COMPACT_BITRATE = 128_000
+
+
+class Transcoder:
+    """Shrinks media files to 16kHz mono audio before they are uploaded.
+
+    Video tracks, extra channels and samples whisper would throw away anyway
+    are dropped by ffmpeg, ``workers`` files at a time. Audio-only files that are
+    already compact are passed through untouched. At most ``max_pending``
+    transcoded files wait for their upload, so they don't pile up on disk.
+    """
+
+    def __init__(
+        self,
+        codec: str = "flac",
+        workers: int = max(1, (os.cpu_count() or 1) // 2),
+        max_pending: Optional[int] = None,
+        compact_bitrate: int = COMPACT_BITRATE,
+    ):
+        self._codec_args, self._suffix = CODECS[codec]
+        self._compact_bitrate = compact_bitrate
+        self._workers = asyncio.Semaphore(workers)
+        self._pending = asyncio.Semaphore(max_pending or workers * 2)
+
+    async def _run(self, *cmd: str) -> bytes:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out, err = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"{cmd[0]} failed: {err.decode(errors='replace')}")
+        return out
+
+    async def is_compact(self, file_path: Path) -> bool:
+        """Whether the file is audio only, and either already 16kHz mono or of a
+        bitrate not worth reducing."""
+        probe = json.loads(
+            await self._run(
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration:stream=codec_type,sample_rate,channels,disposition",
+                "-of",
+                "json",
+                str(file_path),
+            )
+        )
+        audio_streams = []
+        for stream in probe.get("streams", []):
+            if stream.get("codec_type") == "audio":
+                audio_streams.append(stream)
+            # cover art shows up as a video stream, but costs next to nothing
+            elif stream.get("codec_type") == "video" and not stream.get(
+                "disposition", {}
+            ).get("attached_pic"):
+                return False
+        if audio_streams and all(
+            int(stream.get("sample_rate") or 0) <= SAMPLE_RATE
+            and stream.get("channels") == 1
+            for stream in audio_streams
+        ):
+            # nothing left to drop, probably transcoded before
+            return True
+        duration = float(probe.get("format", {}).get("duration") or 0)
+        if duration <= 0:
+            return False
+        return file_path.stat().st_size * 8 / duration <= self._compact_bitrate
+
+    @asynccontextmanager
+    async def prepared(self, file_path: Path) -> AsyncIterator[Path]:
+        """The file to upload instead of ``file_path``, removed once it's done."""
+        async with self._pending:
+            try:
+                async with self._workers:
+                    compact = await self.is_compact(file_path)
+            except (OSError, RuntimeError, ValueError) as exc:
+                # let the backend try to make sense of it
+                logging.debug("Could not probe %s: %s", file_path, exc)
+                compact = True
+            if compact:
+                yield file_path
+                return
+            with TemporaryDirectory(prefix="audio_wrangler_") as tmp_dir:
+                out_path = Path(tmp_dir) / f"{file_path.stem}{self._suffix}"
+                try:
+                    async with self._workers:
+                        await self._transcode(file_path, out_path)
+                except (OSError, RuntimeError) as exc:
+                    logging.debug("Could not transcode %s: %s", file_path, exc)
+                    out_path = file_path
+                yield out_path
+
+    async def _transcode(self, file_path: Path, out_path: Path) -> None:
+        await self._run(
+            "ffmpeg",
+            "-nostdin",
+            "-v",
+            "error",
+            "-i",
+            str(file_path),
+            # the first audio track only, without any video
+            "-map",
+            "0:a:0",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            *self._codec_args,
+            # the same bytes every time, so an interrupted upload can be resumed
+            "-fflags",
+            "+bitexact",
+            "-flags",
+            "+bitexact",
+            str(out_path),
+        )
+        logging.debug(
+            "Transcoded %s from %d to %d bytes",
+            file_path,
+            file_path.stat().st_size,
+            out_path.stat().st_size,
+        )
@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import json
+import os
+import re
+
+# a spoken "break" starts a new paragraph in the text transcript
+BREAK_PATTERN = re.compile(r"([Ee]-*|)(break|brake)[\W\s]*", re.IGNORECASE)
+# the end of BREAK_PATTERN, for when it carries on into the next segment
+BREAK_TAIL = re.compile(r"[\W\s]*")
+FORMATS = ("txt", "vtt", "srt", "tsv", "json")
+
+
+def format_timestamp(
+    seconds: float, always_include_hours: bool = False, decimal_marker: str = "."
+) -> str:
+    """The same timestamps whisper's subtitle writers use."""
+    milliseconds = round(seconds * 1000.0)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1_000)
+    hours_marker = f"{hours:02d}:" if always_include_hours or hours > 0 else ""
+    return (
+        f"{hours_marker}{minutes:02d}:{seconds:02d}{decimal_marker}{milliseconds:03d}"
+    )
+
+
+def break_text(text: str, after_break: bool) -> Tuple[str, bool]:
+    """Apply the break rule to the text of one segment, and whether the next one
+    continues right after a break."""
+    # the segments of the text transcript are joined by spaces
+    piece = text.replace("\n", " ") + " "
+    if after_break:
+        # a break eats the punctuation and spaces that follow it
+        piece = piece[BREAK_TAIL.match(piece).end() :]
+        if not piece:
+            return "", True
+    piece = BREAK_PATTERN.sub("\n", piece)
+    return piece, piece.endswith("\n")
+
+
+def render_transcripts(
+    transcription: dict, formats: Iterable[str] = FORMATS
+) -> Dict[str, str]:
+    """Render the transcript in every one of ``formats``, in one pass over its
+    segments.
+
+    The output is what whisper's writers produce for segments without word
+    timings, except that the text transcript has the break rule applied.
+    """
+    parts: Dict[str, List[str]] = {
+        output_format: [] for output_format in formats if output_format != "json"
+    }
+    if "vtt" in parts:
+        parts["vtt"].append("WEBVTT\n\n")
+    if "tsv" in parts:
+        parts["tsv"].append("start\tend\ttext\n")
+
+    after_break = False
+    for index, segment in enumerate(transcription["segments"], start=1):
+        text = segment["text"].strip()
+        if "txt" in parts:
+            piece, after_break = break_text(text, after_break)
+            parts["txt"].append(piece)
+        if "vtt" in parts:
+            parts["vtt"].append(
+                f"{format_timestamp(segment['start'])} --> "
+                f"{format_timestamp(segment['end'])}\n"
+                f"{text.replace('-->', '->')}\n\n"
+            )
+        if "srt" in parts:
+            parts["srt"].append(
+                f"{index}\n{format_timestamp(segment['start'], True, ',')} --> "
+                f"{format_timestamp(segment['end'], True, ',')}\n"
+                f"{text.replace('-->', '->')}\n\n"
+            )
+        if "tsv" in parts:
+            parts["tsv"].append(
+                f"{round(1000 * segment['start'])}\t{round(1000 * segment['end'])}\t"
+                f"{text.replace(chr(9), ' ')}\n"
+            )
+
+    rendered = {output_format: "".join(part) for output_format, part in parts.items()}
+    if "json" in formats:
+        rendered["json"] = json.dumps(transcription)
+    return rendered
+
+
+def write_transcripts(
+    transcription: dict, media_file: Path, formats: Iterable[str] = FORMATS
+) -> Dict[str, Path]:
+    """Write the transcript next to ``media_file``, one file per format.
+
+    Every file is written under a temporary name and then moved into place, so
+    a transcript is either complete or not there at all.
+    """
+    written = {}
+    for output_format, content in render_transcripts(transcription, formats).items():
+        output_path = media_file.with_suffix(f".{output_format}")
+        tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, output_path)
+        written[output_format] = output_path
+    return written
@@ -1,26 +1,37 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 from pathlib import Path
-import re
 from time import monotonic
 from argparse import ArgumentParser
-from typing import Dict, Iterable, Set
-from asyncio import create_task
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from asyncio import (
+    Queue,
+    Semaphore,
+    create_task,
+    gather,
+    get_running_loop,
+    sleep,
+    to_thread,
+)
+from queue import SimpleQueue
+import threading
+import json
 
-from sqlmodel import Session, select
-from whisper.utils import get_writer
-from textual import on
+from sqlmodel import Session
+from textual import on, work
 from textual.app import App
 from textual.widgets import (
     Header,
     Footer,
     Button,
     Static,
-    Label,
     ContentSwitcher,
     DirectoryTree,
     DataTable,
+    Input,
+    Log,
 )
 from textual.widgets.data_table import DuplicateKey
 from textual.containers import (
@@ -33,16 +44,18 @@ from textual.containers import (
 )
 from textual.reactive import reactive
 from textual.logging import TextualHandler
-from httpx import AsyncClient
-from sqlmodel import update
+from httpx import HTTPError
 
-from models.db_models import FilesMetadata
+from models.db_models import FileState, FilesMetadata
 from backend.whisper_interface import WhisperInterface
+from frontend.backend_pool import BackendPool, Node
+from frontend.content_hasher import ContentHasher
 from frontend.indexing_interface import IndexingInterface
+from frontend.library_scanner import LibraryScanner
+from frontend.library_watcher import LibraryWatcher
+from frontend.transcoder import CODECS, Transcoder
+from frontend.transcript_writer import format_timestamp, write_transcripts
 
-
-# Define the pattern
-BREAK_PATTERN = re.compile(r"([Ee]-*|)(break|brake)[\W\s]*", re.IGNORECASE)
 COMMON_AUDIO_N_VIDEO_FORMATS = {
     # https://github.com/h2non/filetype.py?tab=readme-ov-file#video
     "3gp",
@@ -67,25 +80,49 @@ COMMON_AUDIO_N_VIDEO_FORMATS = {
     "aiff",
 }
 
+EVENTS_RECONNECT_DELAY = 5
+# transcripts downloaded and written at the same time
+RESULT_DOWNLOADS = 4
+# files written next to every transcribed media file
+OUTPUT_FORMATS = ("txt", "vtt", "json")
+# search hits shown at once
+SEARCH_LIMIT = 200
+# (label, key) of the search results table columns
+SEARCH_COLUMNS = (
+    ("File Name", "filename"),
+    ("Start", "start"),
+    ("End", "end"),
+    ("Text", "text"),
+)
+# how often backends are asked for their load, and queued tasks moved between them
+BALANCE_INTERVAL = 10
+# how often a row's upload progress is redrawn
+UPLOAD_PROGRESS_INTERVAL = 0.5
+# (label, key) of the new jobs table columns
+NEW_JOB_COLUMNS = (
+    ("File Path", "filename"),
+    ("Processed", "processed"),
+    ("Upload", "upload"),
+)
+# (label, key) of the running jobs table columns
+JOB_COLUMNS = (
+    ("File Name", "filename"),
+    ("State", "state"),
+    ("Progress", "progress"),
+    ("Node", "node"),
+    ("Task ID", "task_id"),
+)
+
 logging.basicConfig(level="NOTSET", handlers=[TextualHandler()])
 
 
-def modify_text_output(file_written: Path) -> None:
-    minified_lines = " ".join(file_written.read_text().split("\n"))
-    file_written.write_text(BREAK_PATTERN.sub("\n", minified_lines))
-    return file_written
+def write_transcription(transcription: dict, input_file: Path) -> Path:
+    """Write the transcript next to the media file it is of."""
+    return write_transcripts(transcription, input_file, OUTPUT_FORMATS)["txt"]
 
 
 def process_transcription(wsp: WhisperInterface, input_file: Path) -> Path:
-    output_formats = {"txt", "vtt"}  # or "vtt", "tsv", "json", or "all"
-
-    transcribed_text = wsp.transcribe(input_file)
-
-    for output_format in output_formats:
-        writer = get_writer(output_format, str(input_file.parent))
-        writer(transcribed_text, str(input_file))
-
-    return modify_text_output(input_file.with_suffix(".txt"))
+    return write_transcription(wsp.transcribe(input_file), input_file)
 
 
 class TimeDisplay(Static):
@@ -166,11 +203,9 @@ class AudioDirectoryTree(DirectoryTree):
         only_files=False,
     ) -> Iterable[Path]:
 
-        paths = {
-            path
-            for path in paths
-            if not IndexingInterface.get_index(self._session, path)
-        }
+        paths = set(paths)
+        indexed = IndexingInterface.get_indexed(self._session, paths)
+        paths = {path for path in paths if str(path) not in indexed}
         if only_files:
             paths = {path for path in paths if path.is_file()}
         return self.filter_media_files(paths)
@@ -195,10 +230,14 @@ class AudioWranglerIndexer(Static):
         *args,
         audio_dir: Path,
         index_obj: IndexingInterface,
+        hasher: ContentHasher,
         **kwargs,
     ):
         self._audio_dir = audio_dir
         self._index_obj = index_obj
+        self._hasher = hasher
+        # batches of scanned files for the hashing worker, None once the scan is done
+        self._unhashed: "SimpleQueue[Optional[List[str]]]" = SimpleQueue()
         self._session = Session(self._index_obj.engine)
         super().__init__(*args, **kwargs)
 
@@ -242,28 +281,35 @@ class AudioWranglerIndexer(Static):
 
     @on(Button.Pressed, "#add-all-files")
     def add_all_files(self):
-        dt = self.query_one(DataTable)
-        dt.clear()
-        self.on_mount()
-        all_files = set(self._audio_dir.glob("**/*"))
-        all_files.update(self._audio_dir.glob("./*"))
-
-        files = self.query_one(AudioDirectoryTree).filter_paths(
-            all_files,
-            only_files=True,
-        )
-        # files = AudioDirectoryTree.filter_media_files(
-        #     all_files,
-        #     only_files=True,
-        # )
-        for filez in files:
-            dt.add_row(*(str(filez), "yes"), key=str(filez))
-            self._session.add(FilesMetadata(filename=str(filez), processed=False))
-
-        self._session.commit()
-        self._session.close()
-
         self.query_one("#add-all-files").disabled = True
+        self.hash_library()
+        self.scan_library()
+
+    @work(thread=True, exclusive=True)
+    def scan_library(self) -> None:
+        scanner = LibraryScanner(self._index_obj, COMMON_AUDIO_N_VIDEO_FORMATS)
+        try:
+            for new_files in scanner.scan(self._audio_dir):
+                if new_files:
+                    self.app.call_from_thread(self.add_table_rows, new_files)
+                    self._unhashed.put(new_files)
+        finally:
+            self._unhashed.put(None)
+
+    @work(thread=True, exclusive=True, group="hashing")
+    def hash_library(self) -> None:
+        """Hash the scanned files behind the scan, so copies are known by the time
+        the files are submitted."""
+        while (new_files := self._unhashed.get()) is not None:
+            self._hasher.hash_files(new_files)
+
+    def add_table_rows(self, file_paths: Iterable[str]) -> None:
+        dt = self.query_one(DataTable)
+        for file_path in file_paths:
+            try:
+                dt.add_row(*(file_path, "yes"), key=file_path)
+            except DuplicateKey:
+                logging.debug("File %s already in table", file_path)
 
     # def watch_not_indexed_file(self):
     #     logging.debug("########## REACHED ##########")
@@ -276,12 +322,26 @@ class AudioWrangerJobs(Static):
         self,
         *args,
         index_obj: IndexingInterface,
-        api_host: str,
+        backends: BackendPool,
+        hasher: ContentHasher,
         **kwargs,
     ):
         self._index_obj = index_obj
-        self._api_host = api_host
+        self._backends = backends
+        self._hasher = hasher
         self._session = Session(self._index_obj.engine)
+        # the last task version seen on every node, so only changes are fetched
+        self._tasks_versions: Dict[str, int] = {}
+        # the node every task in the running jobs table is on, and its state
+        self._task_nodes: Dict[str, Node] = {}
+        self._task_states: Dict[str, str] = {}
+        # the file every task we submitted is of, until its transcript is written
+        self._results: Dict[str, Path] = {}
+        # byte for byte copies of a submitted file, that get its transcript
+        self._copies: Dict[str, List[str]] = {}
+        self._downloads = Semaphore(RESULT_DOWNLOADS)
+        # files that are being uploaded, or whose transcript hasn't been written yet
+        self._submitting: Set[str] = set()
         super().__init__(*args, **kwargs)
 
     def compose(self):
@@ -290,91 +350,364 @@ class AudioWrangerJobs(Static):
                 yield DataTable(id="jobs-new-table")
                 with Container():
                     yield Button("Start Jobs", id="jobs-start")
-            yield DataTable(id="jobs-running-table")
+            with Vertical(id="jobs-running"):
+                yield DataTable(id="jobs-running-table", cursor_type="row")
+                yield Log(id="jobs-segments")
 
     def on_mount(self):
         new_table = self.query_one("#jobs-new-table", DataTable)
-        new_table.add_columns(*("File Path", "Processed"))
+        for label, key in NEW_JOB_COLUMNS:
+            new_table.add_column(label, key=key)
         self.check_new_jobs()
         self.set_interval(5, self.check_new_jobs)
 
         current_jobs_table = self.query_one("#jobs-running-table", DataTable)
-        current_jobs_table.add_columns(*("File Name", "State", "Task ID"))
-        self.launch_async_task()
-        self.set_interval(5, self.launch_async_task)
+        for label, key in JOB_COLUMNS:
+            current_jobs_table.add_column(label, key=key)
+        self.restore_jobs()
+        for node in self._backends.nodes:
+            self.follow_task_events(node)
+        self.balance_backends()
+
+    def restore_jobs(self) -> None:
+        """Pick up the files queued before a restart, the events replayed from
+        every node fetch the transcripts of those that finished meanwhile."""
+        nodes = {node.name: node for node in self._backends.nodes}
+        for queued in IndexingInterface.get_queued(self._session):
+            node = nodes.get(queued.node)
+            if node is None:
+                logging.debug("%s is queued on an unknown node", queued.filename)
+                continue
+            file_path = Path(queued.filename)
+            self._results[queued.task_id] = file_path
+            self._submitting.add(queued.filename)
+            # it can still be moved while it hasn't started
+            self._backends.submitted[queued.task_id] = (node, file_path)
 
     def check_new_jobs(self) -> None:
         new_table = self.query_one("#jobs-new-table", DataTable)
-        new_jobs = self._session.exec(
-            select(FilesMetadata).where(FilesMetadata.processed == False)
-        ).all()
+        new_jobs = IndexingInterface.get_pending(self._session)
         for new_job in new_jobs:
             try:
-                new_table.add_row(*(new_job.filename, "no"), key=new_job.filename)
+                new_table.add_row(*(new_job.filename, "no", ""), key=new_job.filename)
             except DuplicateKey:
                 logging.debug("File %s already in table", new_job.filename)
 
-    def launch_async_task(self) -> None:
-        create_task(self.check_current_jobs())
-
-    async def check_current_jobs(self) -> None:
-        url = f"{self._api_host}/tasks"
-        async with AsyncClient() as client:
-            # this is tasks in: src/backend/app.py
-            results: Dict[
-                str,
-                Dict[
-                    str,
-                    str
-                    | Dict[
-                        str,
-                        str | list,
-                    ],
-                ],
-            ] = (await client.get(url)).json()
-
+    @work(group="task-events")
+    async def follow_task_events(self, node: Node) -> None:
+        """Keep the running jobs table in sync with a node's /events stream."""
+        while True:
+            try:
+                async for task in node.api.task_events(
+                    self._tasks_versions.get(node.name, 0)
+                ):
+                    self.update_job_row(node, task)
+                    # resume from here if the connection drops
+                    self._tasks_versions[node.name] = task["version"]
+            except HTTPError as exc:
+                logging.debug("Task events connection to %s lost: %s", node.name, exc)
+            await sleep(EVENTS_RECONNECT_DELAY)
+
+    @work(exclusive=True, group="balancing")
+    async def balance_backends(self) -> None:
+        """Move queued files off nodes that fell behind the others."""
+        while True:
+            await sleep(BALANCE_INTERVAL)
+            await self._backends.refresh()
+            moved = await self._backends.rebalance()
+            for _, file_path in moved:
+                self.set_upload_status(file_path, "moving")
+                self._submitting.discard(str(file_path))
+            if moved:
+                self.submit_files([str(file_path) for _, file_path in moved])
+
+    def update_job_row(self, node: Node, task: Dict[str, str | float]) -> None:
         current_jobs_table = self.query_one("#jobs-running-table", DataTable)
-        current_jobs_table.clear()
-        if results:
-            # current_jobs_table.add_columns(*("File Name", "State", "Task ID"))
-            for k, v in results.items():
-                try:
-                    current_jobs_table.add_row(*(v["filename"], v["state"], k), key=k)
-                except DuplicateKey:
-                    logging.debug("Task %s already in table", k)
+        if task["state"] != "queued":
+            self._backends.forget(task["id"])
+        if task["state"] == "cancelled":
+            # moved to another node, where it shows up under a new id
+            if task["id"] in current_jobs_table.rows:
+                current_jobs_table.remove_row(task["id"])
+            self._task_nodes.pop(task["id"], None)
+            self._task_states.pop(task["id"], None)
+            self._results.pop(task["id"], None)
+            return
+        self._task_nodes[task["id"]] = node
+        self._task_states[task["id"]] = task["state"]
+        if task["state"] == "completed" and task["id"] in self._results:
+            self.fetch_result(node, task["id"])
+        elif task["state"] == "failed" and task["id"] in self._results:
+            self.finish_job(self._results.pop(task["id"]), "failed")
+        row = {
+            "filename": task["filename"],
+            "state": task["state"],
+            "progress": f"{task['progress']:.0%}",
+            "node": node.name,
+            "task_id": task["id"],
+        }
+        if task["id"] in current_jobs_table.rows:
+            for column_key, value in row.items():
+                current_jobs_table.update_cell(task["id"], column_key, value)
+        else:
+            current_jobs_table.add_row(*row.values(), key=task["id"])
+
+    @on(DataTable.RowSelected, "#jobs-running-table")
+    def select_job(self, event: DataTable.RowSelected) -> None:
+        self.follow_task_segments(event.row_key.value)
+
+    @work(exclusive=True, group="task-segments")
+    async def follow_task_segments(self, task_id: str) -> None:
+        """Show the transcript of a job, segment by segment as it is decoded."""
+        segments_log = self.query_one("#jobs-segments", Log)
+        segments_log.clear()
+        node = self._task_nodes.get(task_id)
+        if node is None:
+            return
+        try:
+            # this is get_task_segments in: src/backend/app.py
+            async with node.api.client.stream(
+                "GET", f"/tasks/{task_id}/segments", timeout=None
+            ) as response:
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    segment = json.loads(line)
+                    segments_log.write_line(
+                        f"[{segment['start']:.1f}-{segment['end']:.1f}]"
+                        f"{segment['text']}"
+                    )
+        except HTTPError as exc:
+            logging.debug("Segment stream of task %s lost: %s", task_id, exc)
 
     @on(Button.Pressed, "#jobs-start")
     def start_jobs(self) -> None:
         logging.debug("Starting jobs")
-        new_table = self.query_one("#jobs-new-table", DataTable)
-        files = self._session.exec(
-            select(FilesMetadata).where(FilesMetadata.processed == False)
-        ).all()
-        for filez in files:
-            create_task(self.start_job(Path(filez.filename)))
-        # for row_key in new_table.rows:
-        #     logging.debug("Row key: %s", str(row_key))
-        #     for row in new_table.get_row(row_key):
-        #         logging.debug("Row: %s", "\n".join(row))
-        #         if row[1] == "no":
-        #             create_task(self.start_job(new_table, Path(row[0])))
+        files = IndexingInterface.get_pending(self._session)
+        self.submit_files([filez.filename for filez in files])
+
+    @work(group="uploads")
+    async def submit_files(self, file_paths: List[str]) -> None:
+        """Upload the files, the BackendPool limits how many go at once.
+
+        Files are hashed in a thread, and every file is submitted as soon as its
+        hash shows it isn't a copy of one that is submitted or transcribed already.
+        Copies are in ``_copies`` under the file that is submitted for them.
+        """
+        file_paths = [
+            file_path for file_path in file_paths if file_path not in self._submitting
+        ]
+        self._submitting.update(file_paths)
+        hashes: "Queue[Optional[Tuple[str, str]]]" = Queue()
+        loop = get_running_loop()
+        stopped = threading.Event()
+
+        def hash_files() -> None:
+            try:
+                for hashed in self._hasher.iter_hashes(file_paths):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(hashes.put_nowait, hashed)
+            finally:
+                loop.call_soon_threadsafe(hashes.put_nowait, None)
+
+        hashing = create_task(to_thread(hash_files))
+        unhashed = set(file_paths)
+        # the file submitted for each content hash
+        representatives: Dict[str, str] = {}
+        jobs = []
+        try:
+            while (hashed := await hashes.get()) is not None:
+                file_path, content_hash = hashed
+                unhashed.discard(file_path)
+                representative = representatives.get(content_hash)
+                if representative in self._submitting:
+                    self._copies.setdefault(representative, []).append(file_path)
+                    self.set_upload_status(Path(file_path), "copy")
+                    continue
+                transcribed_copy = await to_thread(
+                    self.find_transcribed_copy, content_hash
+                )
+                if transcribed_copy is not None and await self.inherit_transcript(
+                    Path(transcribed_copy), [file_path]
+                ):
+                    continue
+                representatives[content_hash] = file_path
+                jobs.append(create_task(self.start_job(Path(file_path))))
+            await hashing
+            # files that aren't indexed or couldn't be read are sent as they are
+            jobs.extend(
+                create_task(self.start_job(Path(file_path)))
+                for file_path in sorted(unhashed)
+            )
+            await gather(*jobs)
+        finally:
+            stopped.set()
+            for job in jobs:
+                job.cancel()
+
+    def find_transcribed_copy(self, content_hash: str) -> Optional[str]:
+        """A transcribed file with the content hash, runs in a thread."""
+        with Session(self._index_obj.engine) as session:
+            transcribed_copies = IndexingInterface.get_transcribed_copies(
+                session, [content_hash]
+            )
+        return transcribed_copies.get(content_hash)
+
+    async def inherit_transcript(self, copy_path: Path, file_paths: List[str]) -> bool:
+        """Write the transcript of an earlier transcribed copy for the files."""
+        try:
+            transcription = json.loads(
+                await to_thread(copy_path.with_suffix(".json").read_text)
+            )
+        except (OSError, ValueError) as exc:
+            # submitted after all
+            logging.debug("No transcript next to %s: %s", copy_path, exc)
+            return False
+        for file_path in file_paths:
+            await self.save_result(Path(file_path), transcription)
+        return True
 
     async def start_job(self, file_path: Path) -> None:
-        url = f"{self._api_host}/transcribe"
-        headers = {"Filename": file_path.name}
-        files = {"file": (file_path.name, open(file_path.absolute(), "rb"))}
-
-        async with AsyncClient() as client:
-            response = await client.post(url, headers=headers, files=files)
-
-        if response.status_code == 200:
-            self._session.exec(
-                update(FilesMetadata)
-                .where(FilesMetadata.filename == file_path)
-                .values(processed=True)
+        last_update = 0.0
+        uploaded = False
+
+        def on_progress(sent: int, total: int, elapsed: float) -> None:
+            nonlocal last_update, uploaded
+            uploaded = True
+            if sent < total and elapsed - last_update < UPLOAD_PROGRESS_INTERVAL:
+                return
+            last_update = elapsed
+            throughput = sent / max(elapsed, 1e-3) / 1e6
+            self.set_upload_status(
+                file_path, f"{sent / max(total, 1):.0%} {throughput:.1f} MB/s"
+            )
+
+        try:
+            node, response = await self._backends.submit(
+                file_path, on_progress=on_progress
+            )
+        except (HTTPError, OSError) as exc:
+            logging.debug("Upload of %s failed: %s", file_path, exc)
+            self.finish_job(file_path, "failed")
+            return
+
+        # files in a shared directory are only sent by path
+        self.set_upload_status(file_path, "done" if uploaded else "shared")
+        task_id = response["task_id"]
+        IndexingInterface.set_state(
+            self._session,
+            file_path,
+            FileState.queued,
+            response.get("duration"),
+            task_id=task_id,
+            node=node.name,
+        )
+        if "transcription" in response:
+            # transcribed before, the backend answered from its cache
+            await self.save_result(file_path, response["transcription"])
+            return
+        self._results[task_id] = file_path
+        if self._task_states.get(task_id) == "completed":
+            # finished before we heard back from the upload
+            self.fetch_result(node, task_id)
+
+    @work(group="results")
+    async def fetch_result(self, node: Node, task_id: str) -> None:
+        """Download the transcript of a finished task and write it out."""
+        # replayed events don't fetch it twice
+        file_path = self._results.pop(task_id, None)
+        if file_path is None:
+            return
+        async with self._downloads:
+            try:
+                transcription = await node.api.fetch_result(task_id)
+            except (HTTPError, ValueError) as exc:
+                logging.debug("Could not fetch the result of %s: %s", task_id, exc)
+                self.finish_job(file_path, "fetch failed")
+                return
+            await self.save_result(file_path, transcription)
+
+    async def save_result(self, file_path: Path, transcription: dict) -> None:
+        try:
+            await to_thread(write_transcription, transcription, file_path)
+            await to_thread(self.index_transcript, file_path, transcription)
+        except OSError as exc:
+            logging.debug("Could not write the transcript of %s: %s", file_path, exc)
+            self.finish_job(file_path, "write failed")
+            return
+
+        # only now that the transcript is on disk, so nothing is ever lost
+        IndexingInterface.set_state(self._session, file_path, FileState.transcribed)
+        self.finish_job(file_path, "written")
+        for copy_path in self._copies.pop(str(file_path), []):
+            await self.save_result(Path(copy_path), transcription)
+        new_table = self.query_one("#jobs-new-table", DataTable)
+        if str(file_path) in new_table.rows:
+            new_table.update_cell(str(file_path), "processed", "yes")
+
+    def index_transcript(self, file_path: Path, transcription: dict) -> None:
+        """Make the transcript searchable, runs in a thread."""
+        with Session(self._index_obj.engine) as session:
+            IndexingInterface.add_transcript(
+                session, file_path, transcription["segments"]
+            )
+
+    def finish_job(self, file_path: Path, upload_status: str) -> None:
+        """Done with the file one way or another, it can be submitted again."""
+        self._submitting.discard(str(file_path))
+        if upload_status != "written":
+            IndexingInterface.set_state(self._session, file_path, FileState.failed)
+            for copy_path in self._copies.pop(str(file_path), []):
+                self.finish_job(Path(copy_path), upload_status)
+        self.set_upload_status(file_path, upload_status)
+
+    def set_upload_status(self, file_path: Path, upload_status: str) -> None:
+        new_table = self.query_one("#jobs-new-table", DataTable)
+        if str(file_path) in new_table.rows:
+            new_table.update_cell(str(file_path), "upload", upload_status)
+
+
+class TranscriptSearch(Static):
+    """Full-text search over every transcript that was written."""
+
+    def __init__(self, *args, index_obj: IndexingInterface, **kwargs):
+        self._index_obj = index_obj
+        super().__init__(*args, **kwargs)
+
+    def compose(self):
+        with Vertical():
+            yield Input(
+                placeholder="Search transcripts, word* matches the start of a word",
+                id="search-input",
+            )
+            yield DataTable(id="search-results", cursor_type="row")
+
+    def on_mount(self):
+        results_table = self.query_one("#search-results", DataTable)
+        for label, key in SEARCH_COLUMNS:
+            results_table.add_column(label, key=key)
+
+    @on(Input.Submitted, "#search-input")
+    def start_search(self, event: Input.Submitted) -> None:
+        self.search(event.value)
+
+    @work(thread=True, exclusive=True, group="search")
+    def search(self, query: str) -> None:
+        with Session(self._index_obj.engine) as session:
+            hits = IndexingInterface.search(session, query, limit=SEARCH_LIMIT)
+        self.app.call_from_thread(self.show_hits, hits)
+
+    def show_hits(self, hits: List[dict]) -> None:
+        results_table = self.query_one("#search-results", DataTable)
+        results_table.clear()
+        for hit in hits:
+            results_table.add_row(
+                Path(hit["filename"]).name,
+                format_timestamp(hit["start_ms"] / 1000),
+                format_timestamp(hit["end_ms"] / 1000),
+                hit["text"],
             )
-            self._session.commit()
-            self._session.close()
 
 
 class AudioWranglerApp(App):
@@ -382,14 +715,44 @@ class AudioWranglerApp(App):
     def __init__(
         self,
         *args,
-        api_host: str,
+        api_hosts: List[str],
         audio_dir: Path,
         index_obj: IndexingInterface,
+        watch: bool = False,
+        force_polling: bool = False,
+        stable_seconds: float = 5.0,
+        auto_submit: bool = False,
+        max_uploads: int = 4,
+        upload_rate: Optional[float] = None,
+        transcoder: Optional[Transcoder] = None,
+        priority: int = 0,
+        hasher: Optional[ContentHasher] = None,
         **kwargs,
     ):
-        self._api_host = api_host
+        self._api_hosts = api_hosts
+        self._hasher = hasher or ContentHasher(index_obj)
+        self._backends = BackendPool(
+            api_hosts,
+            max_uploads=max_uploads,
+            upload_rate=upload_rate,
+            transcoder=transcoder,
+            priority=priority,
+        )
         self._audio_dir = audio_dir
         self._index_obj = index_obj
+        self._auto_submit = auto_submit
+        self._watcher = None
+        if watch:
+            self._watcher = LibraryWatcher(
+                index_obj,
+                audio_dir,
+                COMMON_AUDIO_N_VIDEO_FORMATS,
+                stable_seconds=stable_seconds,
+                force_polling=force_polling,
+                on_indexed=lambda new_files: self.call_from_thread(
+                    self.add_watched_files, new_files
+                ),
+            )
         super().__init__(*args, **kwargs)
 
     BINDINGS = [
@@ -409,7 +772,7 @@ class AudioWranglerApp(App):
         with Horizontal(id="main"):
             # with Container(id="data-wranglers"):
             with VerticalScroll(id="wranglers"):
-                # yield Label(self._api_host)
+                # yield Label(self._api_hosts)
                 # yield Label(str(self._audio_dir))
                 # yield AudioWrangler()
                 # yield AudioWrangler()
@@ -424,8 +787,8 @@ class AudioWranglerApp(App):
                     classes="content-switcher-button",
                 )
                 yield Button(
-                    "File Metadata",
-                    id="metadata",
+                    "Search",
+                    id="transcript-search",
                     classes="content-switcher-button",
                 )
             with ContentSwitcher(id="data-view", initial="indexer"):
@@ -433,13 +796,33 @@ class AudioWranglerApp(App):
                     yield AudioWranglerIndexer(
                         audio_dir=self._audio_dir,
                         index_obj=self._index_obj,
+                        hasher=self._hasher,
                     )
                 yield AudioWrangerJobs(
                     id="current-jobs",
                     index_obj=self._index_obj,
-                    api_host=self._api_host,
+                    backends=self._backends,
+                    hasher=self._hasher,
                 )
-                yield Label("Data View: File Metadata", id="metadata")
+                yield TranscriptSearch(
+                    id="transcript-search", index_obj=self._index_obj
+                )
+
+    def on_mount(self):
+        if self._watcher:
+            self._watcher.start()
+
+    async def on_unmount(self):
+        if self._watcher:
+            self._watcher.stop()
+        await self._backends.aclose()
+
+    def add_watched_files(self, new_files: List[str]) -> None:
+        self.query_one(AudioWranglerIndexer).add_table_rows(new_files)
+        jobs = self.query_one(AudioWrangerJobs)
+        jobs.check_new_jobs()
+        if self._auto_submit:
+            jobs.submit_files(new_files)
 
     def action_toggle_dark_mode(self):
         self.dark = not self.dark
@@ -465,13 +848,76 @@ class AudioWranglerApp(App):
 def main():
     parser = ArgumentParser()
     parser.add_argument(
-        "api_endpoint", help="API endpoint for the speech-to-text service"
+        "api_endpoints",
+        nargs="+",
+        help="API endpoints of the speech-to-text services, files are spread over them",
     )
     parser.add_argument(
         "audio_dir",
         type=Path,
         help="Directory containing the audio files to be processed",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Index new media files in audio_dir as they appear",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Make --watch walk audio_dir for new files instead of using inotify, "
+        "which misses files other clients write to a network mount",
+    )
+    parser.add_argument(
+        "--stable-seconds",
+        type=float,
+        default=5.0,
+        help="How long a new file's size has to stay the same before it is indexed",
+    )
+    parser.add_argument(
+        "--auto-submit",
+        action="store_true",
+        help="Submit files found by --watch for transcription right away",
+    )
+    parser.add_argument(
+        "--max-uploads",
+        type=int,
+        default=4,
+        help="How many files are uploaded at the same time",
+    )
+    parser.add_argument(
+        "--upload-rate",
+        type=float,
+        help="Limit the total upload speed, in MB/s",
+    )
+    parser.add_argument(
+        "--transcode",
+        choices=list(CODECS),
+        help="Shrink files to 16kHz mono audio in this codec before uploading",
+    )
+    parser.add_argument(
+        "--transcode-workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 1) // 2),
+        help="How many files are transcoded at the same time",
+    )
+    parser.add_argument(
+        "--priority",
+        type=int,
+        default=0,
+        help="Queue priority of the submitted files, from -10 to 10",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=4,
+        help="How many files are hashed at the same time to find copies",
+    )
+    parser.add_argument(
+        "--hash-rate",
+        type=float,
+        help="Limit how fast files are read for hashing, in MB/s",
+    )
     args = parser.parse_args()
     # all_files = Path("/tmp/").glob("*")
     # wsp = WhisperInterface()
@@ -499,9 +945,26 @@ def main():
     # print(index.bulk_validate(session, [input_file]))
     # print(index.get_index(session, input_file))
     AudioWranglerApp(
-        api_host=args.api_endpoint,
+        api_hosts=args.api_endpoints,
         audio_dir=args.audio_dir,
         index_obj=index_obj,
+        watch=args.watch,
+        force_polling=args.poll,
+        stable_seconds=args.stable_seconds,
+        auto_submit=args.auto_submit,
+        max_uploads=args.max_uploads,
+        upload_rate=args.upload_rate * 1e6 if args.upload_rate else None,
+        transcoder=(
+            Transcoder(args.transcode, workers=args.transcode_workers)
+            if args.transcode
+            else None
+        ),
+        priority=args.priority,
+        hasher=ContentHasher(
+            index_obj,
+            workers=args.hash_workers,
+            rate=args.hash_rate * 1e6 if args.hash_rate else None,
+        ),
     ).run()
 
 
@@ -1,9 +1,50 @@
+from enum import Enum
 from pathlib import Path
 from pydantic import field_validator
 from sqlmodel import SQLModel, Field
 
 
+class FileState(str, Enum):
+    """Where a file is on its way to a transcript."""
+
+    new = "new"
+    queued = "queued"
+    transcribed = "transcribed"
+    failed = "failed"
+
+
 class FilesMetadata(SQLModel, table=True):
     filename: str = Field(primary_key=True, unique=True)
     summary: str | None = None
+    # whether its transcript was written, the unprocessed ones have their own index
     processed: bool
+    size: int | None = None
+    mtime_ns: int | None = None
+    content_hash: str | None = Field(default=None, index=True)
+    # seconds of audio, as the backend measured it
+    duration: float | None = None
+    state: FileState = FileState.new
+    # the task a queued file is on the backend, and that backend's url, so its
+    # transcript is still fetched after a restart
+    task_id: str | None = None
+    node: str | None = None
+    created_at: float | None = None
+    updated_at: float | None = None
+
+
+class ScannedDirectory(SQLModel, table=True):
+    """The mtime of a library directory the last time its files were indexed."""
+
+    path: str = Field(primary_key=True)
+    mtime_ns: int
+
+
+class TranscriptSegment(SQLModel, table=True):
+    """A segment of a file's transcript, searchable through the transcript_search
+    full-text index that IndexingInterface keeps in sync with this table."""
+
+    id: int | None = Field(default=None, primary_key=True)
+    filename: str = Field(foreign_key="filesmetadata.filename", index=True)
+    start_ms: int
+    end_ms: int
+    text: str
@@ -7,6 +7,8 @@ from sqlmodel import Session
 
 # extend the path to include the src directory
 sys.path.append(str(Path(Path(__file__).parent.parent / "src").absolute()))
+# the backend modules import each other the same way app.py does
+sys.path.append(str(Path(Path(__file__).parent.parent / "src" / "backend").absolute()))
 
 # pylint: disable=wrong-import-position; needed to import the classes from the src directory
 from frontend.indexing_interface import IndexingInterface
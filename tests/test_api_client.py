@@ -0,0 +1,145 @@
+from time import monotonic
+import asyncio
+import gzip
+import json
+import httpx
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import ValueTarget
+
+from frontend.api_client import ApiClient, TokenBucket
+
+
+def test_upload_streams_multipart(tmp_path):
+    """The hand built multipart body parses the same way the backend parses it."""
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(b"\x00\x01" * 1_500_000)
+    received = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        target = ValueTarget()
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register("file", target)
+        parser.data_received(request.read())
+        received.update(
+            filename=request.headers["Filename"],
+            multipart_filename=target.multipart_filename,
+            value=target.value,
+        )
+        return httpx.Response(200, json={"task_id": "abc"})
+
+    async def upload():
+        api = ApiClient("http://backend")
+        api.client = httpx.AsyncClient(
+            base_url="http://backend", transport=httpx.MockTransport(handler)
+        )
+        progress = []
+        response = await api.upload(
+            media_file, on_progress=lambda sent, total, _: progress.append(sent)
+        )
+        await api.aclose()
+        return response, progress
+
+    response, progress = asyncio.run(upload())
+    assert response == {"task_id": "abc"}
+    assert received["filename"] == received["multipart_filename"] == "recording.wav"
+    assert received["value"] == media_file.read_bytes()
+    assert progress[-1] == media_file.stat().st_size
+
+
+def test_token_bucket():
+    async def consume():
+        bucket = TokenBucket(rate=1000)
+        start = monotonic()
+        # the first 1000 bytes are the initial burst, the next 500 take half a second
+        for _ in range(3):
+            await bucket.consume(500)
+        return monotonic() - start
+
+    assert 0.4 < asyncio.run(consume()) < 1.0
+
+
+def test_submit_by_path(tmp_path):
+    """Files in a shared directory are sent by path, everything else is uploaded."""
+    shared_file = tmp_path / "shared" / "recording.wav"
+    shared_file.parent.mkdir()
+    shared_file.write_bytes(b"\x00")
+    local_file = tmp_path / "local.wav"
+    local_file.write_bytes(b"\x00")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        if request.url.path == "/info":
+            return httpx.Response(
+                200, json={"shared_roots": [str(shared_file.parent)]}
+            )
+        return httpx.Response(200, json={"task_id": "abc"})
+
+    async def submit():
+        api = ApiClient("http://backend")
+        api.client = httpx.AsyncClient(
+            base_url="http://backend", transport=httpx.MockTransport(handler)
+        )
+        await api.submit(shared_file)
+        await api.submit(local_file)
+        await api.aclose()
+
+    asyncio.run(submit())
+    assert requests == ["/info", "/transcribe-path", "/transcribe"]
+
+
+def test_fetch_result_gzipped():
+    transcription = {"text": " hello", "segments": [{"start": 0, "end": 1}] * 100}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/tasks/abc/result"
+        assert "gzip" in request.headers["Accept-Encoding"]
+        return httpx.Response(
+            200,
+            content=gzip.compress(json.dumps(transcription).encode()),
+            headers={"Content-Encoding": "gzip"},
+        )
+
+    async def fetch():
+        api = ApiClient("http://backend")
+        api.client = httpx.AsyncClient(
+            base_url="http://backend", transport=httpx.MockTransport(handler)
+        )
+        result = await api.fetch_result("abc")
+        await api.aclose()
+        return result
+
+    assert asyncio.run(fetch()) == transcription
+
+
+def test_task_events_skip_bad_lines():
+    """A malformed or incomplete event is skipped, the ones after it still come."""
+    task = {
+        "id": "abc",
+        "version": 3,
+        "state": "running",
+        "filename": "memo.wav",
+        "progress": 0.5,
+    }
+    incomplete = {key: value for key, value in task.items() if key != "version"}
+    body = "".join(
+        f"id: {index}\nevent: task\ndata: {data}\n\n"
+        for index, data in enumerate(
+            ['{"id": "ab', json.dumps(incomplete), json.dumps(task)]
+        )
+    )
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.params["since"] == "2"
+        return httpx.Response(200, text=body)
+
+    async def events():
+        api = ApiClient("http://backend")
+        api.client = httpx.AsyncClient(
+            base_url="http://backend", transport=httpx.MockTransport(handler)
+        )
+        received = [event async for event in api.task_events(since=2)]
+        await api.aclose()
+        return received
+
+    assert asyncio.run(events()) == [task]
@@ -0,0 +1,372 @@
+from collections import OrderedDict
+from pathlib import Path
+from tempfile import mkdtemp
+from time import monotonic, sleep
+import asyncio
+import io
+import json
+import os
+import threading
+import numpy as np
+from fastapi.testclient import TestClient
+from pytest import fixture
+
+# the app sets up its caches when it is imported
+os.environ.setdefault("TRANSCRIPTION_CACHE_DIR", mkdtemp())
+
+# pylint: disable=wrong-import-position
+from backend import app as backend
+from backend.scheduler import TaskScheduler
+from backend.task_store import TaskStore
+from backend.transcription_cache import TranscriptionCache
+
+SAMPLE_RATE = 16000
+
+
+class FakePCMCache:
+    """The uploads of these tests are already decoded .npy files."""
+
+    def prefetch(self, key: str, audio_path: Path) -> None:
+        pass
+
+    async def get(self, key: str, audio_path: Path) -> Path:
+        return audio_path
+
+    def release(self, key: str) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FakePool:
+    """Stands in for the worker processes, every call takes ``delay`` seconds."""
+
+    def __init__(self, workers: int, delay: float = 0.0):
+        self.workers = workers
+        self.delay = delay
+        # (started at, task or batch of filenames) of every call
+        self.calls = []
+        # set to let the calls finish, for tests that look at the queue meanwhile
+        self.release = None
+
+    def start(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def _filename(npy_path: Path) -> str:
+        return next(
+            task.filename for task in backend.tasks.values() if task.path == npy_path
+        )
+
+    async def _run(self, names) -> None:
+        self.calls.append((monotonic(), names))
+        if self.release is not None:
+            await asyncio.to_thread(self.release.wait)
+        await asyncio.sleep(self.delay)
+
+    async def transcribe(self, model_name, npy_path, start=0, end=None, stream_id=None):
+        name = self._filename(npy_path)
+        segments = [
+            {"id": index, "seek": 0, "start": index, "end": index + 1, "text": text}
+            for index, text in enumerate([f" {name}", " done"])
+        ]
+        if stream_id is not None:
+            backend.add_live_segment(stream_id, backend.segment_summary(segments[0]))
+        await self._run(name)
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": "en",
+        }
+
+    async def transcribe_batch(self, model_name, npy_paths):
+        names = [self._filename(npy_path) for npy_path in npy_paths]
+        await self._run(names)
+        return [
+            {"text": f" {name}", "segments": [], "language": "en"} for name in names
+        ]
+
+
+@fixture
+def pool(tmp_path, monkeypatch):
+    """A fresh backend state with a fake pool of two workers."""
+    fake_pool = FakePool(workers=2)
+    monkeypatch.setattr(backend, "transcription_pool", fake_pool)
+    monkeypatch.setattr(backend, "pcm_cache", FakePCMCache())
+    monkeypatch.setattr(backend, "task_store", TaskStore(tmp_path / "tasks.db"))
+    monkeypatch.setattr(
+        backend,
+        "transcription_cache",
+        TranscriptionCache(tmp_path / "cache", 1024 * 1024),
+    )
+    monkeypatch.setattr(backend, "task_queue", TaskScheduler())
+    monkeypatch.setattr(backend, "tasks", OrderedDict())
+    monkeypatch.setattr(backend, "tasks_version", 0)
+    monkeypatch.setattr(backend, "tasks_changed", asyncio.Event())
+    monkeypatch.setattr(backend, "segments_changed", asyncio.Event())
+    monkeypatch.setattr(backend, "UPLOAD_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(backend, "BATCH_MAX_WAIT", 0.1)
+    monkeypatch.setattr(backend, "EVENTS_KEEPALIVE", 0.01)
+    # the durations are read from the .npy files, ffprobe can't
+    monkeypatch.setattr(
+        backend,
+        "probe_duration",
+        lambda path: len(np.load(path, mmap_mode="r")) / SAMPLE_RATE,
+    )
+    return fake_pool
+
+
+@fixture
+def client(pool):
+    with TestClient(backend.app) as test_client:
+        yield test_client
+        # calls still held back would keep the workers from stopping
+        if pool.release is not None:
+            pool.release.set()
+
+
+def npy_bytes(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32))
+    return buffer.getvalue()
+
+
+def submit(client: TestClient, name: str, seconds: float, **headers) -> str:
+    response = client.post(
+        "/transcribe",
+        headers={"Filename": name, **headers},
+        files={"file": (name, npy_bytes(seconds))},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["task_id"]
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, "timed out"
+        sleep(0.01)
+
+
+def states(client: TestClient, task_ids) -> list:
+    return [client.get(f"/tasks/{task_id}").json()["state"] for task_id in task_ids]
+
+
+def test_transcribe_and_fetch_result(client):
+    task_id = submit(client, "memo.npy", 2)
+    wait_for(lambda: states(client, [task_id]) == ["completed"])
+
+    task = client.get(f"/tasks/{task_id}").json()
+    assert task["transcription"]["text"].endswith("done")
+    assert task["duration"] == 2
+    result = client.get(f"/tasks/{task_id}/result", headers={"Accept-Encoding": "gzip"})
+    assert result.headers["Content-Encoding"] == "gzip"
+    assert result.json() == task["transcription"]
+    # the upload is removed once it was transcribed
+    wait_for(lambda: not list(backend.UPLOAD_DIR.iterdir()))
+
+
+def test_unknown_model_is_refused(client):
+    response = client.post(
+        "/transcribe",
+        headers={"Filename": "memo.npy", "Model": "/tmp/checkpoint.pt"},
+        files={"file": ("memo.npy", npy_bytes(1))},
+    )
+    assert response.status_code == 422
+    assert client.get("/tasks").json()["tasks"] == []
+
+
+def test_tasks_delta_and_paging(client):
+    task_ids = [submit(client, f"{index}.npy", 1) for index in range(3)]
+    wait_for(lambda: states(client, task_ids) == ["completed"] * 3)
+
+    first = client.get("/tasks", params={"limit": 2}).json()
+    assert len(first["tasks"]) == 2
+    second = client.get("/tasks", params={"since": first["next"], "limit": 2}).json()
+    assert second["next"] is None
+    # every task once, with its latest change
+    summaries = first["tasks"] + second["tasks"]
+    assert sorted(summary["id"] for summary in summaries) == sorted(task_ids)
+    assert all(summary["state"] == "completed" for summary in summaries)
+
+    # nothing changed since the last poll
+    latest = client.get("/tasks", params={"since": second["version"]}).json()
+    assert latest["tasks"] == []
+    assert latest["version"] == second["version"]
+
+
+def test_tasks_paging_is_validated(client):
+    for params in ({"limit": 0}, {"limit": -1}, {"since": -1}):
+        assert client.get("/tasks", params=params).status_code == 422
+
+
+def test_task_events(client):
+    task_id = submit(client, "memo.npy", 1)
+    wait_for(lambda: states(client, [task_id]) == ["completed"])
+
+    class Request:
+        """Disconnects after the events that were already there."""
+
+        polls = 0
+
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls > 1
+
+    async def events(since: int) -> list:
+        return [event async for event in backend.task_events(Request(), since)]
+
+    # on the loop of the app, which its events are bound to
+    replayed = [
+        event for event in client.portal.call(events, 0) if event.startswith("id:")
+    ]
+    assert replayed[-1].startswith(f"id: {backend.tasks_version}\nevent: task\n")
+    assert json.loads(replayed[-1].split("data: ")[1])["state"] == "completed"
+    # resuming from the last id only keeps the connection alive
+    assert client.portal.call(events, backend.tasks_version) == [": keep-alive\n\n"]
+
+
+def test_malformed_last_event_id(client):
+    response = client.get("/events", headers={"Last-Event-ID": "not a version"})
+    assert response.status_code == 422
+
+
+def test_segments_stream(client, pool):
+    task_id = submit(client, "memo.npy", 1)
+    wait_for(lambda: states(client, [task_id]) == ["completed"])
+
+    lines = client.get(f"/tasks/{task_id}/segments").text.splitlines()
+    assert [json.loads(line)["text"] for line in lines] == [
+        " memo.npy",
+        " done",
+    ]
+    assert client.get("/tasks/unknown/segments").status_code == 404
+
+
+def test_short_uploads_are_batched(client, pool):
+    pool.release = threading.Event()
+    # keeps both workers busy while the short ones are queued
+    long_ids = [submit(client, f"long{index}.npy", 60) for index in range(2)]
+    wait_for(lambda: len(pool.calls) == 2)
+    short_ids = [submit(client, f"short{index}.npy", 5) for index in range(3)]
+    pool.release.set()
+    wait_for(lambda: states(client, long_ids + short_ids) == ["completed"] * 5)
+
+    batches = [names for _, names in pool.calls if isinstance(names, list)]
+    assert batches == [["short0.npy", "short1.npy", "short2.npy"]]
+    assert client.get(f"/tasks/{short_ids[0]}").json()["transcription"]["text"] == (
+        " short0.npy"
+    )
+
+
+def test_batching_leaves_long_tasks_queued(client, pool):
+    """Tasks that can't join a batch stay in the queue for the other workers."""
+    pool.release = threading.Event()
+    long_ids = [submit(client, "l1.npy", 60)]
+    wait_for(lambda: len(pool.calls) == 1)
+    short_id = submit(client, "s5.npy", 5)
+    long_ids += [submit(client, f"l{index}.npy", 60) for index in (2, 3)]
+    # one worker is on l1, the other one on s5 once it gave up on a batch
+    wait_for(lambda: len(pool.calls) == 2)
+
+    queued = client.get("/queue").json()
+    assert [task["id"] for task in queued["tasks"]] == long_ids[1:]
+    assert client.get("/load").json()["queue_depth"] == 2
+    assert client.delete(f"/tasks/{long_ids[2]}").status_code == 200
+
+    pool.release.set()
+    wait_for(lambda: states(client, long_ids[:2] + [short_id]) == ["completed"] * 3)
+    assert [names for _, names in pool.calls] == ["l1.npy", "s5.npy", "l2.npy"]
+    assert states(client, long_ids[2:]) == ["cancelled"]
+
+
+def test_misjudged_tasks_go_back_to_the_queue(client, pool, monkeypatch):
+    """A task that turns out to be too long for a batch is transcribed on its own."""
+    # as if ffprobe couldn't read them, and their size was all there was to go by
+    monkeypatch.setattr(backend, "probe_duration", lambda path: 5.0)
+    pool.release = threading.Event()
+    busy_ids = [submit(client, f"busy{index}.npy", 1) for index in range(2)]
+    wait_for(lambda: len(pool.calls) == 2)
+    task_ids = [
+        submit(client, name, seconds) for name, seconds in (("a", 5), ("b", 45))
+    ]
+    pool.release.set()
+    wait_for(lambda: states(client, busy_ids + task_ids) == ["completed"] * 4)
+
+    # neither of them in a batch, where b would have been cut short
+    assert sorted(names for _, names in pool.calls[2:]) == ["a", "b"]
+    assert client.get(f"/tasks/{task_ids[1]}").json()["duration"] == 45
+
+
+def test_failed_uploads_are_removed(client, monkeypatch):
+    monkeypatch.setattr(backend, "MAX_FILE_SIZE", 1000)
+    response = client.post(
+        "/transcribe",
+        headers={"Filename": "memo.npy"},
+        files={"file": ("memo.npy", npy_bytes(1))},
+    )
+    assert response.status_code == 413
+    response = client.post(
+        "/transcribe", headers={"Filename": "memo.npy"}, files={"data": ("x", b"x")}
+    )
+    assert response.status_code == 422
+    assert not list(backend.UPLOAD_DIR.iterdir())
+
+
+def test_disconnected_upload_is_not_queued(client):
+    body = client.build_request(
+        "POST", "/transcribe", files={"file": ("memo.npy", npy_bytes(1))}
+    )
+    content = body.read()
+    messages = [
+        {
+            "type": "http.request",
+            "body": content[: len(content) // 2],
+            "more_body": True,
+        },
+        {"type": "http.disconnect"},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    request = backend.Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/transcribe",
+            "headers": [
+                (b"filename", b"memo.npy"),
+                (b"content-type", body.headers["Content-Type"].encode()),
+            ],
+        },
+        receive,
+    )
+
+    async def upload():
+        return await backend.upload(None, request)
+
+    assert client.portal.call(upload) is None
+    assert not backend.tasks
+    assert not list(backend.UPLOAD_DIR.iterdir())
+
+
+def test_tasks_are_stored_off_the_event_loop(client, monkeypatch):
+    saved_from = []
+    save = backend.task_store.save
+
+    def recording_save(*args):
+        saved_from.append(threading.current_thread())
+        save(*args)
+
+    monkeypatch.setattr(backend.task_store, "save", recording_save)
+    task_id = submit(client, "memo.npy", 1)
+    wait_for(lambda: states(client, [task_id]) == ["completed"])
+
+    # queued, processing and completed
+    assert len(saved_from) >= 3
+    assert client.portal.call(threading.current_thread) not in saved_from
@@ -0,0 +1,170 @@
+import asyncio
+import httpx
+
+from frontend import api_client
+from frontend.backend_pool import BackendPool
+
+
+def make_pool(handlers: dict) -> BackendPool:
+    pool = BackendPool(list(handlers), rebalance_threshold=100)
+    for node in pool.nodes:
+        node.api.client = httpx.AsyncClient(
+            base_url=node.name, transport=httpx.MockTransport(handlers[node.name])
+        )
+    return pool
+
+
+def backend(backlog: float, requests: list, queue=(), down=False):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if down:
+            raise httpx.ConnectError("Connection refused", request=request)
+        requests.append((request.method, request.url.path))
+        if request.url.path == "/load":
+            return httpx.Response(
+                200,
+                json={
+                    "backlog_seconds": backlog,
+                    "seconds_per_audio_second": 1.0,
+                    "workers": 1,
+                    "queue_depth": len(queue),
+                },
+            )
+        if request.url.path == "/info":
+            return httpx.Response(200, json={"shared_roots": []})
+        if request.url.path == "/queue":
+            offset = int(request.url.params.get("offset", 0))
+            limit = int(request.url.params["limit"])
+            return httpx.Response(
+                200, json={"tasks": list(queue)[offset : offset + limit]}
+            )
+        if request.method == "DELETE":
+            return httpx.Response(200, json={})
+        return httpx.Response(
+            200, json={"task_id": f"task-{len(requests)}", "duration": 60.0}
+        )
+
+    return handler
+
+
+def test_submit_to_least_loaded(tmp_path):
+    """Files go to the healthy node with the shortest backlog."""
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(b"\x00")
+    busy, idle, dead = [], [], []
+
+    async def submit():
+        pool = make_pool(
+            {
+                "http://busy": backend(500, busy),
+                "http://idle": backend(0, idle),
+                "http://dead": backend(0, dead, down=True),
+            }
+        )
+        nodes = [(await pool.submit(media_file))[0].name for _ in range(3)]
+        await pool.aclose()
+        return nodes
+
+    # every submit adds a minute to the idle node's backlog
+    assert asyncio.run(submit()) == ["http://idle"] * 3
+    assert ("POST", "/transcribe") not in busy
+
+
+def test_rebalance_moves_own_queued_tasks(tmp_path):
+    """Queued tasks we submitted are taken back from a node that fell behind."""
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(b"\x00")
+    slow, fast = [], []
+    queue = [
+        {"id": "other", "position": 0, "eta": 0, "duration": 600.0},
+        {"id": "mine", "position": 1, "eta": 600, "duration": 600.0},
+    ]
+
+    async def rebalance():
+        pool = make_pool(
+            {
+                "http://slow": backend(1200, slow, queue=queue),
+                "http://fast": backend(0, fast),
+            }
+        )
+        await pool.refresh()
+        pool.submitted["mine"] = (pool.nodes[0], media_file)
+        moved = await pool.rebalance()
+        await pool.aclose()
+        return moved
+
+    assert asyncio.run(rebalance()) == [("mine", media_file)]
+    assert ("DELETE", "/tasks/mine") in slow
+    assert ("DELETE", "/tasks/other") not in slow
+
+
+def test_rebalance_moves_the_end_of_a_long_queue(tmp_path):
+    """The tasks that would start last are moved, even past the first page."""
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(b"\x00")
+    slow, fast = [], []
+    queue = [
+        {"id": f"task-{index}", "position": index, "eta": index, "duration": 400.0}
+        for index in range(300)
+    ]
+
+    async def rebalance():
+        pool = make_pool(
+            {
+                "http://slow": backend(600, slow, queue=queue),
+                "http://fast": backend(0, fast),
+            }
+        )
+        await pool.refresh()
+        for task_id in ("task-5", "task-290"):
+            pool.submitted[task_id] = (pool.nodes[0], media_file)
+        moved = await pool.rebalance()
+        await pool.aclose()
+        return moved
+
+    # half of the difference is 300 seconds, a single task covers that
+    assert asyncio.run(rebalance()) == [("task-290", media_file)]
+
+
+def test_interrupted_upload_resumes_on_the_same_node(tmp_path, monkeypatch):
+    """A flaky upload is resumed where it stopped, not sent again elsewhere."""
+    monkeypatch.setattr(api_client, "RESUMABLE_MIN_SIZE", 10)
+    monkeypatch.setattr(api_client, "RESUMABLE_CHUNK_SIZE", 10)
+    monkeypatch.setattr(api_client, "RESUMABLE_RETRIES", 1)
+    monkeypatch.setattr(api_client, "RESUMABLE_RETRY_DELAY", 0)
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(bytes(range(50)))
+    received = bytearray()
+    chunks = 0
+    other = []
+
+    def flaky(request: httpx.Request) -> httpx.Response:
+        nonlocal chunks
+        if request.url.path in ("/load", "/info"):
+            return backend(0, [])(request)
+        if request.url.path == "/uploads":
+            return httpx.Response(200, json={"upload_id": "up"})
+        if request.method == "GET":
+            return httpx.Response(
+                200, json={"upload_id": "up", "offset": len(received), "size": 50}
+            )
+        if request.method == "PUT":
+            chunks += 1
+            # one chunk gets through, then the next two fail and the upload gives up
+            if chunks % 3 != 1:
+                raise httpx.ConnectError("Connection reset", request=request)
+            received.extend(request.read())
+            return httpx.Response(200, json={"offset": len(received)})
+        return httpx.Response(200, json={"task_id": "task", "duration": 3.0})
+
+    async def submit():
+        pool = make_pool({"http://flaky": flaky, "http://other": backend(50, other)})
+        node, response = await pool.submit(media_file)
+        await pool.aclose()
+        return node.name, response
+
+    assert asyncio.run(submit()) == (
+        "http://flaky",
+        {"task_id": "task", "duration": 3.0},
+    )
+    assert bytes(received) == media_file.read_bytes()
+    assert ("POST", "/uploads") not in other
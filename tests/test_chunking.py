@@ -0,0 +1,101 @@
+import numpy as np
+
+from backend.chunking import (
+    SAMPLE_RATE,
+    join_regions,
+    restore_timestamps,
+    speech_regions,
+    split_audio,
+    stitch_transcriptions,
+)
+
+
+def make_audio(speech_seconds, silence_seconds, repeats):
+    """Return alternating blocks of noise ("speech") and silence."""
+    rng = np.random.default_rng(0)
+    speech = rng.uniform(-0.5, 0.5, int(speech_seconds * SAMPLE_RATE))
+    silence = np.zeros(int(silence_seconds * SAMPLE_RATE))
+    return np.concatenate([np.concatenate([speech, silence])] * repeats).astype(
+        np.float32
+    )
+
+
+def test_split_audio_at_silence():
+    # 50s of speech followed by 10s of silence, for 10 minutes
+    audio = make_audio(50, 10, 10)
+    chunks = split_audio(audio, chunk_seconds=120)
+
+    assert len(chunks) > 1
+    assert sum(len(chunk) for _, chunk in chunks) == len(audio)
+    for offset, _ in chunks[1:]:
+        # every split lands inside of a silent block
+        assert offset % 60 >= 50
+
+
+def test_split_short_audio():
+    audio = make_audio(20, 5, 1)
+    assert len(split_audio(audio, chunk_seconds=120)) == 1
+
+
+def test_stitch_transcriptions():
+    results = [
+        (
+            0.0,
+            {
+                "text": " Hello there.",
+                "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": 2.0}],
+                "language": "en",
+            },
+        ),
+        (
+            60.0,
+            {
+                "text": " General Kenobi.",
+                "segments": [{"id": 0, "seek": 0, "start": 1.0, "end": 3.0}],
+                "language": "en",
+            },
+        ),
+    ]
+    stitched = stitch_transcriptions(results)
+
+    assert stitched["text"] == " Hello there. General Kenobi."
+    assert stitched["language"] == "en"
+    assert [segment["id"] for segment in stitched["segments"]] == [0, 1]
+    assert stitched["segments"][1]["start"] == 61.0
+    assert stitched["segments"][1]["end"] == 63.0
+    assert stitched["segments"][1]["seek"] == 6000
+
+
+def test_speech_regions():
+    # 5s of speech followed by 20s of silence, three times
+    audio = make_audio(5, 20, 3)
+    regions = speech_regions(audio, padding_seconds=0.0)
+
+    assert len(regions) == 3
+    for index, (start, end) in enumerate(regions):
+        assert abs(start / SAMPLE_RATE - index * 25) < 0.1
+        assert abs(end / SAMPLE_RATE - (index * 25 + 5)) < 0.1
+    assert speech_regions(np.zeros(SAMPLE_RATE * 10, dtype=np.float32)) == []
+
+
+def test_restore_timestamps():
+    audio = make_audio(5, 20, 3)
+    regions = speech_regions(audio, padding_seconds=0.0)
+    joined, offsets = join_regions(audio, regions, gap_seconds=0.5)
+    # three regions of 5s and two gaps
+    assert abs(len(joined) / SAMPLE_RATE - 16) < 0.1
+
+    result = {
+        "text": " One. Two.",
+        "segments": [
+            {"id": 0, "seek": 0, "start": 1.0, "end": 2.0},
+            # starts in the second region of the joined audio
+            {"id": 1, "seek": 0, "start": 6.0, "end": 7.0},
+        ],
+        "language": "en",
+    }
+    restored = restore_timestamps(result, offsets)
+    assert restored["text"] == result["text"]
+    assert abs(restored["segments"][0]["start"] - 1.0) < 0.1
+    assert abs(restored["segments"][1]["start"] - 25.5) < 0.1
+    assert abs(restored["segments"][1]["end"] - 26.5) < 0.1
@@ -0,0 +1,22 @@
+from backend.compare_engines import EXAMPLE_TRANSCRIPT, word_error_rate
+
+
+def test_word_error_rate(transcribed_file):
+    assert word_error_rate(transcribed_file, transcribed_file) == 0
+    # case and punctuation are ignored
+    assert (
+        word_error_rate(
+            "So I propose to build it better.", "so i propose to build it better"
+        )
+        == 0
+    )
+    # one substitution and one deletion out of seven words
+    assert word_error_rate(
+        "So I propose to build it better.", "So I propose to make it"
+    ) == 2 / 7
+    assert word_error_rate("", "") == 0
+
+
+def test_example_transcript(transcribed_file):
+    # the default reference, nothing is scored against its own output
+    assert EXAMPLE_TRANSCRIPT == transcribed_file
@@ -0,0 +1,67 @@
+import hashlib
+import os
+from sqlmodel import Session
+
+from frontend.content_hasher import ContentHasher, hash_file
+from models.db_models import FileState
+
+
+def test_hash_file(tmp_path):
+    media_file = tmp_path / "recording.wav"
+    media_file.write_bytes(os.urandom(100_000))
+    empty_file = tmp_path / "empty.wav"
+    empty_file.touch()
+
+    assert hash_file(str(media_file), chunk_size=4096) == (
+        hashlib.sha256(media_file.read_bytes()).hexdigest()
+    )
+    assert hash_file(str(empty_file)) == hashlib.sha256().hexdigest()
+
+
+def test_hash_files_finds_copies(db, tmp_path):
+    paths = [str(tmp_path / name) for name in ("one.wav", "copy.wav", "other.wav")]
+    for path, content in zip(paths, (b"same", b"same", b"different")):
+        with open(path, "wb") as file_handle:
+            file_handle.write(content)
+    with Session(db.engine) as session:
+        db.add_to_index(session, paths)
+    hasher = ContentHasher(db, workers=2, rate=1_000_000)
+
+    hashes = hasher.hash_files(paths)
+    assert hashes[paths[0]] == hashes[paths[1]] != hashes[paths[2]]
+
+    # same size and mtime, so it isn't read again
+    stat = os.stat(paths[2])
+    with open(paths[2], "wb") as file_handle:
+        file_handle.write(b"DIFFERENT")
+    os.utime(paths[2], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert hasher.hash_files(paths) == hashes
+    # a new mtime is
+    os.utime(paths[2], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert hasher.hash_files(paths)[paths[2]] != hashes[paths[2]]
+
+    with Session(db.engine) as session:
+        db.set_state(session, paths[1], FileState.transcribed)
+        assert db.get_transcribed_copies(session, [hashes[paths[0]]]) == {
+            hashes[paths[0]]: paths[1]
+        }
+
+
+def test_iter_hashes_known_first(db, tmp_path):
+    """Unchanged files come first, the others as they are hashed."""
+    paths = [str(tmp_path / f"{index}.wav") for index in range(3)]
+    for path in paths:
+        with open(path, "wb") as file_handle:
+            file_handle.write(path.encode())
+    with Session(db.engine) as session:
+        db.add_to_index(session, paths)
+    hasher = ContentHasher(db, workers=1)
+    known = hasher.hash_files(paths[2:])
+
+    hashes = hasher.iter_hashes(paths)
+    assert next(hashes) == (paths[2], known[paths[2]])
+    # the hash of a file is stored even when the caller stops early
+    hashed_path, _ = next(hashes)
+    hashes.close()
+    with Session(db.engine) as session:
+        assert db.get_files(session, [hashed_path])[hashed_path].content_hash
@@ -1,6 +1,10 @@
+import sqlite3
 import pytest
+from sqlalchemy import text
+from sqlmodel import Session
 
-from models.db_models import FilesMetadata
+from frontend.indexing_interface import IndexingInterface
+from models.db_models import FileState, FilesMetadata
 
 
 def test_bulk_validation(session, example_file, faker):
@@ -25,3 +29,104 @@ def test_bulk_validation(session, example_file, faker):
                 ),
             ],
         )
+
+
+def test_add_to_index(session, example_file):
+    session.db_obj.add_to_index(session.session, [example_file])
+    # adding the same file again is a no-op
+    session.db_obj.add_to_index(session.session, [example_file])
+
+    assert session.db_obj.get_indexed(
+        session.session, [example_file, "not/indexed.wav"]
+    ) == {str(example_file)}
+    indexed = session.db_obj.get_index(session.session, example_file)
+    assert not indexed.processed
+    assert indexed.state == FileState.new
+    assert indexed.size == example_file.stat().st_size
+
+
+def test_search_transcripts(session, example_file):
+    session.db_obj.add_to_index(session.session, [example_file, "other.wav"])
+    session.db_obj.add_transcript(
+        session.session,
+        example_file,
+        [
+            {"start": 0.0, "end": 4.2, "text": " There's just config drift."},
+            {"start": 4.2, "end": 9.0, "text": " So I propose to build it better."},
+        ],
+    )
+    session.db_obj.add_transcript(
+        session.session,
+        "other.wav",
+        [{"start": 1.5, "end": 2.0, "text": " Proposals, proposals."}],
+    )
+
+    hits = session.db_obj.search(session.session, "proposed BUILD")
+    assert hits == [
+        {
+            "filename": str(example_file),
+            "start_ms": 4200,
+            "end_ms": 9000,
+            "text": "So I propose to build it better.",
+        }
+    ]
+    # prefix search, and the repeated word ranks higher
+    assert [
+        hit["filename"] for hit in session.db_obj.search(session.session, "propos*")
+    ] == [
+        "other.wav",
+        str(example_file),
+    ]
+    # FTS5 syntax is taken literally
+    assert session.db_obj.search(session.session, 'config-drift" (') != []
+    assert session.db_obj.search(session.session, "") == []
+
+    # a new transcript replaces the old one
+    session.db_obj.add_transcript(session.session, example_file, [])
+    assert session.db_obj.search(session.session, "drift") == []
+
+
+def test_migrate_old_index(tmp_path):
+    """Databases from before the richer schema get its columns and indexes."""
+    db_path = tmp_path / "index.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE filesmetadata (filename VARCHAR NOT NULL PRIMARY KEY, "
+        "summary VARCHAR, processed BOOLEAN NOT NULL)"
+    )
+    conn.executemany(
+        "INSERT INTO filesmetadata VALUES (?, NULL, ?)",
+        [("done.wav", True), ("waiting.wav", False)],
+    )
+    conn.commit()
+    conn.close()
+
+    index = IndexingInterface(conn_str=f"sqlite:///{db_path}")
+    with Session(index.engine) as session:
+        assert index.get_index(session, "done.wav").state == FileState.transcribed
+        assert [file.filename for file in index.get_pending(session)] == ["waiting.wav"]
+
+        index.set_state(
+            session,
+            "waiting.wav",
+            FileState.queued,
+            duration=12.5,
+            task_id="abc",
+            node="http://backend",
+        )
+        waiting = index.get_index(session, "waiting.wav")
+        assert (waiting.state, waiting.duration) == (FileState.queued, 12.5)
+        # the task is known after a restart
+        assert [
+            (queued.filename, queued.task_id, queued.node)
+            for queued in index.get_queued(session)
+        ] == [("waiting.wav", "abc", "http://backend")]
+        index.set_state(session, "waiting.wav", FileState.transcribed)
+        assert not index.get_pending(session)
+        assert not index.get_queued(session)
+
+        plan = session.execute(
+            text("EXPLAIN QUERY PLAN SELECT * FROM filesmetadata WHERE processed = 0")
+        ).all()
+        assert "ix_filesmetadata_pending" in plan[0][-1]
+        assert session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
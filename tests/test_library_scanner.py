@@ -0,0 +1,26 @@
+import os
+
+from frontend.library_scanner import LibraryScanner
+
+
+def test_library_scan(db, tmp_path):
+    (tmp_path / "nested").mkdir()
+    for name in ("one.wav", "two.mp3", "notes.txt", "nested/three.flac"):
+        (tmp_path / name).touch()
+    scanner = LibraryScanner(db, {"wav", "mp3", "flac"}, chunk_size=2)
+
+    found = [file_path for chunk in scanner.scan(tmp_path) for file_path in chunk]
+    assert sorted(found) == sorted(
+        str(tmp_path / name) for name in ("one.wav", "two.mp3", "nested/three.flac")
+    )
+
+    # nothing changed, so nothing new is found
+    assert not [file_path for chunk in scanner.scan(tmp_path) for file_path in chunk]
+
+    (tmp_path / "nested" / "four.wav").touch()
+    # make sure the mtime changes on filesystems with a coarse resolution
+    stat = os.stat(tmp_path / "nested")
+    os.utime(tmp_path / "nested", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert [file_path for chunk in scanner.scan(tmp_path) for file_path in chunk] == [
+        str(tmp_path / "nested" / "four.wav")
+    ]
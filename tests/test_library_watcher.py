@@ -0,0 +1,108 @@
+from time import monotonic, sleep
+import threading
+
+from sqlmodel import Session
+
+from frontend.indexing_interface import IndexingInterface
+from frontend import library_watcher
+from frontend.library_watcher import LibraryWatcher
+
+
+def test_watcher_indexes_new_files(tmp_path):
+    # the watcher runs in its own thread, so it can't share an in-memory database
+    index_obj = IndexingInterface(conn_str=f"sqlite:///{tmp_path / 'index.db'}")
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    indexed = []
+    watcher = LibraryWatcher(
+        index_obj,
+        audio_dir,
+        {"wav"},
+        stable_seconds=0.5,
+        poll_interval=0.1,
+        on_indexed=indexed.extend,
+    )
+    watcher.start()
+    assert watcher.wait_until_watching(timeout=5)
+    try:
+        (audio_dir / "new.wav").write_bytes(b"RIFF")
+        (audio_dir / "notes.txt").write_bytes(b"not media")
+        for _ in range(50):
+            if indexed:
+                break
+            sleep(0.1)
+    finally:
+        watcher.stop()
+
+    assert indexed == [str(audio_dir / "new.wav")]
+    with Session(index_obj.engine) as session:
+        assert index_obj.get_index(session, audio_dir / "new.wav")
+
+
+def test_stop_does_not_wait_for_the_watcher(tmp_path):
+    """stop() returns while on_indexed is still waiting on the caller."""
+    index_obj = IndexingInterface(conn_str=f"sqlite:///{tmp_path / 'index.db'}")
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    called, release = threading.Event(), threading.Event()
+
+    def on_indexed(new_files):
+        called.set()
+        release.wait()
+
+    watcher = LibraryWatcher(
+        index_obj,
+        audio_dir,
+        {"wav"},
+        stable_seconds=0.1,
+        poll_interval=0.1,
+        on_indexed=on_indexed,
+    )
+    watcher.start()
+    assert watcher.wait_until_watching(timeout=5)
+    (audio_dir / "new.wav").write_bytes(b"RIFF")
+    assert called.wait(timeout=5)
+    start = monotonic()
+    watcher.stop()
+    assert monotonic() - start < 0.1
+    release.set()
+
+
+class FailingObserver:
+    """An observer that runs into the inotify watch limit."""
+
+    def schedule(self, *args, **kwargs):
+        raise OSError(28, "inotify watch limit reached")
+
+    def unschedule_all(self):
+        pass
+
+
+def test_watcher_polls_without_inotify(tmp_path, monkeypatch):
+    """Polling takes over when inotify can't be used, or isn't wanted."""
+    monkeypatch.setattr(library_watcher, "Observer", FailingObserver)
+    index_obj = IndexingInterface(conn_str=f"sqlite:///{tmp_path / 'index.db'}")
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    for force_polling in (False, True):
+        indexed = []
+        watcher = LibraryWatcher(
+            index_obj,
+            audio_dir,
+            {"wav"},
+            stable_seconds=0.1,
+            poll_interval=0.1,
+            force_polling=force_polling,
+            on_indexed=indexed.extend,
+        )
+        watcher.start()
+        assert watcher.wait_until_watching(timeout=5)
+        assert not watcher.uses_inotify
+        new_file = audio_dir / f"polled-{force_polling}.wav"
+        new_file.write_bytes(b"RIFF")
+        for _ in range(50):
+            if indexed:
+                break
+            sleep(0.1)
+        watcher.stop()
+        assert indexed == [str(new_file)]
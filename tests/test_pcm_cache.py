@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import numpy as np
+
+from backend import pcm_cache
+from backend.pcm_cache import PCMCache
+
+
+def test_decoded_once(tmp_path, monkeypatch):
+    """A key is decoded once however it is asked for, and leaves no temp files."""
+    (tmp_path / "crashed.0123.tmp").write_bytes(b"half a decode")
+    decodes = []
+    release = threading.Event()
+
+    def load_audio(audio_path):
+        decodes.append(audio_path)
+        release.wait()
+        return np.zeros(16000, dtype=np.float32)
+
+    monkeypatch.setattr(pcm_cache, "load_audio", load_audio)
+    cache = PCMCache(tmp_path, max_size=1024 * 1024, decoders=2)
+    assert not list(tmp_path.glob("*.tmp"))
+
+    async def get_twice():
+        cache.prefetch("abc", tmp_path / "memo.wav")
+        waiting = asyncio.ensure_future(cache.get("abc", tmp_path / "memo.wav"))
+        await asyncio.sleep(0.05)
+        release.set()
+        first = await waiting
+        return first, await cache.get("abc", tmp_path / "memo.wav")
+
+    first, second = asyncio.run(get_twice())
+    cache.shutdown()
+    assert first == second == tmp_path / "abc.npy"
+    assert len(decodes) == 1
+    assert len(PCMCache.load(first)) == 16000
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,96 @@
+import asyncio
+from pytest import raises
+
+from backend.scheduler import TaskScheduler
+
+
+def test_shortest_job_first():
+    scheduler = TaskScheduler(aging_rate=10)
+    scheduler.put_nowait("three hours", duration=3 * 60 * 60, queued_at=0)
+    scheduler.put_nowait("memo", duration=30, queued_at=1)
+    scheduler.put_nowait("urgent", duration=600, priority=1, queued_at=2)
+
+    assert [scheduler.get_nowait() for _ in range(3)] == [
+        "urgent",
+        "memo",
+        "three hours",
+    ]
+    with raises(asyncio.QueueEmpty):
+        scheduler.get_nowait()
+
+
+def test_aging():
+    """A long task that has been waiting long enough goes before new short ones."""
+    scheduler = TaskScheduler(aging_rate=10)
+    scheduler.put_nowait("long", duration=1000, queued_at=0)
+    scheduler.put_nowait("short, right after", duration=10, queued_at=1)
+    scheduler.put_nowait("short, much later", duration=10, queued_at=200)
+
+    assert [scheduler.get_nowait() for _ in range(3)] == [
+        "short, right after",
+        "long",
+        "short, much later",
+    ]
+
+
+def test_fair_between_clients():
+    scheduler = TaskScheduler(aging_rate=10)
+    for index in range(5):
+        scheduler.put_nowait(f"busy {index}", duration=60, client="busy", queued_at=0)
+    scheduler.put_nowait("other", duration=60, client="other", queued_at=1)
+
+    order = [scheduler.get_nowait() for _ in range(6)]
+    assert order.index("other") == 1
+
+
+def test_remove_and_estimates():
+    scheduler = TaskScheduler()
+    scheduler.put_nowait("one", duration=10, queued_at=0)
+    scheduler.put_nowait("two", duration=20, queued_at=0)
+    scheduler.put_nowait("three", duration=30, queued_at=0)
+
+    assert scheduler.remove("two")
+    assert not scheduler.remove("two")
+    assert scheduler.qsize() == 2
+    assert scheduler.queued_duration() == 40
+    assert scheduler.estimates(workers=1, seconds_per_second=0.5) == {
+        "one": (0, 0.0),
+        "three": (1, 5.0),
+    }
+
+
+def test_get_waits_for_put():
+    async def consume():
+        scheduler = TaskScheduler()
+        getter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+        # a cancelled get doesn't lose the task
+        with raises(TimeoutError):
+            await asyncio.wait_for(scheduler.get(), timeout=0.01)
+        scheduler.put_nowait("task", duration=1)
+        return await getter
+
+    assert asyncio.run(consume()) == "task"
+
+
+def test_take_leaves_the_rest_queued():
+    async def take():
+        scheduler = TaskScheduler()
+        scheduler.put_nowait("long", duration=600, queued_at=0)
+        scheduler.put_nowait("short", duration=10, queued_at=1)
+
+        def is_short(task_id: str) -> bool:
+            return task_id.startswith("short")
+
+        assert scheduler.take_nowait(is_short) == "short"
+        assert scheduler.take_nowait(is_short) is None
+        assert "long" in scheduler
+
+        waiter = asyncio.create_task(scheduler.wait_for_put())
+        await asyncio.sleep(0)
+        scheduler.put_nowait("short again", duration=5)
+        await asyncio.wait_for(waiter, timeout=1)
+        # waiting doesn't take anything
+        return [scheduler.get_nowait() for _ in range(scheduler.qsize())]
+
+    assert asyncio.run(take()) == ["long", "short again"]
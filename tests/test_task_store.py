@@ -0,0 +1,31 @@
+from time import time
+
+from backend.task_store import TaskStore
+
+
+def test_task_store_round_trip(tmp_path):
+    store = TaskStore(tmp_path / "tasks.db")
+    store.save("one", {"state": "queued", "filename": "one.wav"})
+    store.save(
+        "one",
+        {"state": "completed", "filename": "one.wav"},
+        {"text": "hello", "segments": []},
+    )
+    # updating the task again keeps the stored transcription
+    store.save("one", {"state": "completed", "filename": "renamed.wav"})
+
+    reopened = TaskStore(tmp_path / "tasks.db")
+    assert reopened.load_all() == {
+        "one": {"state": "completed", "filename": "renamed.wav"}
+    }
+    assert reopened.load_transcription("one") == {"text": "hello", "segments": []}
+    assert reopened.load_transcription("missing") is None
+
+
+def test_task_store_purge(tmp_path):
+    store = TaskStore(tmp_path / "tasks.db")
+    store.save("done", {"state": "completed"})
+    store.save("waiting", {"state": "queued"})
+
+    assert store.purge(time() + 1, ["completed", "failed"]) == ["done"]
+    assert list(store.load_all()) == ["waiting"]
@@ -0,0 +1,26 @@
+import asyncio
+from frontend.transcoder import Transcoder
+
+
+def test_transcode_to_compact_audio(example_file):
+    """The 44.1kHz stereo wav is shrunk, and the transcoded copy cleaned up after."""
+
+    async def prepare():
+        async with Transcoder("flac").prepared(example_file) as upload_path:
+            return upload_path, upload_path.stat().st_size
+
+    upload_path, size = asyncio.run(prepare())
+    assert upload_path.suffix == ".flac"
+    assert size < example_file.stat().st_size / 4
+    assert not upload_path.exists()
+
+
+def test_unreadable_file_is_sent_as_is(tmp_path):
+    not_media = tmp_path / "notes.mp3"
+    not_media.write_text("not actually audio")
+
+    async def prepare():
+        async with Transcoder("flac").prepared(not_media) as upload_path:
+            return upload_path
+
+    assert asyncio.run(prepare()) == not_media
@@ -0,0 +1,48 @@
+import json
+
+from frontend.transcript_writer import format_timestamp, write_transcripts
+
+TRANSCRIPTION = {
+    "text": " So I propose. Break, and --> then\tsome. Brake! Done",
+    "segments": [
+        {"start": 0.0, "end": 2.5, "text": " So I propose. Break,"},
+        {"start": 2.5, "end": 3661.0004, "text": " and --> then\tsome. Brake!"},
+        {"start": 3661.0004, "end": 3662.0, "text": " ... Done"},
+    ],
+}
+
+
+def test_format_timestamp():
+    assert format_timestamp(3661.0004) == "01:01:01.000"
+    assert format_timestamp(2.5) == "00:02.500"
+    assert format_timestamp(2.5, always_include_hours=True, decimal_marker=",") == (
+        "00:00:02,500"
+    )
+
+
+def test_write_transcripts(tmp_path):
+    media_file = tmp_path / "recording.wav"
+    written = write_transcripts(TRANSCRIPTION, media_file)
+
+    assert set(written) == {"txt", "vtt", "srt", "tsv", "json"}
+    # a break eats what follows it, even in the next segment
+    assert written["txt"].read_text() == "So I propose. \nand --> then\tsome. \nDone "
+    assert written["vtt"].read_text() == (
+        "WEBVTT\n\n"
+        "00:00.000 --> 00:02.500\nSo I propose. Break,\n\n"
+        "00:02.500 --> 01:01:01.000\nand -> then\tsome. Brake!\n\n"
+        "01:01:01.000 --> 01:01:02.000\n... Done\n\n"
+    )
+    assert (
+        written["srt"]
+        .read_text()
+        .startswith("1\n00:00:00,000 --> 00:00:02,500\nSo I propose. Break,\n\n2\n")
+    )
+    assert written["tsv"].read_text().splitlines()[2] == (
+        "2500\t3661000\tand --> then some. Brake!"
+    )
+    assert json.loads(written["json"].read_text()) == TRANSCRIPTION
+    # nothing is left behind from writing them atomically
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        path.name for path in written.values()
+    )
@@ -0,0 +1,41 @@
+from backend.transcription_cache import TranscriptionCache
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = TranscriptionCache(tmp_path, max_size=1024 * 1024)
+    key = TranscriptionCache.make_key("abc", "medium.en", {})
+
+    assert cache.get(key) is None
+    cache.put(key, {"text": "hello", "segments": []})
+    assert cache.get(key) == {"text": "hello", "segments": []}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # a different model or decode options must not share the entry
+    assert TranscriptionCache.make_key("abc", "tiny.en", {}) != key
+    assert TranscriptionCache.make_key("abc", "medium.en", {"language": "en"}) != key
+
+
+def test_cache_persistence(tmp_path):
+    key = TranscriptionCache.make_key("abc", "medium.en", {})
+    TranscriptionCache(tmp_path, max_size=1024 * 1024).put(key, {"text": "hello"})
+    assert TranscriptionCache(tmp_path, max_size=1024 * 1024).get(key) == {
+        "text": "hello"
+    }
+
+
+def test_cache_lru_eviction(tmp_path):
+    transcription = {"text": "x" * 100}
+    cache = TranscriptionCache(tmp_path, max_size=250)
+    keys = [TranscriptionCache.make_key(str(i), "medium.en", {}) for i in range(3)]
+
+    cache.put(keys[0], transcription)
+    cache.put(keys[1], transcription)
+    # touch the first entry so the second one is the least recently used
+    cache.get(keys[0])
+    cache.put(keys[2], transcription)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == transcription
+    assert cache.get(keys[2]) == transcription
+    assert cache.stats()["size"] <= 250
@@ -0,0 +1,43 @@
+from time import time
+import hashlib
+from pytest import raises
+
+from backend.upload_sessions import UploadError, UploadSessions
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_resumable_upload(tmp_path):
+    data = bytes(range(256)) * 100
+    sessions = UploadSessions(tmp_path / "partial")
+    upload_id = sessions.create("recording.wav", len(data), "tiny.en")
+
+    assert sessions.write(upload_id, 0, data[:1000], sha256(data[:1000])) == 1000
+    # a corrupted chunk is refused, and nothing is written
+    with raises(UploadError):
+        sessions.write(upload_id, 1000, data[1000:2000], sha256(b"something else"))
+    # so is a chunk that was already received
+    with raises(UploadError) as exc_info:
+        sessions.write(upload_id, 0, data[:1000], sha256(data[:1000]))
+    assert exc_info.value.offset == 1000
+    with raises(UploadError):
+        sessions.finish(upload_id, tmp_path / "recording.wav")
+
+    # resumed by a restarted server, which has to hash the first chunk again
+    sessions = UploadSessions(tmp_path / "partial")
+    assert sessions.info(upload_id)["offset"] == 1000
+    sessions.write(upload_id, 1000, data[1000:], sha256(data[1000:]))
+    assert sessions.finish(upload_id, tmp_path / "recording.wav") == sha256(data)
+    assert (tmp_path / "recording.wav").read_bytes() == data
+    assert sessions.info(upload_id) is None
+    assert not list((tmp_path / "partial").iterdir())
+
+
+def test_purge_uploads(tmp_path):
+    sessions = UploadSessions(tmp_path)
+    upload_id = sessions.create("recording.wav", 10, "tiny.en")
+    assert sessions.purge(time() - 60) == []
+    assert sessions.purge(time() + 1) == [upload_id]
+    assert not list(tmp_path.iterdir())
@@ -1,4 +1,9 @@
+import numpy as np
+import torch
+import whisper
+
 from conftest import get_md5sum
+from backend.whisper_interface import ModelRegistry, SegmentWriter, WhisperInterface
 
 
 def test_whisper_interface(whisper_interface, whisper_transcribed, transcribed_file):
@@ -15,3 +20,65 @@ def test_multiple_transcriptions(whisper_interface, example_file):
             get_md5sum(whisper_interface.transcribe(example_file).get("text").strip())
         )
     assert all(multiple_files[0] == file for file in multiple_files)
+
+
+def test_streamed_segments(whisper_interface, example_file):
+    """Streaming segments doesn't change the result."""
+    streamed = []
+    result = whisper_interface.transcribe(example_file, on_segment=streamed.append)
+    assert [segment["text"] for segment in streamed] == [
+        segment["text"] for segment in result["segments"]
+    ]
+    assert result == whisper_interface.transcribe(example_file)
+
+
+def test_segment_writer():
+    streamed = []
+    writer = SegmentWriter(streamed.append)
+    writer.write("Detected language: English\n[00:01.000 --> 00:0")
+    writer.write("4.500]  Hello there\n[01:02:03.000 --> 01:02:05.250]  Bye\n")
+    assert streamed == [
+        {"id": 0, "start": 1.0, "end": 4.5, "text": " Hello there"},
+        {"id": 1, "start": 3723.0, "end": 3725.25, "text": " Bye"},
+    ]
+
+
+def test_model_registry_budget():
+    """Models are only loaded on use, and the registry stays within its budget."""
+    medium_size = WhisperInterface("medium.en").memory_size
+    registry = ModelRegistry(memory_budget=medium_size)
+
+    tiny = registry.get("tiny.en")
+    assert not tiny.is_loaded
+    assert registry.get("tiny.en") is tiny
+
+    registry.get("medium.en")
+    # tiny.en was evicted to make room for medium.en
+    assert registry.get("tiny.en") is not tiny
+
+
+def test_batch_on_english_only_model():
+    """Batches decode on English-only models, which have no language tokens."""
+    torch.manual_seed(0)
+    wsp = WhisperInterface("tiny.en")
+    # an untrained model of the same shape as the .en ones, nothing is downloaded
+    wsp._loaded_model = whisper.model.Whisper(
+        whisper.model.ModelDimensions(
+            n_mels=80,
+            n_audio_ctx=1500,
+            n_audio_state=64,
+            n_audio_head=1,
+            n_audio_layer=1,
+            n_vocab=51864,
+            n_text_ctx=448,
+            n_text_state=64,
+            n_text_head=1,
+            n_text_layer=1,
+        )
+    )
+    assert not wsp._model.is_multilingual
+
+    audios = [np.zeros(16000 * seconds, dtype=np.float32) for seconds in (2, 5)]
+    transcriptions = wsp.transcribe_batch(audios)
+    assert len(transcriptions) == 2
+    assert all(transcription["language"] == "en" for transcription in transcriptions)